@@ -0,0 +1,244 @@
+"""
+Measures how fast the driver runs without a display
+
+Usage: python3 benchmark.py [video file] [flags]
+    -f, --frames: The number of frames to run for (default 300)
+    -b, --body: Also run the body module
+    -s, --startup: Measure import time and memory use at startup instead of throughput
+    -l, --live: Stream the board to this many local viewers (default 32), comparing the cost against one viewer
+    -k, --strokes: Check stroke simplification against a session saved with main.py -k (default strokes.npz)
+    -m, --mapped: Time reopening boards of different sizes kept in memory mapped files
+    -w, --window: Time showing frames in the pygame window, the way it was done before and after the single resize
+If no video file is given, assets/TestImage.png is used as every camera frame
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import cv2
+import numpy as np
+
+from modules import manipulation
+from modules.buffers import pool
+from modules.canvasfile import CanvasFile
+from modules.driver import Driver
+from modules.sinks import NullSink
+from modules.sources import ImageSource, VideoFileSource
+from modules.stream import LiveStream
+from modules.strokes import compare_session
+
+
+def run_throughput(source, frames, modules, width=1000, height=500, sinks=None, on_open=None):
+    """
+    Runs the driver headless over a source, returning the frame count, total time and time spent rendering
+    on_open is called with the driver once its sinks have been opened
+    """
+    driver = Driver(modules=modules, width=width, height=height, source=source, sinks=sinks or [NullSink()])
+    background = np.zeros((height, width, 3), np.uint8)
+    background[:] = 255
+
+    start = time.perf_counter()
+    rendered = 0
+    render_time = 0
+    while rendered < frames and not driver.source_finished:
+        driver.calculate(width, height)
+        if rendered == 0 and on_open is not None:
+            on_open(driver)
+        render_start = time.perf_counter()
+        driver.render(pool.copy(background))
+        render_time += time.perf_counter() - render_start
+        rendered += 1
+    elapsed = time.perf_counter() - start
+    driver.kill()
+    return rendered, elapsed, render_time
+
+
+# Run in a fresh interpreter, printing the time taken and the peak resident memory in KiB
+startup_scripts = {
+    "import modules.driver": "import modules.driver",
+    "hands only session": (
+        "from modules.driver import Driver\n"
+        "from modules.sinks import NullSink\n"
+        "from modules.sources import ImageSource\n"
+        "driver = Driver(modules=['hands'], source=ImageSource(['assets/TestImage.png']), sinks=[NullSink()])\n"
+        "driver.calculate(1000, 500)\n"
+        "driver.render(driver.camera_frame)\n"
+    )
+}
+
+
+def measure_script(script):
+    """Runs some code in a new interpreter, returning the seconds it took and its peak memory in MiB"""
+    wrapped = (
+        "import resource, time\n"
+        "start = time.perf_counter()\n"
+        + script +
+        "\nprint(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    output = subprocess.run([sys.executable, "-c", wrapped], capture_output=True, text=True, check=True).stdout
+    seconds, kilobytes = output.split()[-2:]
+    return float(seconds), int(kilobytes) / 1024
+
+
+def read_stream(url, received, stop):
+    """A viewer which reads an MJPEG stream as fast as it can, counting the bytes"""
+    with urllib.request.urlopen(url) as response:
+        while not stop.is_set():
+            data = response.read(65536)
+            if not data:
+                break
+            received.append(len(data))
+
+
+def run_live(viewers, frames, modules):
+    """Runs the driver with a LiveStream and a number of viewers, returning the render time and frames encoded"""
+    stream = LiveStream(host="127.0.0.1", port=0)
+    received = []
+    stop = threading.Event()
+
+    def connect_viewers(driver):
+        for _ in range(viewers):
+            url = f"http://127.0.0.1:{stream.port}/stream.mjpg"
+            threading.Thread(target=read_stream, args=(url, received, stop), daemon=True).start()
+        # Wait for everyone to connect before timing
+        while stream.viewers < viewers:
+            time.sleep(0.01)
+
+    source = ImageSource(["assets/TestImage.png"], frames=frames)
+    count, seconds, render_seconds = run_throughput(source, frames, modules, sinks=[stream], on_open=connect_viewers)
+    stop.set()
+    return count, render_seconds, stream.encoded, sum(received)
+
+
+def measure_mapped(shape):
+    """Makes a board of a shape in a memory mapped file, then times reopening it and reading a screen's worth of it"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "board.canvas")
+        board = CanvasFile(path, shape, background=None)
+        board.canvas[:500, :1000] = 255
+        board.changed()
+        board.close()
+        start = time.perf_counter()
+        board = CanvasFile(path, shape)
+        opened = time.perf_counter() - start
+        np.array(board.canvas[shape[0] // 2:shape[0] // 2 + 500, shape[1] // 2:shape[1] // 2 + 1000])
+        read = time.perf_counter() - start - opened
+        board.close()
+    return opened, read
+
+
+def measure_display(frames, output_size=(1000, 562)):
+    """
+    Times showing a 720p camera frame in a pygame window (with a dummy display if there is no screen), the way it was
+    done before (resizing to 1000 px wide, flipping, resizing again, and copying to bytes for pygame) and now (one
+    resize which also flips, uploaded without copying). Returns the milliseconds per frame for each
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    screen = pygame.display.set_mode((output_size[0] + 40, output_size[1] + 40))
+    frame = cv2.resize(cv2.imread("assets/TestImage.png"), (1280, 720))
+
+    def show_before():
+        resized = cv2.resize(frame, (1000, round(1000 * frame.shape[0] / frame.shape[1])))
+        resized = cv2.flip(resized, 1)
+        resized = cv2.resize(resized, output_size, interpolation=cv2.INTER_AREA)
+        shown = manipulation.round_corners(resized, 25)
+        screen.blit(pygame.image.frombuffer(shown.tobytes(), shown.shape[1::-1], "BGR"), (20, 20))
+        pygame.display.update()
+
+    def show_after():
+        shown = manipulation.round_corners(manipulation.resize_and_flip(frame, output_size, True), 25)
+        screen.blit(pygame.image.frombuffer(shown, shown.shape[1::-1], "BGR"), (20, 20))
+        pygame.display.update()
+
+    times = []
+    for show in (show_before, show_after):
+        start = time.perf_counter()
+        for _ in range(frames):
+            show()
+            pool.release()
+        times.append(1000 * (time.perf_counter() - start) / frames)
+    pygame.quit()
+    return times
+
+
+def measure_help():
+    """Times how long python3 main.py --help takes, including starting the interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--help"], stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flags = {"-f": "--frames", "-b": "--body", "-s": "--startup", "-l": "--live", "-k": "--strokes", "-m": "--mapped",
+             "-w": "--window"}
+    args = [flags[arg] if arg in flags else arg for arg in args]
+
+    if "--startup" in args:
+        print(f"main.py --help: {measure_help():.3f}s")
+        for name, code in startup_scripts.items():
+            seconds, memory = measure_script(code)
+            print(f"{name}: {seconds:.3f}s, {memory:.1f} MiB peak")
+        sys.exit()
+
+    if "--strokes" in args:
+        index = args.index("--strokes")
+        session = args[index + 1] if index + 1 < len(args) and not args[index + 1].startswith("-") else "strokes.npz"
+        count, raw_bytes, compact_bytes, raw_serialized, compact_serialized, worst, mean = compare_session(session)
+        print(f"{count} strokes")
+        print(f"Memory: {raw_bytes / 1024:.1f} KiB as lists, {compact_bytes / 1024:.1f} KiB simplified "
+              f"({raw_bytes / max(compact_bytes, 1):.0f}x smaller)")
+        print(f"Serialized: {raw_serialized / 1024:.1f} KiB as text, {compact_serialized / 1024:.1f} KiB simplified "
+              f"({raw_serialized / max(compact_serialized, 1):.0f}x smaller)")
+        print(f"Pixels changed: {100 * mean:.2f}% on average, {100 * worst:.2f}% at worst")
+        sys.exit()
+
+    if "--mapped" in args:
+        # Reopening should take the same time however big the board is
+        for board_shape in ((500, 1000, 3), (4000, 8000, 3), (16000, 32000, 3)):
+            opened, read = measure_mapped(board_shape)
+            size = np.prod(board_shape) / 1024 / 1024
+            print(f"{board_shape[1]}x{board_shape[0]} ({size:.0f} MiB): opened in {1000 * opened:.2f}ms, "
+                  f"a screen read in {1000 * read:.2f}ms")
+        sys.exit()
+
+    frame_count = 300
+    if "--frames" in args:
+        frame_count = int(args[args.index("--frames") + 1])
+        del args[args.index("--frames"):args.index("--frames") + 2]
+
+    if "--window" in args:
+        before, after = measure_display(frame_count)
+        print(f"Display: {before:.2f}ms per frame before, {after:.2f}ms per frame after")
+        sys.exit()
+    modules = ["hands", "body"] if "--body" in args else ["hands"]
+
+    if "--live" in args:
+        index = args.index("--live")
+        viewer_count = int(args[index + 1]) if index + 1 < len(args) and args[index + 1].isdigit() else 32
+        # The cost to the whiteboard should be the same however many people are watching
+        for viewers in (1, viewer_count):
+            count, render_seconds, encoded, received = run_live(viewers, frame_count, modules)
+            print(
+                f"{viewers} viewers: {1000 * render_seconds / max(count, 1):.2f}ms per frame to render, "
+                f"{encoded} frames encoded, {received / 1024 / 1024:.1f} MiB sent"
+            )
+        sys.exit()
+    paths = [arg for arg in args if not arg.startswith("-")]
+
+    if paths:
+        frame_source = VideoFileSource(paths[0])
+    else:
+        frame_source = ImageSource(["assets/TestImage.png"], frames=frame_count)
+
+    count, seconds, render_seconds = run_throughput(frame_source, frame_count, modules)
+    print(f"Rendered {count} frames in {seconds:.2f}s ({count / seconds:.1f} fps)")
+    print(f"Display pipeline: {1000 * render_seconds / max(count, 1):.2f}ms per frame")
+    print(f"Buffers allocated by the frame pool: {pool.allocations}")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+\033[34mMeasures the lens distortion of the webcam, so drawn strokes come out straight\033[0m
+
+Print assets/codes/charuco.png (make it with -b), then hold it in front of the camera at lots of different angles
+and distances. A view is captured every second while enough of the board is visible. Press q to finish early
+
+Flags:
+    \033[32m-b, --board: Save the calibration board to assets/codes/charuco.png, then exit
+    \033[32m-n, --views: How many views to capture (default 25)
+    \033[32m-c, --camera: The camera to calibrate (default 0)
+    \033[31m-h, --help: Show help\033[0m
+"""
+
+import sys
+
+# Find command arguments
+args = sys.argv[1:]
+flags = {"-b": "--board", "-n": "--views", "-c": "--camera", "-h": "--help"}
+# Create a list of flags that are set, in their long form
+flags = [flags[arg] if arg in flags else arg for arg in args]
+
+if "--help" in flags:
+    print("Usage: python3 calibrate_lens.py [flags]\n\n" + __doc__)
+    sys.exit()
+
+import time
+
+import cv2
+import numpy as np
+
+from modules.calibration import LensCalibration
+from modules.screenspace import aruco_dict
+from modules.sources import CameraSource
+
+
+def flag_value(name, default):
+    """Gets the value given after a flag, such as -n 30"""
+    if name in flags and flags.index(name) + 1 < len(flags):
+        return int(flags[flags.index(name) + 1])
+    return default
+
+
+# The board uses markers from 100 onwards, so it can't be mistaken for the whiteboard corners or the stylus
+squares = (7, 5)
+board = cv2.aruco.CharucoBoard(
+    squares, 0.04, 0.03, aruco_dict, np.arange(100, 100 + (squares[0] * squares[1]) // 2)
+)
+
+if "--board" in flags:
+    cv2.imwrite("assets/codes/charuco.png", board.generateImage((1400, 1000), marginSize=40))
+    print("Saved assets/codes/charuco.png")
+    sys.exit()
+
+views = flag_value("--views", 25)
+camera_id = flag_value("--camera", 0)
+detector = cv2.aruco.CharucoDetector(board)
+source = CameraSource(camera_id)
+
+object_points = []
+image_points = []
+frame_shape = None
+last_capture = 0
+
+while len(object_points) < views:
+    frame = source.read()
+    if frame is None:
+        continue
+    frame_shape = frame.shape
+    charuco_corners, charuco_ids, marker_corners, marker_ids = detector.detectBoard(frame)
+    preview = frame.copy()
+    # At least 8 corners are needed for a useful view
+    if charuco_ids is not None and len(charuco_ids) >= 8:
+        cv2.aruco.drawDetectedCornersCharuco(preview, charuco_corners, charuco_ids)
+        if time.perf_counter() - last_capture > 1:
+            points, image = board.matchImagePoints(charuco_corners, charuco_ids)
+            object_points.append(points)
+            image_points.append(image)
+            last_capture = time.perf_counter()
+            # Flash the preview so it's clear a view was taken
+            preview = cv2.bitwise_not(preview)
+    cv2.putText(preview, f"{len(object_points)}/{views}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.imshow("Lens calibration", preview)
+    if cv2.waitKey(1) & 0xFF == ord("q"):
+        break
+
+source.stop()
+cv2.destroyAllWindows()
+
+if len(object_points) < 5:
+    print("Not enough views were captured to calibrate the camera")
+    sys.exit(1)
+
+error, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+    object_points, image_points, (frame_shape[1], frame_shape[0]), None, None
+)
+LensCalibration(camera_matrix, dist_coeffs, frame_shape).save(camera_id, error=error)
+print(f"Calibrated from {len(object_points)} views, with an error of {error:.3f} pixels")
+print(f"Saved to {LensCalibration.path(camera_id)}")
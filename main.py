@@ -7,68 +7,128 @@ Flags:
     \033[32m-m, --monitor: Use the monitor as a display, rather than physical codes
     \033[32m-H, --horizontal: Flip the output horizontally
     \033[32m-V, --vertical: Flip the output vertically
+    \033[32m-p, --processes: Run hand detection in a separate process
+    \033[32m-s, --stylus-server: Serve the phone stylus page on port 8765, and take pen up/down from its touches
+    \033[32m-c, --static-camera: Save the board's position, and only look for it again if it seems to have moved
+    \033[32m-u, --undistort: Straighten the camera feed shown, as well as the points used to draw (see calibrate_lens.py)
+    \033[32m-r, --record: Record the session to recording.mp4
+    \033[32m-R, --record-board: Record just the board (without the camera feed) to board.mp4
+    \033[32m-l, --live: Stream the board live at http://<this computer's address>:8080/
+    \033[32m-S, --share: Share frames with other programs through shared memory (see modules/sharedframes.py)
+    \033[32m-i, --no-idle: Keep running at full speed when nothing is happening
+    \033[32m-f, --fps: Lower quality as needed to keep to this frame rate, e.g. -f 20
+    \033[32m-k, --keep-strokes: Save every stroke's raw points to strokes.npz, to check simplification (see benchmark.py)
+    \033[32m-e, --event-log: Log every change to the board to board.wbl, and carry on from it when restarted
+    \033[32m-M, --mapped-board: Keep the board in board.canvas, mapped into memory, so it survives a crash
+    \033[32m-z, --zoom: Draw on a board twice as big each way, zoomed with +/- (0 resets) and panned with the arrow keys
+    \033[32m-b, --boards: Draw on this many boards in view, e.g. -b 2. The first has markers 0-3, then 6-9, 10-13...
     \033[33m-d, --debug: Show debug information
     \033[31m-h, --help: Show help\033[0m
 """
 
 import sys
-import cv2
-import numpy as np
-from modules.driver import Driver
-from modules.hands import (Fist, HandModel, IndexFinger, MiddleFinger, Peace,
-                           PinkyFinger, RingFinger, Spread, hand_to_name, get_extended_fingers)
-
-from modules.login import login
-
-uid = login()
-if uid is None:
-    print("Login failed")
-    sys.exit()
-
 
 # Find command arguments
 args = sys.argv[1:]
 flags = {
-    "-m": "--monitor", "-H": "--horizontal", "-V": "--vertical", "-d": "--debug", "-h": "--help"
+    "-m": "--monitor", "-H": "--horizontal", "-V": "--vertical", "-p": "--processes", "-s": "--stylus-server",
+    "-c": "--static-camera", "-u": "--undistort", "-r": "--record", "-R": "--record-board", "-l": "--live",
+    "-S": "--share", "-i": "--no-idle", "-f": "--fps", "-k": "--keep-strokes", "-e": "--event-log",
+    "-M": "--mapped-board", "-z": "--zoom", "-b": "--boards", "-d": "--debug",
+    "-h": "--help"
 }
 # Create a list of flags that are set, in their long form
 flags = [flags[arg] if arg in flags else arg for arg in args]
 
+# Help is checked before anything else is imported, so it shows instantly
 if "--help" in flags:
     print("Usage: python3 main.py [flags]\n\n" + __doc__)
     sys.exit()
 
+import time
+
+import cv2
+import numpy as np
+from modules.board import Board, actions, gesture_tracker
+from modules.buffers import pool
+from modules.canvasfile import CanvasFile
+from modules.colours import Colours
+from modules.calibration import LensCalibration, StaticCalibration
+from modules.driver import Driver
+from modules.eventlog import EventLog
+from modules.idle import IdleGovernor
+
+from modules.login import login
+from modules.pen import PenEventServer
+from modules.quality import QualityGovernor
+from modules.recording import Recorder
+from modules.sharedframes import FramePublisher
+from modules.startup import Warmup
+from modules.stream import LiveStream
+from modules.strokes import StrokeStore
+from modules.workers import InferenceWorker
+
+# Worker processes are forked before any threads start or the window opens, so each starts from a clean copy
+workers = {"hands": InferenceWorker("hands")} if "--processes" in flags else {}
+
+# Open the camera and load the models while the user is logging in
+# When using processes, the models are loaded by the worker processes instead
+warmup = Warmup(modules=[] if "--processes" in flags else ["hands"])
+
+uid = login()
+if uid is None:
+    print("Login failed")
+    warmup.cancel()
+    for worker in workers.values():
+        worker.stop()
+    sys.exit()
+logged_in_at = time.perf_counter()
 
-MAX_HANDS = 2
 
 width = 200  # Camera width
 height = 100  # Camera height
 scale = 5  # Scale the output by this amount
 width, height = width * scale, height * scale  # Adjust the width and height to the scale
+# The size of the drawing. Only part of it is shown when zoomed in
+canvas_width, canvas_height = (width * 2, height * 2) if "--zoom" in flags else (width, height)
+# Every board in view is found in the same pass, and has its own drawing
+board_count = int(flags[flags.index("--boards") + 1]) if "--boards" in flags else 1
+
+pen_server = None
+if "--stylus-server" in flags:
+    pen_server = PenEventServer().start()
+    print(f"Open http://<this computer's address>:{pen_server.port}/ on the phone used as the stylus")
+
+quality_governor = None
+if "--fps" in flags:
+    quality_governor = QualityGovernor(target_fps=float(flags[flags.index("--fps") + 1]))
 
 driver = Driver(debug=("--debug" in flags), modules=["hands"],
-                flip_horizontal=("--horizontal" in flags), flip_vertical=("--vertical" in flags), height=height, width=width)
-
-
-class Colours:
-    """A list of colours the program can use at any point"""
-    red: tuple = driver.hex_to_bgr("#F27878")
-    green: tuple = driver.hex_to_bgr("#A1CC65")
-    blue: tuple = driver.hex_to_bgr("#6576CC")
-    yellow: tuple = driver.hex_to_bgr("#E6DC71")
-    cyan: tuple = driver.hex_to_bgr("#71AEF5")
-    magenta: tuple = driver.hex_to_bgr("#A358B3")
-    white: tuple = driver.hex_to_bgr("#FFFFFF")
-    black: tuple = driver.hex_to_bgr("#020202")
-    transparent: tuple = driver.hex_to_bgr("#000000")
-
-# Defines which hand models refer to which tool
-actions = {
-    IndexFinger().name: "draw",
-    Peace().name: "line",
-    Spread().name: "erase",
-    MiddleFinger().name: "quit"
-}
+                flip_horizontal=("--horizontal" in flags), flip_vertical=("--vertical" in flags), height=height, width=width,
+                source=warmup.wait(), use_processes=("--processes" in flags),
+                pen_server=pen_server, calibration=StaticCalibration() if "--static-camera" in flags else None,
+                lens=LensCalibration.load(), undistort_display=("--undistort" in flags),
+                idle_governor=None if "--no-idle" in flags else IdleGovernor(), quality_governor=quality_governor,
+                stylus_hand_interval=3,
+                boards=board_count, workers=workers)
+if "--record" in flags:
+    driver.sinks.append(Recorder("recording.mp4"))
+if "--record-board" in flags:
+    driver.sinks.append(Recorder("board.mp4", board_only=True))
+live_stream = None
+if "--live" in flags:
+    live_stream = LiveStream()
+    driver.sinks.append(live_stream)
+if "--share" in flags:
+    driver.sinks.append(FramePublisher("whiteboard"))
+    driver.sinks.append(FramePublisher("whiteboard-board", board_only=True))
+# Each hand keeps its own ID (and so its own gesture and stroke) while it is on screen
+MAX_HANDS = driver.hand_tracker.max_ids
+# The camera already has a frame, so the window can be opened (and workers' buffers made) before the loop starts
+if warmup.first_frame is not None:
+    driver.open_sinks(warmup.first_frame.shape, width)
+    if driver.use_processes:
+        driver.start_workers(warmup.first_frame.shape)
 
 
 # Create a background
@@ -76,27 +136,30 @@ background_colour = Colours.white
 background = np.zeros((height, width, 3), np.uint8)
 background[:] = background_colour
 
-# This will be an overlay over the background
-current_drawing = np.zeros((height, width, 3), np.uint8)
-current_drawing[:] = background_colour
-
-# This is what the user is currently drawing, such as a line, and can be cleared
-# If the user draws a line, it will be added here as a "preview"
-current_motion = np.zeros((height, width, 3), np.uint8)
-current_motion[:] = Colours.transparent
-
-# This is the current path being drawn by a user.
-# It is temporarily stored here while the user is drawing, and is added to the current_drawing when they stop
-current_path = np.zeros((height, width, 3), np.uint8)
-current_path[:] = Colours.transparent
+# The drawing is only ever changed in place, so it can be kept in a file mapped into memory
+canvas_file = None
+if "--mapped-board" in flags:
+    canvas_file = CanvasFile("board.canvas", (canvas_height, canvas_width, 3), background_colour)
+    if canvas_file.was_dirty:
+        print("board.canvas wasn't saved properly last time, so the last few changes may be missing")
+# Every change to the board is logged, so the board can be picked up again after a crash
+event_log = EventLog("board.wbl") if "--event-log" in flags else None
+# Every finished stroke, simplified and stored as arrays
+strokes = StrokeStore(keep_raw=("--keep-strokes" in flags))
+
+# Every board is drawn on, undone and zoomed the same way. The first is the one saved, logged and streamed
+boards = [Board(
+    (width, height), (canvas_width, canvas_height), background_colour, MAX_HANDS,
+    canvas_file=canvas_file, event_log=event_log, strokes=strokes, live_stream=live_stream
+)] + [Board((width, height), None, background_colour, MAX_HANDS) for _ in range(board_count - 1)]
+for board in boards:
+    board.start()
+if "--zoom" in flags:
+    boards[0].viewport.pan((canvas_width - width) / 2, (canvas_height - height) / 2)
 
 # What the user is currently doing, such as draw, line, erase, etc.
 current_action = [None for _ in range(MAX_HANDS)]
-known_hands = [None for _ in range(MAX_HANDS)]
-previous_hands = [None for _ in range(MAX_HANDS)]
-
-undo_stack = [current_drawing.copy()]
-redo_stack = []
+gestures = gesture_tracker(MAX_HANDS)
 
 
 statuses = {
@@ -105,6 +168,8 @@ statuses = {
     "Accurate": [Colours.green, "", 5]
 }
 
+status_bars = {}  # Pre-rendered status bars, by status name
+
 current_overlay = None
 last_visibility = False
 
@@ -113,178 +178,80 @@ exit_flag = False
 if "--monitor" in flags or "-m" in flags:
     driver.use_monitor_display()
 
-current_paths = [{"pathType": None, "path": []} for _ in range(MAX_HANDS)]
 last_clicked = None
 
-render_current_path = False
-
 while not exit_flag:
-    current_frame = background.copy()
-    if current_overlay is None and driver.camera_frame is not None:
-        current_overlay = np.zeros((driver.camera_frame.shape[0], driver.camera_frame.shape[1], 3), np.uint8)
-
-    # Preprocessing
-    # Overlay the current drawing. Use black areas as a mask
-    for i in range(3):
-        current_frame[:, :, i] = np.where(current_drawing[:, :, i] == 0, current_frame[:, :, i], current_drawing[:, :, i])
-
     # Calculate new matrices
     driver.calculate(background.shape[1], background.shape[0])
+    # If nothing has moved (and no buttons are being pressed), the last frame can be shown again
+    if driver.idle and last_clicked is None and not driver.clicked:
+        driver.render(None)
+        continue
 
-    # Render the stylus
-    if driver.stylus_coords is not None:
-        cv2.circle(
-            current_drawing if driver.stylus_draw else current_overlay,
-            (round(driver.stylus_coords[0]), round(driver.stylus_coords[1])), 3, (255, 0, 255), -1
-        )
-    # If there are hands on screen
-    elif driver.screenspace_hand_points:
-        to_render = [4, 8, 12, 16, 20]  # Render a dot at the tip of each finger if in debug mode TODO
-
-        # Loop over each hand
-        for hand_index, hand_data in enumerate(driver.full_hand_landmarks):
-            # If it's None, skip it
-            if hand_data is None:
-                continue
-            # For each finger
-            raised = [finger > 0 for finger in get_extended_fingers(hand_data)]
-            hand_model = HandModel(raised)
-            hand_model.name = hand_to_name(raised)
-            if hand_index >= len(previous_hands) or hand_index >= len(known_hands):
+    if current_overlay is None and driver.camera_frame is not None:
+        current_overlay = np.zeros((driver.camera_frame.shape[0], driver.camera_frame.shape[1], 3), np.uint8)
+
+    # Recognise the gesture of every hand on screen at once, whenever hands were looked for
+    # While the stylus is being used, hands are only looked for every few frames, and only give commands
+    if driver.stylus_coords is None or driver.hands_updated:
+        for event in gestures.update_from_landmarks(driver.hand_landmark_array, driver.hand_ids):
+            if event.kind == "exit":
+                current_action[event.hand] = None
                 continue
-            if previous_hands[hand_index] is None:
-                previous_hands[hand_index] = [hand_model, hand_data, 0]
-            if previous_hands[hand_index][0].name == hand_model.name:
-                previous_hands[hand_index] = [hand_model, hand_data, previous_hands[hand_index][2] + 1]
-            else:
-                previous_hands[hand_index] = [hand_model, hand_data, 0]
-            if previous_hands[hand_index][2] > 10:
-                known_hands[hand_index] = previous_hands[hand_index][0]
-            else:
-                known_hands[hand_index] = None
+            current_action[event.hand] = actions.get(event.gesture, None)
+            if current_action[event.hand] == "quit":
+                exit_flag = True
 
+    # The buttons and zooming act on the board being used (the one the stylus or a hand was last on)
+    active_board = boards[driver.active_board]
     # Check if the user has released a button (last_clicked (old) vs driver.clicked (current))
     if last_clicked is not None and not driver.clicked:
         if last_clicked == "Undo":
-            # Remove the last item from the undo stack
-            # Add it to the redo stack
-            if len(undo_stack) > 1:
-                redo_stack.append(undo_stack.pop())
-            current_drawing = undo_stack[-1].copy()
+            active_board.undo()
         elif last_clicked == "Redo":
-            # Remove the last item from the redo stack
-            # Add it to the undo stack
-            if len(redo_stack) > 0:
-                undo_stack.append(redo_stack.pop())
-            current_drawing = undo_stack[-1].copy()
+            active_board.redo()
     last_clicked = driver.clicked
-    for hand_index, hand in enumerate(known_hands):
-        if hand is None:
-            continue
-        if len(driver.screenspace_hand_points) <= hand_index:
-            continue
-        match actions.get(hand_to_name(hand.value[:5]), None):
-            case "quit":
-                exit_flag = True
-            case "draw":
-                x = round(driver.screenspace_hand_points[hand_index][8][0])
-                y = round(driver.screenspace_hand_points[hand_index][8][1])
-                new_points = []
-                # cv2.circle(current_path, (x, y), driver.pen_size, getattr(Colours, driver.colour), -1)
-                # Find the distance between the last point and the current point
-                if len(current_paths[hand_index]["path"]) > 0:
-                    dist = np.sqrt((x - current_paths[hand_index]["path"][-1][0]) ** 2 + (y - current_paths[hand_index]["path"][-1][1]) ** 2)
-                    # Add x midpoints between the last point and the current point. The more midpoints, the smoother the line
-                    # The number of midpoints is the distance divided by the pen size
-                    for i in range(round(dist / driver.pen_size)):
-                        new_points.append((
-                            round(current_paths[hand_index]["path"][-1][0] + (x - current_paths[hand_index]["path"][-1][0]) / (i + 1)),
-                            round(current_paths[hand_index]["path"][-1][1] + (y - current_paths[hand_index]["path"][-1][1]) / (i + 1))
-                        ))
-                new_points.append((x, y))
-                current_paths[hand_index]["path"].extend(new_points)
-                for point in new_points:
-                    cv2.circle(current_path, point, driver.pen_size, getattr(Colours, driver.colour), -1)
-                current_paths[hand_index]["path"].append((x, y))
-                render_current_path = True
-            case "erase":
-                # If the eraser has only just been activated, set the current path to the current drawing
-                if current_paths[hand_index]["pathType"] is None:
-                    current_paths[hand_index]["pathType"] = "eraser"
-                    current_paths[hand_index]["path"] = []
-                    current_path = current_drawing.copy()
-                focus_about = [0, 8, 20]
-                eraser_size = driver.pen_size * 4
-                # Avoid list index out of range errors
-                if not len(driver.screenspace_hand_points) or True:
-                    for i in range(len(focus_about)):
-                        if focus_about[i] >= len(driver.screenspace_hand_points[hand_index]):
-                            focus_about[i] = len(driver.screenspace_hand_points[hand_index]) - 1
-
-                    x, y = round((driver.screenspace_hand_points[hand_index][focus_about[0]][0] + driver.screenspace_hand_points[hand_index][focus_about[1]][0] + driver.screenspace_hand_points[hand_index][focus_about[2]][0]) / 3),\
-                           round((driver.screenspace_hand_points[hand_index][focus_about[0]][1] + driver.screenspace_hand_points[hand_index][focus_about[1]][1] + driver.screenspace_hand_points[hand_index][focus_about[2]][1]) / 3)
-                    # cv2.circle(current_path, focus, eraser_size, Colours.white, -1)
-                    new_points = []
-                    # Find the distance between the last point and the current point
-                    if len(current_paths[hand_index]["path"]) > 0:
-                        dist = np.sqrt((x - current_paths[hand_index]["path"][-1][0]) ** 2 + (y - current_paths[hand_index]["path"][-1][1]) ** 2)
-                        # Add x midpoints between the last point and the current point. The more midpoints, the smoother the line
-                        # The number of midpoints is the distance divided by the pen size
-                        for i in range(round(dist / eraser_size)):
-                            new_points.append((
-                                round(current_paths[hand_index]["path"][-1][0] + (x - current_paths[hand_index]["path"][-1][0]) / (i + 1)),
-                                round(current_paths[hand_index]["path"][-1][1] + (y - current_paths[hand_index]["path"][-1][1]) / (i + 1))
-                            ))
-                    new_points.append((x, y))
-                    current_paths[hand_index]["path"].extend(new_points)
-                    for point in new_points:
-                        cv2.circle(current_path, point, eraser_size, Colours.white, -1)
-                    # Show an outline of the eraser on the current_motion
-                    # To do this, draw a filled circle, then draw a transparent circle over the top
-                    cv2.circle(current_motion, (x, y), eraser_size, Colours.magenta, -1)
-                    cv2.circle(current_motion, (x, y), eraser_size - 2, Colours.transparent, -1)
-                    current_paths[hand_index]["path"].append((x, y))
-                    render_current_path = True
-    if all([hand is None for hand in known_hands]):
-        if render_current_path:
-            # Add the current path to the current_drawing
-            current_drawing[:, :, :] = np.where(
-                current_path[:, :, :] == 0, current_drawing[:, :, :], current_path[:, :, :]
-            )
-            # Add the current drawing to the undo stack
-            undo_stack.append(current_drawing.copy())
-            current_path = np.zeros((height, width, 3), np.uint8)
-            current_path[:] = Colours.transparent
-            render_current_path = False
-            current_paths = [{"pathType": None, "path": []} for _ in range(MAX_HANDS)]
-
-    # Create a mask from the current_motion, where all non black pixels become white
-    mask = cv2.inRange(current_motion, Colours.transparent, Colours.transparent)
-    # Apply the mask to the current_frame, so white pixels on the mask make the current_frame black
-    current_frame = cv2.bitwise_and(current_frame, current_frame, mask=mask)
-
-    for i in range(3):
-        if render_current_path:
-            current_frame[:, :, i] = np.where(
-                current_path[:, :, i] == 0, current_frame[:, :, i], current_path[:, :, i]
-            )
-        current_frame[:, :, i] = np.where(
-            current_motion[:, :, i] == 0, current_frame[:, :, i], current_motion[:, :, i]
+    if "--zoom" in flags:
+        # The window changes it when keys are pressed
+        driver.viewport = active_board.viewport
+
+    # Each board only gets the hands (and the stylus) on it
+    board_frames = []
+    for index, board in enumerate(boards):
+        board.update(
+            current_action, driver.hand_points_by_id(index),
+            driver.stylus_coords if driver.stylus_board == index else None,
+            driver.stylus_draw, getattr(Colours, driver.colour), driver.pen_size
         )
-
-    # cv2.imshow("current_path", current_path)
-    current_motion[:] = Colours.transparent
+        board_frames.append(board.compose(pool.copy(background)))
 
     # Only update when the status has been the same for 10 frames
-    if ((driver.visibility_time > 3 and driver.visibility != last_visibility) or driver.visibility_time > 10) and current_overlay is not None:
-        last_visibility = driver.visibility
-        status_name = driver.visibility
+    markers = driver.boards[driver.active_board]
+    if ((markers.visibility_time > 3 and markers.visibility != last_visibility) or markers.visibility_time > 10) and current_overlay is not None:
+        last_visibility = markers.visibility
+        status_name = markers.visibility
         status = statuses[status_name]
         if status_name == "Accurate":
             current_overlay[:, :, :] = Colours.transparent
-        cv2.rectangle(current_overlay, (0, 0), (current_overlay.shape[1], status[2]), status[0], -1)
-        # Add text to the overlay, 20px high and white
-        cv2.putText(current_overlay, status[1], (20, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, Colours.white, 1, cv2.LINE_AA)
+        # Each status bar is only drawn once, then copied onto the overlay
+        if status_name not in status_bars:
+            status_bar = np.zeros((status[2], current_overlay.shape[1], 3), np.uint8)
+            status_bar[:] = status[0]
+            # Add text to the overlay, 20px high and white
+            cv2.putText(status_bar, status[1], (20, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, Colours.white, 1, cv2.LINE_AA)
+            status_bars[status_name] = status_bar
+        current_overlay[:status[2]] = status_bars[status_name]
         # cv2.imshow("current_overlay", current_overlay)
 
-    driver.render(current_frame, current_overlay)
+    driver.render(board_frames[0], current_overlay, board_frames[1:])
+    if driver.debug and driver.frame_number == 1:
+        print(f"First frame rendered {time.perf_counter() - logged_in_at:.3f}s after logging in")
+
+# Close the window, and finish writing any recordings
+driver.kill()
+for board in boards:
+    board.close()
+if driver.debug:
+    print(f"{len(strokes.strokes)} strokes stored in {strokes.nbytes() / 1024:.1f} KiB")
+if "--keep-strokes" in flags:
+    strokes.save_raw("strokes.npz")
@@ -0,0 +1,378 @@
+"""
+A board - the drawing, the strokes being drawn onto it by each hand and the stylus, and the undo history
+This is where hand gestures turn into changes to the drawing. It is used by main.py while drawing live, and by
+process_video.py to draw from a recorded video
+"""
+
+import cv2
+import numpy as np
+
+from modules import manipulation
+from modules.buffers import pool
+from modules.colours import Colours
+from modules.eventlog import stylus_path_id
+from modules.gestures import GestureTracker
+from modules.hands import IndexFinger, MiddleFinger, Peace, Spread
+from modules.strokes import StrokeStore
+from modules.viewport import MipPyramid, Viewport
+
+# Defines which hand models refer to which tool
+actions = {
+    IndexFinger().name: "draw",
+    Peace().name: "line",
+    Spread().name: "erase",
+    MiddleFinger().name: "quit"
+}
+# Actions which draw, which the stylus takes over from while it is in view
+drawing_actions = {"draw", "line", "erase"}
+
+
+def gesture_tracker(max_hands):
+    """Only recognise a gesture when it has been held for more than 10 frames"""
+    return GestureTracker(max_hands=max_hands, enter_frames=11, exit_frames=1)
+
+
+def new_path(path_id):
+    """
+    A path for a hand (using its ID) or the stylus
+    Each path keeps only its last point (to join the next one to), while its points are simplified by its stroke
+    """
+    return {"id": path_id, "pathType": None, "path": [], "stroke": None}
+
+
+def interpolate_path(path, x, y, spacing):
+    """Finds points between the end of a path and (x, y), returning them. (x, y) becomes the end of the path"""
+    new_points = []
+    # Find the distance between the last point and the current point
+    if len(path) > 0:
+        dist = np.sqrt((x - path[-1][0]) ** 2 + (y - path[-1][1]) ** 2)
+        # Add x midpoints between the last point and the current point. The more midpoints, the smoother the line
+        # The number of midpoints is the distance divided by the spacing (usually the pen size)
+        for i in range(round(dist / spacing)):
+            new_points.append((
+                round(path[-1][0] + (x - path[-1][0]) / (i + 1)),
+                round(path[-1][1] + (y - path[-1][1]) / (i + 1))
+            ))
+    new_points.append((x, y))
+    path[:] = [(x, y)]
+    return new_points
+
+
+def union_bounds(first, second):
+    """The smallest (x1, y1, x2, y2) bounds covering two others, either of which can be None"""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return min(first[0], second[0]), min(first[1], second[1]), max(first[2], second[2]), max(first[3], second[3])
+
+
+class Board:
+    """
+    A drawing of canvas_size, shown at view_size through a viewport
+    The drawing is kept in canvas_file if one is given, every change is written to event_log if one is given, and
+    strokes are sent to live_stream as they are drawn if one is given. Call start() before using it
+    """
+    def __init__(self, view_size, canvas_size=None, background_colour=Colours.white, max_hands=8,
+                 canvas_file=None, event_log=None, strokes=None, live_stream=None):
+        self.view_size = view_size  # (width, height)
+        canvas_width, canvas_height = canvas_size or view_size
+        self.canvas_file = canvas_file
+        self.event_log = event_log
+        self.strokes = strokes if strokes is not None else StrokeStore()
+        self.live_stream = live_stream
+
+        # It is only ever changed in place, so it can be kept in a file mapped into memory
+        if canvas_file is not None:
+            self.current_drawing = canvas_file.canvas
+        else:
+            self.current_drawing = np.zeros((canvas_height, canvas_width, 3), np.uint8)
+            self.current_drawing[:] = background_colour
+
+        # Which part of the drawing is shown. Zoomed out views are drawn from smaller copies of it, kept in the pyramid
+        self.viewport = Viewport(view_size, (canvas_width, canvas_height), background=background_colour)
+        self.pyramid = MipPyramid(self.current_drawing)
+
+        # The layers drawn over the drawing (see current_motion and current_path) are only made once they are drawn on
+        self.layer_shape = (canvas_height, canvas_width, 3)
+        self._current_motion = None
+        self._current_path = None
+        # The area drawn on current_motion this frame, so only that is shown and cleared rather than the whole canvas
+        self.current_motion_bounds = None
+        # The area of the drawing the current path covers, as (x1, y1, x2, y2), so only that area of the pyramid is
+        # updated
+        self.current_path_bounds = None
+        self.render_current_path = False
+
+        self.max_hands = max_hands
+        self.current_paths = [new_path(i) for i in range(max_hands)]
+        # The stylus has its own path, so its strokes start and end independently of any hands
+        self.stylus_path = new_path(stylus_path_id)
+
+        # Each change is kept as the area it covered, before and after, as (bounds, before, after)
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def new_layer(self):
+        """
+        A transparent layer the size of the drawing. Transparent is black, and zeroed memory this size is only given
+        pages by the OS as they are drawn on, so it takes no time to make and only the areas drawn on use any RAM
+        """
+        return np.zeros(self.layer_shape, np.uint8)
+
+    @property
+    def current_motion(self):
+        """
+        This is what the user is currently drawing, such as a line, and can be cleared
+        If the user draws a line, it will be added here as a "preview"
+        """
+        if self._current_motion is None:
+            self._current_motion = self.new_layer()
+        return self._current_motion
+
+    @property
+    def current_path(self):
+        """
+        This is the current path being drawn by a user.
+        It is temporarily stored here while the user is drawing, and is added to the current_drawing when they stop
+        """
+        if self._current_path is None:
+            self._current_path = self.new_layer()
+        return self._current_path
+
+    def start(self):
+        """Picks the board up from its event log (if it has one), and starts the undo history"""
+        if self.event_log is not None:
+            recovered = self.event_log.start(self.current_drawing)
+            if recovered is not None:
+                np.copyto(self.current_drawing, recovered[0])
+                # A stroke which was being drawn when the last session stopped is finished off
+                if recovered[1] is not None:
+                    manipulation.paste_non_black(self.current_drawing, recovered[1])
+                    self.event_log.commit(self.current_drawing)
+                self.changed()
+        # Only the areas changed from here on are kept, so the drawing itself is never copied
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def changed(self, bounds=None):
+        """Called whenever the drawing changes, with the area it changed in (or None for all of it)"""
+        if self.canvas_file is not None:
+            self.canvas_file.changed()
+        self.pyramid.changed(bounds)
+
+    def area(self, bounds=None):
+        """Clips (x1, y1, x2, y2) bounds (or None for all of them) to the drawing, returning them and their slices"""
+        height, width = self.current_drawing.shape[:2]
+        if bounds is None:
+            bounds = (0, 0, width, height)
+        x1, y1 = min(max(bounds[0], 0), width), min(max(bounds[1], 0), height)
+        x2, y2 = min(max(bounds[2], x1), width), min(max(bounds[3], y1), height)
+        return (x1, y1, x2, y2), (slice(y1, y2), slice(x1, x2))
+
+    def show_motion(self, x, y, radius):
+        """Marks an area of current_motion as drawn on, around (x, y)"""
+        self.current_motion_bounds = union_bounds(
+            self.current_motion_bounds, (x - radius, y - radius, x + radius + 1, y + radius + 1)
+        )
+
+    def update(self, current_action, hand_points, stylus_coords, stylus_draw, colour, pen_size):
+        """
+        Draws this frame's changes: the stylus (if it is in view), and the action of each hand
+        hand_points are the points of each hand by its ID, and the stylus coordinates, both in view
+        current_action is the action of each hand, by its ID (see actions)
+        While the stylus is in view it does the drawing, so hands only give commands. Any stroke a hand was drawing
+        is ended and committed as soon as the stylus comes into view, rather than left hanging
+        """
+        if stylus_coords is not None:
+            current_action = [None if action in drawing_actions else action for action in current_action]
+            if any(path["path"] for path in self.current_paths):
+                self.commit_current_path(self.current_paths)
+                self.current_paths = [new_path(i) for i in range(self.max_hands)]
+        # Render the stylus
+        if stylus_coords is not None:
+            x, y = self.viewport.to_canvas(stylus_coords)
+            x, y = round(x), round(y)
+            if stylus_draw:
+                self.stylus_path["pathType"] = "stylus"
+                new_points = interpolate_path(self.stylus_path["path"], x, y, pen_size)
+                self.add_to_stroke(self.stylus_path, new_points, colour, pen_size)
+                for point in new_points:
+                    cv2.circle(self.current_path, point, pen_size, colour, -1)
+                self.send_points(new_points, colour, pen_size)
+                self.render_current_path = True
+            else:
+                # Show where the stylus is pointing without drawing
+                cv2.circle(self.current_motion, (x, y), 3, Colours.magenta, -1)
+                self.show_motion(x, y, 3)
+
+        # Hand points are found in view, so are moved to where they are on the drawing
+        hand_points = {hand_id: self.viewport.to_canvas(points) for hand_id, points in hand_points.items()}
+        for hand_index, action in enumerate(current_action):
+            if action is None:
+                continue
+            if len(hand_points.get(hand_index, ())) == 0:
+                continue
+            match action:
+                case "draw":
+                    x = round(hand_points[hand_index][8][0])
+                    y = round(hand_points[hand_index][8][1])
+                    new_points = interpolate_path(self.current_paths[hand_index]["path"], x, y, pen_size)
+                    for point in new_points:
+                        cv2.circle(self.current_path, point, pen_size, colour, -1)
+                    self.send_points(new_points, colour, pen_size)
+                    self.add_to_stroke(self.current_paths[hand_index], new_points, colour, pen_size)
+                    self.render_current_path = True
+                case "erase":
+                    # The eraser paints the background over the current path, so only the area it covers is touched
+                    if self.current_paths[hand_index]["pathType"] is None:
+                        self.current_paths[hand_index]["pathType"] = "eraser"
+                        self.current_paths[hand_index]["path"] = []
+                        if self.event_log is not None:
+                            self.event_log.erase(hand_index)
+                    focus_about = [0, 8, 20]
+                    eraser_size = pen_size * 4
+                    # Avoid list index out of range errors
+                    for i in range(len(focus_about)):
+                        if focus_about[i] >= len(hand_points[hand_index]):
+                            focus_about[i] = len(hand_points[hand_index]) - 1
+
+                    points = hand_points[hand_index]
+                    x = round((points[focus_about[0]][0] + points[focus_about[1]][0] + points[focus_about[2]][0]) / 3)
+                    y = round((points[focus_about[0]][1] + points[focus_about[1]][1] + points[focus_about[2]][1]) / 3)
+                    new_points = interpolate_path(self.current_paths[hand_index]["path"], x, y, eraser_size)
+                    for point in new_points:
+                        cv2.circle(self.current_path, point, eraser_size, Colours.white, -1)
+                    self.send_points(new_points, Colours.white, eraser_size)
+                    # Show an outline of the eraser on the current_motion
+                    # To do this, draw a filled circle, then draw a transparent circle over the top
+                    cv2.circle(self.current_motion, (x, y), eraser_size, Colours.magenta, -1)
+                    cv2.circle(self.current_motion, (x, y), eraser_size - 2, Colours.transparent, -1)
+                    self.show_motion(x, y, eraser_size)
+                    self.add_to_stroke(self.current_paths[hand_index], new_points, Colours.white, eraser_size, "erase")
+                    self.render_current_path = True
+
+        # When the stylus is lifted or lost, its stroke is finished
+        if self.stylus_path["path"] and not (stylus_coords is not None and stylus_draw):
+            self.commit_current_path([self.stylus_path])
+            self.stylus_path = new_path(stylus_path_id)
+        if all([action is None for action in current_action]):
+            if self.render_current_path and not self.stylus_path["path"]:
+                self.commit_current_path(self.current_paths)
+                self.current_paths = [new_path(i) for i in range(self.max_hands)]
+
+    def add_to_stroke(self, path, new_points, colour, size, kind="draw"):
+        """
+        Adds the points drawn this frame (from interpolate_path) to a path's stroke, starting a new stroke if needed
+        (such as when the pen changes)
+        """
+        stroke = path["stroke"]
+        if stroke is not None and (stroke.kind, stroke.colour, stroke.size) != (kind, colour, size):
+            self.strokes.finish(stroke)
+            path["stroke"] = None
+        if path["stroke"] is None:
+            path["stroke"] = self.strokes.builder(colour, size, kind)
+            if self.event_log is not None:
+                self.event_log.begin(path["id"], kind, colour, size)
+        xs, ys = [point[0] for point in new_points], [point[1] for point in new_points]
+        bounds = (min(xs) - size, min(ys) - size, max(xs) + size + 1, max(ys) + size + 1)
+        self.current_path_bounds = union_bounds(self.current_path_bounds, bounds)
+        # Only the point actually reached is kept. The points between are just to draw a smooth line
+        path["stroke"].add(new_points[-1])
+        if self.event_log is not None:
+            self.event_log.extend(path["id"], kind, colour, size, new_points)
+
+    def send_points(self, points, colour, size):
+        """Sends points added to a stroke to anyone watching live"""
+        if self.live_stream is not None and points:
+            # Viewers see the board as it is shown, so the points are sent as they appear in view
+            if not self.viewport.identity:
+                points = self.viewport.to_view(points).round().astype(int).tolist()
+                size = max(round(size * self.viewport.scale), 1)
+            self.live_stream.send_stroke({
+                "type": "points", "points": points, "colour": "#{2:02X}{1:02X}{0:02X}".format(*colour), "size": size
+            })
+
+    def commit_current_path(self, paths):
+        """Adds the current path to the current_drawing, and saves the area it changed to the undo stack"""
+        for path in paths:
+            if path["stroke"] is not None:
+                self.strokes.finish(path["stroke"])
+                path["stroke"] = None
+        if self.live_stream is not None:
+            self.live_stream.send_stroke({"type": "commit"})
+        # Add the current path to the current_drawing. Everything drawn is within its bounds
+        bounds, area = self.area(self.current_path_bounds)
+        before = self.current_drawing[area].copy()
+        # The same as manipulation.paste_non_black, without leaving a buffer of this size in the frame pool
+        np.copyto(self.current_drawing[area], self.current_path[area], where=self.current_path[area] != 0)
+        if self.event_log is not None:
+            self.event_log.commit(self.current_drawing)
+        self.changed(bounds)
+        self.current_path_bounds = None
+        self.undo_stack.append((bounds, before, self.current_drawing[area].copy()))
+        # Anything undone before this can't be redone on top of it
+        self.redo_stack = []
+        self.current_path[area] = Colours.transparent
+        self.render_current_path = False
+
+    def undo(self):
+        """Puts the area the last change covered back how it was, moving the change to the redo stack"""
+        if not self.undo_stack:
+            return
+        bounds, before, after = self.undo_stack.pop()
+        self.redo_stack.append((bounds, before, after))
+        self.current_drawing[self.area(bounds)[1]] = before
+        if self.event_log is not None:
+            self.event_log.undo(bounds, before)
+        self.reset(bounds)
+
+    def redo(self):
+        """Makes the last undone change again, moving it back to the undo stack"""
+        if not self.redo_stack:
+            return
+        bounds, before, after = self.redo_stack.pop()
+        self.undo_stack.append((bounds, before, after))
+        self.current_drawing[self.area(bounds)[1]] = after
+        if self.event_log is not None:
+            self.event_log.redo(bounds, after)
+        self.reset(bounds)
+
+    def reset(self, bounds=None):
+        """After an area of the drawing (or all of it) has changed other than by drawing"""
+        if self.live_stream is not None:
+            self.live_stream.send_stroke({"type": "reset"})
+        self.changed(bounds)
+
+    def view_buffer(self):
+        """A buffer to draw the part of a layer in view into, or None if the layer can be used as it is"""
+        return None if self.viewport.identity else pool.get((self.view_size[1], self.view_size[0], 3))
+
+    def compose(self, frame):
+        """Draws the part of the board in view onto a frame of view_size, with the current path and motion on top"""
+        # Overlay the part of the current drawing in view. Use black areas as a mask
+        manipulation.paste_non_black(frame, self.viewport.render(self.pyramid, self.view_buffer()))
+
+        # The motion layer is only shown (and cleared) where something was drawn on it this frame
+        motion = self.current_motion_bounds is not None
+        if motion:
+            # Create a mask from the current_motion, where all non black pixels become white
+            motion_in_view = self.viewport.render_layer(self.current_motion, self.view_buffer())
+            mask = cv2.inRange(motion_in_view, Colours.transparent, Colours.transparent, dst=pool.get(frame.shape[:2]))
+            cv2.bitwise_not(mask, dst=mask)
+            # Apply the mask to the frame, so white pixels on the mask make the frame black
+            cv2.subtract(frame, frame, dst=frame, mask=mask)
+
+        if self.render_current_path:
+            manipulation.paste_non_black(frame, self.viewport.render_layer(self.current_path, self.view_buffer()))
+        if motion:
+            manipulation.paste_non_black(frame, motion_in_view)
+            self.current_motion[self.area(self.current_motion_bounds)[1]] = Colours.transparent
+            self.current_motion_bounds = None
+        return frame
+
+    def close(self):
+        if self.event_log is not None:
+            self.event_log.close()
+        if self.canvas_file is not None:
+            self.canvas_file.close()
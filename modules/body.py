@@ -3,23 +3,61 @@ Fetching and processing of points on the user's body in 3D space
 """
 
 import cv2
-import mediapipe as mp
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import numpy as np
 
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
+from modules.buffers import pool
+
+# Built by load_model the first time body points are needed
+mp_pose = None
+pose = None
+
+
+def load_model():
+    """Builds the MediaPipe pose model if it hasn't been built already"""
+    global mp_pose, pose
+    if pose is None:
+        import mediapipe as mp
+        mp_pose = mp.solutions.pose
+        pose = mp_pose.Pose(
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+    return pose
+
+
+def warm_up(frame):
+    """
+    Runs one inference so MediaPipe's first-inference delay happens now, rather than on the first real frame
+    This may run on a background thread, so it doesn't use the shared buffer pool
+    """
+    load_model().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
 
 def get_body_points(frame):
     """Gets 3D points from the camera feed"""
-    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = pose.process(img_rgb)
+    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=pool.get(frame.shape))
+    results = load_model().process(img_rgb)
     return results.pose_landmarks
 
 
+def landmarks_to_array(landmarks):
+    """Converts MediaPipe's pose landmarks to a (people, 33, 4) array of x, y, z and visibility"""
+    if landmarks is None:
+        return np.zeros((0, 33, 4), np.float32)
+    return np.array(
+        [[(point.x, point.y, point.z, point.visibility) for point in landmarks.landmark]], dtype=np.float32
+    )
+
+
+def detect_array(frame):
+    """
+    Finds the body in a frame and returns it as a (people, 33, 4) landmark array
+    This is used by worker processes, so it doesn't use the shared buffer pool
+    """
+    results = load_model().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return landmarks_to_array(results.pose_landmarks)
+
+
 def render_body(frame, results):
     """Shows points on the camera feed and returns the new frame"""
     for landmark_id, lm in enumerate(results.landmark):
@@ -0,0 +1,62 @@
+"""
+A pool of preallocated frame buffers, so the per-frame image pipeline can write into existing arrays
+instead of allocating new ones every frame
+"""
+
+import numpy as np
+
+
+class FramePool:
+    """
+    Hands out reusable arrays keyed by shape and dtype
+    Buffers taken during a frame stay reserved until release() is called, at which point they can be reused
+    """
+    def __init__(self):
+        self.free = {}  # (shape, dtype) -> list of buffers which can be handed out
+        self.in_use = []  # Buffers handed out since the last release, as (key, buffer)
+        self.allocations = 0  # The number of buffers this pool has ever had to create
+
+    def get(self, shape, dtype=np.uint8):
+        """Gets a buffer with the given shape and dtype. The contents are undefined"""
+        key = (tuple(shape), np.dtype(dtype).str)
+        free = self.free.setdefault(key, [])
+        if free:
+            buffer = free.pop()
+        else:
+            # Nothing free with this shape, so a new buffer has to be made
+            buffer = np.empty(key[0], dtype)
+            self.allocations += 1
+        self.in_use.append((key, buffer))
+        return buffer
+
+    def copy(self, array):
+        """Copies an array into a pooled buffer"""
+        buffer = self.get(array.shape, array.dtype)
+        np.copyto(buffer, array)
+        return buffer
+
+    def keep(self, buffer):
+        """
+        Stops a buffer handed out this frame from being released, so it can be used next frame. See give_back()
+        Returns False if the buffer didn't come from the pool
+        """
+        for index, (key, held) in enumerate(self.in_use):
+            if held is buffer:
+                del self.in_use[index]
+                return True
+        return False
+
+    def give_back(self, buffer):
+        """Returns a buffer which was kept, so it can be handed out again"""
+        key = (tuple(buffer.shape), buffer.dtype.str)
+        self.free.setdefault(key, []).append(buffer)
+
+    def release(self):
+        """Returns every buffer handed out this frame to the pool"""
+        for key, buffer in self.in_use:
+            self.free[key].append(buffer)
+        self.in_use.clear()
+
+
+# The pool shared by the whole pipeline. It is released by the driver once a frame has finished rendering
+pool = FramePool()
@@ -0,0 +1,224 @@
+"""
+Calibration for the camera and board
+StaticCalibration is for a camera which doesn't move, pointed at a board which doesn't move. The board's corners are
+averaged over the first frames it is fully visible for and saved, so later runs (and later frames) can use them
+without finding the board every frame
+LensCalibration stores the camera's lens distortion (measured with calibrate_lens.py), so points can be straightened
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+from modules import manipulation
+from modules.buffers import pool
+
+
+class StaticCalibration:
+    """
+    Keeps the corners of a fixed board, per camera and board, in folder/<camera>_<board>.json
+    Until the corners are known (locked), every frame is averaged in. Once locked, the board only needs finding every
+    verify_interval frames, or when the area around a corner changes. If it is then found to have moved by more
+    than tolerance pixels, or hasn't been seen for lost_limit checks in a row, it is calibrated again
+    """
+    def __init__(
+        self,
+        camera_id=0,
+        board_id="0-3",
+        folder="calibration",
+        warmup_frames=30,
+        verify_interval=90,
+        tolerance=4,
+        motion_threshold=12,
+        patch_size=32,
+        lost_limit=10
+    ):
+        self.path = os.path.join(folder, f"{camera_id}_{board_id}.json")
+        self.warmup_frames = warmup_frames
+        self.verify_interval = verify_interval
+        self.tolerance = tolerance
+        self.motion_threshold = motion_threshold
+        self.patch_size = patch_size
+        self.lost_limit = lost_limit
+
+        self.samples = []  # Corners seen during warm-up
+        self.corners = None  # The averaged corners, once locked
+        self.frame_shape = None
+        self.reference_patches = None  # Greyscale patches around each corner, to check for movement
+        self.lost_count = 0
+        self.checks = 0  # How many times the board has been found since it was locked
+
+    @property
+    def locked(self):
+        return self.corners is not None
+
+    def load(self, frame_shape):
+        """Uses saved corners, if there are any for a camera with this frame size. Returns if they were loaded"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            saved = json.load(f)
+        if tuple(saved["frame_shape"]) != tuple(frame_shape):
+            return False
+        self.corners = [tuple(corner) for corner in saved["corners"]]
+        self.frame_shape = tuple(frame_shape)
+        return True
+
+    def save(self, dimensions):
+        """Saves the corners, and the homography from a board of these dimensions onto them"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "frame_shape": list(self.frame_shape),
+                "corners": [list(corner) for corner in self.corners],
+                "dimensions": list(dimensions),
+                "homography": manipulation.generate_warp_matrix(dimensions, self.corners).tolist()
+            }, f, indent=4)
+
+    def needs_detection(self, frame, frame_number):
+        """If the board should be searched for this frame"""
+        if not self.locked:
+            return True
+        if frame_number % self.verify_interval == 0 or self.reference_patches is None:
+            return True
+        return self.corners_changed(frame)
+
+    def corner_patches(self, frame):
+        """Greyscale patches of the frame around each corner"""
+        patches = []
+        half = self.patch_size // 2
+        for x, y in self.corners:
+            x0 = min(max(int(x) - half, 0), frame.shape[1] - self.patch_size)
+            y0 = min(max(int(y) - half, 0), frame.shape[0] - self.patch_size)
+            region = frame[y0:y0 + self.patch_size, x0:x0 + self.patch_size]
+            patches.append(cv2.cvtColor(region, cv2.COLOR_BGR2GRAY))
+        return patches
+
+    def corners_changed(self, frame):
+        """Checks for anything moving near the corners, by comparing them to how they looked at the last check"""
+        for patch, reference in zip(self.corner_patches(frame), self.reference_patches):
+            difference = cv2.absdiff(patch, reference, dst=pool.get(patch.shape))
+            if cv2.mean(difference)[0] > self.motion_threshold:
+                return True
+        return False
+
+    def update(self, corners, stage, frame, dimensions):
+        """
+        Takes the corners and visibility found by searching for the board this frame
+        Returns the corners and visibility to use - the saved ones if the board hasn't moved
+        """
+        corners = [tuple(float(n) for n in corner) for corner in corners]
+        if not self.locked:
+            if stage != "Accurate":
+                return corners, stage
+            # If the board moved during warm-up, start again from here
+            if self.samples and self.distance(np.mean(self.samples, axis=0), corners) > self.tolerance:
+                self.samples = []
+            self.samples.append(corners)
+            if len(self.samples) >= self.warmup_frames:
+                self.corners = [tuple(corner) for corner in np.mean(self.samples, axis=0).tolist()]
+                self.frame_shape = frame.shape
+                self.samples = []
+                self.save(dimensions)
+                self.reference_patches = self.corner_patches(frame)
+            return corners, stage
+
+        self.checks += 1
+        if stage == "Calibration":
+            # Too few markers to tell - they may be covered, or the board may be gone
+            self.lost_count += 1
+            if self.lost_count >= self.lost_limit:
+                self.unlock()
+                return corners, stage
+        else:
+            self.lost_count = 0
+            if self.distance(self.corners, corners) > self.tolerance:
+                # The board (or camera) has moved, so go back to finding it every frame
+                self.unlock()
+                return corners, stage
+        # Compare against how the corners look now, so lighting changes don't keep triggering checks
+        self.reference_patches = self.corner_patches(frame)
+        return list(self.corners), "Accurate"
+
+    def unlock(self):
+        """Forgets the corners so the board is calibrated again"""
+        self.corners = None
+        self.reference_patches = None
+        self.samples = []
+        self.lost_count = 0
+
+    @staticmethod
+    def distance(a, b):
+        """The furthest any corner is from its match, in pixels"""
+        return float(np.max(np.linalg.norm(np.asarray(a, np.float64) - np.asarray(b, np.float64), axis=1)))
+
+
+class LensCalibration:
+    """
+    The intrinsics and distortion coefficients of a camera, saved in folder/lens_<camera>.json
+    Points are cheap to undistort, so every detected point is. Whole frames are only undistorted when asked
+    """
+    def __init__(self, camera_matrix, dist_coeffs, frame_shape):
+        self.camera_matrix = np.asarray(camera_matrix, np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, np.float64)
+        self.frame_shape = tuple(frame_shape[:2])
+        self.scaled = {}  # Frame shape -> camera matrix for frames of that size
+        self.maps = {}  # Frame shape -> remap tables for undistorting whole frames
+
+    @staticmethod
+    def path(camera_id=0, folder="calibration"):
+        return os.path.join(folder, f"lens_{camera_id}.json")
+
+    @classmethod
+    def load(cls, camera_id=0, folder="calibration"):
+        """Loads a saved calibration, or returns None if this camera hasn't been calibrated"""
+        path = cls.path(camera_id, folder)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(saved["camera_matrix"], saved["dist_coeffs"], saved["frame_shape"])
+
+    def save(self, camera_id=0, folder="calibration", error=None):
+        os.makedirs(folder, exist_ok=True)
+        with open(self.path(camera_id, folder), "w") as f:
+            json.dump({
+                "frame_shape": list(self.frame_shape),
+                "camera_matrix": self.camera_matrix.tolist(),
+                "dist_coeffs": self.dist_coeffs.ravel().tolist(),
+                "error": error
+            }, f, indent=4)
+
+    def matrix_for(self, frame_shape):
+        """The camera matrix for frames of a different size to the ones it was calibrated with"""
+        shape = tuple(frame_shape[:2])
+        if shape not in self.scaled:
+            matrix = self.camera_matrix.copy()
+            # Focal lengths and the principal point scale with the frame
+            matrix[0] *= shape[1] / self.frame_shape[1]
+            matrix[1] *= shape[0] / self.frame_shape[0]
+            self.scaled[shape] = matrix
+        return self.scaled[shape]
+
+    def undistort_points(self, points, frame_shape):
+        """Undistorts an (n, 2) array of pixel positions, returning their positions in a straightened frame"""
+        points = np.asarray(points, np.float64).reshape(-1, 1, 2)
+        if not len(points):
+            return points.reshape(-1, 2)
+        matrix = self.matrix_for(frame_shape)
+        return cv2.undistortPoints(points, matrix, self.dist_coeffs, P=matrix).reshape(-1, 2)
+
+    def undistort_frame(self, frame):
+        """Undistorts a whole frame, using remap tables which are only built once for each frame size"""
+        shape = frame.shape[:2]
+        if shape not in self.maps:
+            matrix = self.matrix_for(shape)
+            self.maps[shape] = cv2.initUndistortRectifyMap(
+                matrix, self.dist_coeffs, None, matrix, (shape[1], shape[0]), cv2.CV_16SC2
+            )
+        map_x, map_y = self.maps[shape]
+        return cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, dst=pool.get(frame.shape))
@@ -0,0 +1,120 @@
+"""
+Keeps a board's canvas in a file mapped into memory, so it survives the program crashing and doesn't have to fit in RAM
+Drawing onto the canvas writes straight into the page cache, parts of the board which aren't being used can be paged
+out by the OS, and reopening the file maps it without reading or decoding anything
+
+The file is laid out as:
+    header: magic, version, height, width, channels, dirty
+    the canvas, as height x width x channels uint8 pixels
+dirty is set while there are changes which haven't been flushed to disk, so a board which was open when the
+computer (not just the program) crashed can be recognised
+"""
+
+import os
+import threading
+
+import numpy as np
+
+magic = b"WBCV"
+version = 1
+
+header_dtype = np.dtype([
+    ("magic", "S4"), ("version", "<u4"), ("height", "<u4"), ("width", "<u4"), ("channels", "<u4"), ("dirty", "<u4")
+])
+header_size = 64  # The canvas starts here, leaving room to add to the header
+
+
+class CanvasFile:
+    """
+    A canvas stored in the file at path. canvas is a NumPy array which can be drawn on like any other
+        board = CanvasFile("board.canvas", (500, 1000, 3), background=(255, 255, 255))
+        cv2.circle(board.canvas, (100, 100), 5, (0, 0, 0), -1)
+        board.changed()
+    Call changed() after drawing, and changes are flushed to disk every flush_interval seconds on a background thread
+    If the file already has a canvas of the same shape it is opened as it is, and if it has anything else a ValueError
+    is raised rather than replacing it. Otherwise a new one is made, filled with background. With a background of None
+    it is left black, and takes no space on disk until it is drawn on
+    """
+    def __init__(self, path, shape, background=(255, 255, 255), flush_interval=2.0):
+        self.path = path
+        self.shape = tuple(shape)
+        self.flush_interval = flush_interval
+        self.changes = 0  # Increased by changed(), so the flusher can tell if anything changed while it was flushing
+        self.flushed_changes = 0
+        # Held while the dirty flag is set or cleared, so a change made while flushing can't be marked as flushed
+        self.lock = threading.Lock()
+        self.reopened = os.path.exists(path)
+        if self.reopened:
+            self.check()
+        else:
+            self.create()
+        self.header = np.memmap(path, header_dtype, "r+", 0, (1,))
+        # Whether changes were lost the last time the board was used
+        self.was_dirty = bool(self.header["dirty"][0])
+        self.canvas = np.memmap(path, np.uint8, "r+", header_size, self.shape)
+        if not self.reopened and background is not None:
+            self.canvas[:] = background
+            self.changed()
+
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._flush_regularly, daemon=True)
+        self.thread.start()
+
+    def check(self):
+        """Raises a ValueError unless the file already has a canvas of this shape"""
+        size = os.path.getsize(self.path)
+        if size < header_size:
+            raise ValueError(f"{self.path} is not a canvas")
+        header = np.fromfile(self.path, header_dtype, 1)[0]
+        if header["magic"] != magic or header["version"] != version:
+            raise ValueError(f"{self.path} is not a canvas this version understands")
+        channels = self.shape[2] if len(self.shape) == 3 else 1
+        if (header["height"], header["width"], header["channels"]) != (*self.shape[:2], channels):
+            raise ValueError(
+                f"{self.path} is a {header['width']}x{header['height']} board with {header['channels']} channels"
+            )
+        if size < header_size + int(np.prod(self.shape)):
+            raise ValueError(f"{self.path} has been cut short")
+
+    def create(self):
+        """Makes a new file, the size of the header and canvas. Space for the canvas is only used once it is drawn on"""
+        header = np.zeros((), header_dtype)
+        header["magic"] = magic
+        header["version"] = version
+        header["height"], header["width"] = self.shape[:2]
+        header["channels"] = self.shape[2] if len(self.shape) == 3 else 1
+        with open(self.path, "wb") as file:
+            file.write(header.tobytes().ljust(header_size, b"\0"))
+            file.truncate(header_size + int(np.prod(self.shape)))
+
+    def changed(self):
+        """Marks the canvas as changed, so it is flushed to disk"""
+        with self.lock:
+            if self.changes == self.flushed_changes:
+                self.header["dirty"][0] = 1
+            self.changes += 1
+
+    def flush(self):
+        """Writes any changes to disk now"""
+        changes = self.changes
+        if changes == self.flushed_changes:
+            return
+        # Drawing carries on while the canvas is written out
+        self.canvas.flush()
+        with self.lock:
+            self.flushed_changes = changes
+            # If anything was drawn while flushing, it stays dirty until the next flush
+            if self.changes == changes:
+                self.header["dirty"][0] = 0
+        self.header.flush()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.flush()
+        del self.canvas, self.header
+
+    def _flush_regularly(self):
+        """The flusher thread"""
+        while not self.stop.wait(self.flush_interval):
+            self.flush()
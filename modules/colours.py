@@ -0,0 +1,23 @@
+"""
+The colours the whiteboard draws with, as BGR tuples
+"""
+
+
+def hex_to_bgr(hex_code):
+    """Converts a hex code to a BGR tuple"""
+    hex_code = hex_code.lstrip('#')
+    length = len(hex_code)
+    return tuple(reversed([int(hex_code[i:i + length // 3], 16) for i in range(0, length, length // 3)]))
+
+
+class Colours:
+    """A list of colours the program can use at any point"""
+    red: tuple = hex_to_bgr("#F27878")
+    green: tuple = hex_to_bgr("#A1CC65")
+    blue: tuple = hex_to_bgr("#6576CC")
+    yellow: tuple = hex_to_bgr("#E6DC71")
+    cyan: tuple = hex_to_bgr("#71AEF5")
+    magenta: tuple = hex_to_bgr("#A358B3")
+    white: tuple = hex_to_bgr("#FFFFFF")
+    black: tuple = hex_to_bgr("#020202")
+    transparent: tuple = hex_to_bgr("#000000")
@@ -6,18 +6,21 @@ It runs the main loop, handles the camera feed, and stores all 3D data
 # import body
 import cv2
 from modules import hands
+from modules.handtracking import HandTracker
 from modules import manipulation
 import numpy as np
 
 from modules import screenspace
 from modules import body
+from modules.buffers import pool
+from modules.colours import hex_to_bgr
+
+from modules import sinks as output_sinks
+from modules import sources
 
 import os
 import threading
-
-# import pygame
-
-pygame_initialised = False
+import time
 
 
 colours = {
@@ -47,8 +50,48 @@ class Driver:
         flip_vertical: bool = False,
         width=300,
         height=150,
-        use_pygame=True
+        use_pygame=True,
+        source=None,
+        sinks=None,
+        use_processes=False,
+        stylus_priority=True,
+        stylus_hand_interval=0,
+        board_detection_interval=5,
+        pen_server=None,
+        stylus_grace=0.2,
+        calibration=None,
+        lens=None,
+        undistort_display=False,
+        idle_governor=None,
+        quality_governor=None,
+        boards=1,
+        workers=None
     ):
+        """
+        source is where camera frames are read from, and defaults to the webcam (opened on the first calculate)
+        sinks is a list of places rendered frames are sent to. If it is not given, the pygame window is used
+        (or a plain OpenCV window if use_pygame is False). Pass something like [NullSink()] to run headless
+        use_processes runs each of the hands and body modules in its own process, rather than in this one
+        workers are InferenceWorkers for those processes, by module, started before anything else (see workers.py).
+        Any which aren't given are started on the first frame
+        With stylus_priority, while the stylus is visible hand detection is suspended (or run every
+        stylus_hand_interval frames if that is above 0), and the board is only searched for every
+        board_detection_interval frames - the other frames only look for the stylus near where it last was
+        pen_server is a PenEventServer receiving touches from the phone stylus page. Once it has had an event, the
+        pen state comes from it rather than marker 5, and if the stylus is lost mid-stroke (usually from motion
+        blur) it is kept where it was last seen for stylus_grace seconds
+        calibration is a StaticCalibration, for a camera and board which don't move. The board's corners are then
+        loaded or calibrated once, and the board is only searched for when it might have moved
+        lens is a LensCalibration for the camera. The board corners, stylus corners and hand landmarks are then
+        straightened before they are mapped onto the board. The camera feed itself is only straightened (which is
+        much slower) if undistort_display is set
+        idle_governor is an IdleGovernor. While it finds nothing is happening, calculate() skips everything but
+        reading the camera, render() shows the last frame again, and the loop is slowed down
+        quality_governor is a QualityGovernor, which changes the quality settings below to hold a frame rate
+        boards is how many boards to look for in the camera's view. The first is found from markers 0-3, and the rest
+        from 6-9, 10-13 and so on (see screenspace.board_marker_ids), all in the same detection pass. Each hand (and
+        the stylus) is on the board whose corners are around it, and the board last used is the active_board
+        """
         self.modules = modules
         self.flip_horizontal = flip_horizontal
         self.flip_vertical = flip_vertical
@@ -56,35 +99,65 @@ class Driver:
         self.camera_frame = None
         self.current_frame = None
         self.debug = debug
-        self.warp_matrix = None
-        self.inverse_matrix = None
 
         self.videospace_stylus_coords = []
         self.stylus_coords = (0, 0)
         self.stylus_draw = None
+        self.stylus_priority = stylus_priority
+        self.stylus_hand_interval = stylus_hand_interval
+        self.board_detection_interval = board_detection_interval
+        self.pen_server = pen_server
+        self.stylus_grace = stylus_grace
+        self.last_stylus_seen = None  # (stylus_coords, time.monotonic()) when the stylus was last visible
 
         self.hand_video_coords = None
-        self.hand_normalised_coords = None
-        self.screenspace_hand_points = None
         self.full_hand_results = None
         self.full_hand_landmarks = None
+        self.hands_updated = False  # If hand detection ran on the last frame
+        self.hand_landmark_array = hands.landmarks_to_array(None)  # (hands, 21, 3) array of the normalised landmarks
+        self.hand_tracker = HandTracker()
+        self.hand_ids = self.hand_tracker.ids  # The stable ID of each hand in hand_landmark_array
+        self.hands_submitted = 0  # The frame number hands were last sent to the worker process on
 
         self.full_body_results = None
+        self.body_landmark_array = body.landmarks_to_array(None)  # (people, 33, 4) array of the normalised landmarks
         self.videospace_body_coordinates = None
         self.screenspace_body_points = None
 
-        self.screenspace_corners = None
-        self.screenspace_midpoints = None
-        self.screenspace_center = None
-
-        self.previous_full_codes = [x for x in screenspace.default_full_codes]
-
-        self.visibility = "Calibration"  # Calibration, Correcting, Accurate
-        self.visibility_time = 1000
+        # Every board, each with its own corners, visibility and matrices
+        self.boards = [screenspace.BoardMarkers(ids) for ids in screenspace.board_marker_ids(boards)]
+        self.screenspace_midpoints = None  # The midpoints of the edges of each board
+        self.hand_boards = np.zeros(0, np.int32)  # The board each hand is on (0 is the first), or -1 for none
+        self.hand_points = np.zeros((0, 21, 2))  # The (hands, 21, 2) points of each hand in the camera frame
+        self.stylus_board = -1  # The board the stylus is on, or -1 if it isn't on one
+        self.active_board = 0  # The board being used, which undo, redo and zooming act on
+
+        self.calibration = calibration
+        self.calibration_loaded = False
+        self.lens = lens
+        self.undistort_display = undistort_display and lens is not None
+
+        self.idle_governor = idle_governor
+        self.idle = False  # If nothing changed this frame, so the last results are being reused
+        self.kept_frames = []  # The last rendered frame and board, kept out of the pool to show again while idle
+        self.last_board = None
+
+        # Quality settings, which are lowered by the quality governor on slower machines
+        self.detection_scale = 1.0  # The size of the frame the board is searched for in
+        self.stylus_search_scale = 0.5  # The size of the board the stylus is searched for in, when the board is static
+        self.hand_scale = 1.0  # The size of the frame hands are searched for in
+        self.hand_interval = 1  # Hands are found every this many frames
+        self.max_hands = hands.max_hands
+        self.composite_scale = 1.0  # The size of the camera frame the board is drawn onto
+        self.stage_times = {}  # Seconds spent on each stage of the last frame
+        self.quality_governor = quality_governor
+        if quality_governor is not None:
+            quality_governor.apply(self)
 
         self.mode = "normal"
         self.colour = "red"
         self.pen_size = 5
+        self.viewport = None  # A Viewport the window can zoom and pan, if zooming is allowed
         self.monitor_dimensions = (1920, 1080)
 
         self.rendered_frame = None
@@ -96,67 +169,208 @@ class Driver:
         self.frame_number = 0
         self.use_pygame = use_pygame
 
+        # The webcam is only opened once the first frame is needed
+        self.source = source
+        self.source_finished = False
+        if sinks is None:
+            if use_pygame:
+                # Only import pygame when the window is actually wanted
+                from modules.window import WindowSink
+                sinks = [WindowSink()]
+            else:
+                sinks = [output_sinks.HighGUISink()]
+        self.sinks = sinks
+
+        self.use_processes = use_processes
+        self.workers = dict(workers or {})  # Module name -> InferenceWorker
+
     def use_monitor_display(self):
         """Uses the user's screen as the output, rather than the physical codes"""
         self.mode = "monitor"
         self.monitor_dimensions = manipulation.get_monitor_dimensions()
         self.show_corner_codes()
 
+    def open_sinks(self, frame_shape, width):
+        """
+        Works out the output size from the shape of a camera frame, then opens every sink
+        This happens on the first calculate, unless it has been done beforehand
+        """
+        # Calculate the video ratio
+        video_ratio = frame_shape[1] / frame_shape[0]
+        self.output_size = (width, int(width / video_ratio))
+        self.first_camera_frame = False
+        for sink in self.sinks:
+            sink.open(self)
+
+    def start_workers(self, frame_shape, hand_shape=None):
+        """
+        Starts a worker process for each module which needs one and wasn't given one, and sizes their ring buffers
+        for this frame size. The hands worker can be given smaller frames, of hand_shape
+        """
+        from modules.workers import InferenceWorker, model_modules
+        for module in self.modules:
+            if module not in model_modules:
+                continue
+            shape = tuple(hand_shape if module == "hands" and hand_shape is not None else frame_shape)
+            if module in self.workers:
+                # The process carries on, only the ring buffer is made again if the size has changed
+                self.workers[module].set_frame_shape(shape)
+            else:
+                self.workers[module] = InferenceWorker(module, shape)
+
     @staticmethod
     def hex_to_bgr(hex_code):
         """Converts a hex code to a BGR tuple"""
-        hex_code = hex_code.lstrip('#')
-        length = len(hex_code)
-        return tuple(reversed([int(hex_code[i:i + length // 3], 16) for i in range(0, length, length // 3)]))
+        return hex_to_bgr(hex_code)
 
     def calculate(self, width, height):
         """
             Runs all calculations for the current frame - This finds the position of the codes on the screen,
             and the position of the stylus
         """
-        frame = screenspace.get_current_frame()
-        self.camera_frame = frame.copy()
+        if self.source is None:
+            self.source = sources.CameraSource()
+        if self.idle_governor is not None:
+            self.idle_governor.wait()
+        frame = screenspace.get_current_frame(self.source)
+        if frame is None:
+            # The source has run out of frames (e.g. the end of a video file)
+            self.source_finished = True
+            return
+        self.camera_frame = pool.copy(frame)
         if self.first_camera_frame:
-            # Calculate the video ratio
-            video_ratio = frame.shape[1] / frame.shape[0]
-            self.output_size = (width, int(width / video_ratio))
-            # Set the dimensions of the UI window
-            self.first_camera_frame = False
-            if self.use_pygame:
-                self.screen = pygame.display.set_mode((self.output_size[0] + 40 + 32 + 20, self.output_size[1] + 140))
-                pygame.display.set_caption("Screenspace")
-        dimensions = manipulation.create_image_with_dimensions(width, height)
-        # Get the corners of the screen
-        self.screenspace_corners, output_frame, self.previous_full_codes, self.videospace_stylus_coords, \
-            self.stylus_draw, visibility = screenspace.get_screenspace_points(
-                frame, frame, self.debug, self.previous_full_codes
-            )
-        # If the visibility has changed, reset the visibility time
-        if visibility != self.visibility:
-            self.visibility = visibility
-            self.visibility_time = 0
+            self.open_sinks(frame.shape, width)
+        if self.idle_governor is not None:
+            active = len(self.hand_landmark_array) > 0 or self.stylus_coords is not None
+            self.idle = self.idle_governor.update(frame, active) and self.rendered_frame is not None
+            if self.idle:
+                # Nothing has moved, so the last results are still right
+                self.hands_updated = False
+                return
+        dimensions = (height, width)
+        if self.calibration is not None and not self.calibration_loaded:
+            self.load_calibration(frame.shape)
+        # With a static camera, the boards only need finding when they might have moved
+        board_static = self.calibration is not None and not self.calibration.needs_detection(frame, self.frame_number)
+        stage_start = time.perf_counter()
+        stylus_tracked = len(self.videospace_stylus_coords) > 0
+        # With a static camera, the boards aren't looked for until they might have moved, stylus or not
+        # Otherwise while the stylus is being tracked, only look around it for most frames, and find boards less often
+        stylus_only = board_static or (
+            self.stylus_priority and stylus_tracked and self.frame_number % self.board_detection_interval != 0
+        )
+        if stylus_only:
+            output_frame = frame
+            if stylus_tracked:
+                self.videospace_stylus_coords, self.stylus_draw = screenspace.get_stylus_points(
+                    frame, self.videospace_stylus_coords
+                )
+            else:
+                # The stylus only draws on the boards, so it is only looked for there, in a smaller copy of the frame
+                board_area = [corner for board in self.boards for corner in board.corners]
+                self.videospace_stylus_coords, self.stylus_draw = screenspace.get_stylus_points(
+                    frame, board_area, scale=self.stylus_search_scale
+                )
+            # Every board stays where it was
+            visibilities = [board.visibility for board in self.boards]
         else:
-            self.visibility_time += 1
-        # Get the midpoints of the screen
-        self.screenspace_midpoints, output_frame = screenspace.get_midpoints(
-            self.screenspace_corners, frame, self.debug
+            # Find every board in the same pass
+            output_frame, found, self.videospace_stylus_coords, self.stylus_draw = screenspace.get_screenspace_points(
+                frame, frame, self.debug, self.boards, self.detection_scale
+            )
+            visibilities = [screenspace.stages.get(len(corners), "Calibration") for corners in found]
+            if self.calibration is not None:
+                # The static calibration is of the first board
+                self.boards[0].corners, visibilities[0] = self.calibration.update(
+                    self.boards[0].corners, visibilities[0], frame, dimensions
+                )
+        self.stage_times["detection"] = time.perf_counter() - stage_start
+        for board, visibility in zip(self.boards, visibilities):
+            board.set_visibility(visibility)
+        # Get the midpoints of each board's edges
+        self.screenspace_midpoints = []
+        for board in self.boards:
+            midpoints, output_frame = screenspace.get_midpoints(board.corners, output_frame, self.debug)
+            self.screenspace_midpoints.append(midpoints)
+            output_frame = screenspace.add_screenspace_overlay(output_frame, board.corners, self.debug)
+        stage_start = time.perf_counter()
+        # If the user wants to calculate hands points
+        # While the stylus is being tracked, hands are skipped (or only found every stylus_hand_interval frames)
+        self.hands_updated = "hands" in self.modules and (
+            not self.stylus_priority or len(self.videospace_stylus_coords) == 0
+            or (self.stylus_hand_interval > 0 and self.frame_number % self.stylus_hand_interval == 0)
         )
-        self.warp_matrix = manipulation.generate_warp_matrix(dimensions, self.screenspace_corners)
-        # Calculate the inverse matrix if possible
-        try:
-            self.inverse_matrix = np.linalg.inv(self.warp_matrix)
-        except np.linalg.LinAlgError:
-            self.inverse_matrix = None
-
-        # Find the center of the screen
-        center_x, center_y = frame.shape[1] // 2, frame.shape[0] // 2
-        center_warp_matrix = manipulation.generate_warp_matrix(frame, self.screenspace_corners)
-        self.screenspace_center = manipulation.find_new_coordinate((center_x, center_y), center_warp_matrix)
-        # Find the center of the screen in the videospace
-        if len(self.videospace_stylus_coords):
-            new_coords = [
-                manipulation.find_new_coordinate(c, self.inverse_matrix) for c in self.videospace_stylus_coords
-            ]
+        # At lower quality, hands are only found every hand_interval frames, and the last ones are used in between
+        hands_reused = self.hands_updated and self.frame_number % self.hand_interval != 0
+        self.hands_updated = self.hands_updated and not hands_reused
+        hand_frame = frame
+        if self.hands_updated and self.hand_scale != 1:
+            # The landmarks are normalised, so they don't need scaling back up
+            size = (round(frame.shape[1] * self.hand_scale), round(frame.shape[0] * self.hand_scale))
+            hand_frame = cv2.resize(
+                frame, size, dst=pool.get(size[::-1] + frame.shape[2:]), interpolation=cv2.INTER_AREA
+            )
+        # Hand the frame to the worker processes first, so every model runs at the same time
+        # Their results are for the frame before, so they find this frame's while it is composited and shown
+        if self.use_processes:
+            self.start_workers(frame.shape, hand_frame.shape)
+            for module, worker in self.workers.items():
+                if module != "hands":
+                    worker.submit(frame)
+                elif self.hands_updated:
+                    # The frame left in flight on the last detection frame is collected now, unless it is from
+                    # before a longer gap than the intervals allow (such as while idle, or while the stylus was
+                    # tracked with hands suspended), and so too out of date to use
+                    longest_gap = self.hand_interval * max(1, self.stylus_hand_interval)
+                    if self.frame_number - self.hands_submitted > longest_gap:
+                        worker.discard()
+                    worker.submit(hand_frame)
+                    self.hands_submitted = self.frame_number
+        if "hands" in self.modules and not self.hands_updated:
+            if not hands_reused:
+                self.hand_landmark_array = hands.landmarks_to_array(None)
+                self.hand_ids = self.hand_tracker.update(self.hand_landmark_array)
+        elif "hands" in self.modules:
+            if self.use_processes:
+                self.full_hand_results = None
+                self.full_hand_landmarks = None
+                result = self.workers["hands"].result()
+                if result is not None:
+                    self.hand_landmark_array, handedness = result
+                else:
+                    # Only this frame is in flight, so the last hands are kept until its results are back
+                    handedness = None
+                output_frame = hands.render_hand_array(output_frame, self.hand_landmark_array, self.debug)
+            else:
+                hands.set_max_hands(self.max_hands)
+                hand_points, self.full_hand_results = hands.get_hand_points(hand_frame)
+                self.full_hand_landmarks = hand_points
+                self.hand_landmark_array = hands.landmarks_to_array(hand_points)
+                handedness = hands.handedness_to_array(self.full_hand_results)
+                output_frame = hands.render_hand_points(output_frame, self.full_hand_results, self.debug)
+            # Match the hands to the ones seen before, so each keeps its ID whatever order they were found in
+            self.hand_ids = self.hand_tracker.update(self.hand_landmark_array, handedness)
+        # Scale the normalised landmarks up to the size of the video
+        video_coords = self.hand_landmark_array[:, :, :2].astype(np.float64) * frame.shape[1::-1]
+
+        # Straighten every point found this frame before it is mapped onto the boards
+        corners, stylus_points, hand_points = self.undistort_inputs(
+            [corner for board in self.boards for corner in board.corners], self.videospace_stylus_coords,
+            video_coords, frame.shape
+        )
+        # The matrices of each board only change when its corners do, which is rarely once it is still
+        for index, board in enumerate(self.boards):
+            board_corners = corners[4 * index:4 * index + 4]
+            # The boards are drawn onto the camera feed, so they use the corners as they appear in the feed shown
+            board.update_matrices(dimensions, board_corners, board_corners if self.undistort_display else None)
+        self.hand_points = hand_points
+        # Each hand is on the board around the base of its middle finger, near the middle of its palm
+        self.hand_boards = np.array([self.board_at(hand[9]) for hand in video_coords], np.int32)
+        self.stylus_board = self.board_at(np.mean(self.videospace_stylus_coords[:2], axis=0)) \
+            if len(stylus_points) else -1
+        inverse_matrix = self.boards[self.stylus_board].inverse_matrix if self.stylus_board >= 0 else None
+        if len(stylus_points) and inverse_matrix is not None:
+            new_coords = [manipulation.find_new_coordinate(c, inverse_matrix) for c in stylus_points]
             # Find the midpoint
             self.stylus_coords = (
                 round((new_coords[0][0] + new_coords[1][0]) / 2),
@@ -164,42 +378,95 @@ class Driver:
             )
         else:
             self.stylus_coords = None
-
-        output_frame = screenspace.add_screenspace_overlay(output_frame, self.screenspace_corners, self.debug)
-        # If the user wants to calculate hands points
-        if "hands" in self.modules:
-            hand_points, self.full_hand_results = hands.get_hand_points(frame)
-            self.full_hand_landmarks = hand_points
-            output_frame = hands.render_hand_points(output_frame, self.full_hand_results, self.debug)
-            self.screenspace_hand_points = []
-            if hand_points:
-                # self.raisedFingers = [hands.get_extended_fingers(hp) for hp in handPoints]
-                self.hand_video_coords = [
-                    hands.to_videospace_coords(h.landmark, output_frame.shape[1], output_frame.shape[0])
-                    for h in hand_points
-                ]
-                # To work out positions on screen, multiply by the warp matrix
-                self.hand_normalised_coords = []
-                for hand in self.hand_video_coords:
-                    self.hand_normalised_coords.append([])
-                    self.screenspace_hand_points.append([])
-                    for point in hand:
-                        self.hand_normalised_coords[-1].append(manipulation.find_new_coordinate(
-                            point,
-                            self.warp_matrix
-                        ))
-                        if self.inverse_matrix is not None:
-                            self.screenspace_hand_points[-1].append(manipulation.find_new_coordinate(
-                                point,
-                                self.inverse_matrix
-                            ))
-            output_frame = hands.render_hand_points(output_frame, self.full_hand_results, self.debug)
+        if self.pen_server is not None and self.pen_server.has_events():
+            self.fuse_pen_events()
+        # Undo, redo and zooming act on the board being used: the stylus's, or else that of the first hand on a board
+        hands_on_boards = self.hand_boards[self.hand_boards >= 0]
+        if self.stylus_board >= 0:
+            self.active_board = self.stylus_board
+        elif len(hands_on_boards):
+            self.active_board = int(hands_on_boards[0])
+
+        if "hands" in self.modules and len(self.hand_landmark_array):
+            self.hand_video_coords = [[tuple(point) for point in hand] for hand in video_coords.astype(int).tolist()]
         # If the user wants to calculate body points
         if "body" in self.modules:
-            self.full_body_results = body.get_body_points(frame)
-
+            if self.use_processes:
+                self.full_body_results = None
+                result = self.workers["body"].result()
+                if result is not None:
+                    self.body_landmark_array = result[0]
+            else:
+                self.full_body_results = body.get_body_points(frame)
+                self.body_landmark_array = body.landmarks_to_array(self.full_body_results)
+        self.stage_times["hands"] = time.perf_counter() - stage_start
+
+        if self.undistort_display:
+            output_frame = self.lens.undistort_frame(output_frame)
         self.current_frame = output_frame
 
+    def hand_points_by_id(self, board=0):
+        """The screenspace points of each hand on a board (the first by default), by the hand's stable ID"""
+        inverse_matrix = self.boards[board].inverse_matrix
+        on_board = self.hand_boards == board
+        if inverse_matrix is None or not on_board.any():
+            return {}
+        # Every point of every hand on the board is mapped at once
+        points = cv2.perspectiveTransform(self.hand_points[on_board].reshape(-1, 1, 2), inverse_matrix)
+        points = points.reshape(-1, 21, 2)
+        return {int(hand_id): hand for hand_id, hand in zip(self.hand_ids[on_board], points) if hand_id >= 0}
+
+    def board_at(self, point):
+        """The board (0 is the first) around a point in the camera frame, or -1 if it isn't on any"""
+        if len(self.boards) == 1:
+            # With one board, everything is on it, even if it is just off the edge
+            return 0
+        for index, board in enumerate(self.boards):
+            if board.contains(point):
+                return index
+        return -1
+
+    def undistort_inputs(self, corners, stylus_points, hand_points, frame_shape):
+        """
+        Removes lens distortion from the board corners, stylus corners and (hands, 21, 2) hand points
+        They are all undistorted together in a single call. Without a lens calibration, they are returned as they are
+        """
+        if self.lens is None:
+            return corners, stylus_points, hand_points
+        points = np.concatenate([
+            np.asarray(corners, np.float64).reshape(-1, 2),
+            np.asarray(stylus_points, np.float64).reshape(-1, 2),
+            hand_points.reshape(-1, 2)
+        ])
+        points = self.lens.undistort_points(points, frame_shape)
+        stylus_end = len(corners) + len(stylus_points)
+        return (
+            [tuple(point) for point in points[:len(corners)].tolist()],
+            [tuple(point) for point in points[len(corners):stylus_end].tolist()],
+            points[stylus_end:].reshape(hand_points.shape)
+        )
+
+    def load_calibration(self, frame_shape):
+        """Uses the saved corners of the board, if it has been calibrated with this camera before"""
+        self.calibration_loaded = True
+        if self.calibration.load(frame_shape):
+            # Markers which aren't seen when checking the board are assumed to still be at these corners
+            self.boards[0].corners = list(self.calibration.corners)
+            self.boards[0].visibility = "Accurate"
+            self.boards[0].visibility_time = 0
+
+    def fuse_pen_events(self):
+        """Combines the position of the stylus seen by the camera with the pen state sent by the phone"""
+        now = time.monotonic()
+        if self.stylus_coords is not None:
+            self.last_stylus_seen = (self.stylus_coords, now)
+        elif self.pen_server.down and self.last_stylus_seen is not None and \
+                now - self.last_stylus_seen[1] < self.stylus_grace:
+            # Keep drawing from where the stylus was, rather than ending the stroke
+            self.stylus_coords = self.last_stylus_seen[0]
+        # The touch events arrive before the camera can see the screen change, so they start and end strokes
+        self.stylus_draw = self.pen_server.down if self.stylus_coords is not None else None
+
     @staticmethod
     def show_corner_codes():
         """Shows codes in the corner of the users screen"""
@@ -224,74 +491,83 @@ class Driver:
             # Move the window to the correct position
             cv2.moveWindow(f"Code {i}", positions[i][0], positions[i][1])
 
-    def render(self, frame, overlay=None) -> None:
+    def render(self, frame, overlay=None, board_frames=None) -> None:
         """
         Render is a slow function - so instead create a thread for it and allow processing of the next frame
         This code may not always be used, but it's here if needed
+        frame is the frame to draw onto the first board, and board_frames those to draw onto the rest, in order
         """
+        if self.source_finished:
+            return
         self.frame_number += 1
-        self._render(frame, overlay)
+        if self.idle and frame is None:
+            # Show the last frame again, rather than compositing an identical one
+            for sink in self.sinks:
+                sink.write(self.last_board if sink.board_only else self.rendered_frame)
+            pool.release()
+            if self.quality_governor is not None:
+                self.quality_governor.pause()
+            return
+        stage_start = time.perf_counter()
+        self._render(frame, overlay, board_frames)
+        self.stage_times["render"] = time.perf_counter() - stage_start
+        if self.quality_governor is not None:
+            self.quality_governor.update(self)
+        if self.idle_governor is not None:
+            # Keep this frame out of the pool, so it can be shown again if the next frames are idle
+            for kept in self.kept_frames:
+                pool.give_back(kept)
+            self.kept_frames = [kept for kept in (self.rendered_frame, frame) if pool.keep(kept)]
+            self.last_board = frame
         # threading.Thread(target=self._render, args=(frame, overlay)).start()
+        # The frame has been shown, so every buffer used to make it can be reused for the next one
+        pool.release()
 
-    def _render(self, frame, overlay=None) -> None:
-        """Outputs the frame in the desired format"""
-        if not self.use_pygame:
-            # Overlay the frame onto the camera feed by using the warp matrix
-            frame = manipulation.overlay_image(self.camera_frame, frame, self.warp_matrix)
-            # Show the frame
-            cv2.imshow("Screenspace", frame)
-            cv2.waitKey(1)
-            return
-        if not pygame_initialised:
-            pygame.init()
-            pygame_initialised = True
-        cv2.imshow("Video Feed", self.camera_frame)
+    def _render(self, frame, overlay=None, board_frames=None) -> None:
+        """Composites the frame (and the frames of any other boards) onto the camera feed and sends it to every sink"""
         if (self.mode == "normal") or True:
-            output_frame = self.current_frame.copy()
-            if self.visibility_time < 1_000:
-                output_frame = manipulation.overlay_image(output_frame, frame, self.warp_matrix)
-            # Resize to 1000 width, keeping aspect ratio
-            output_frame = cv2.resize(output_frame, (1000, round(1000 * output_frame.shape[0] / output_frame.shape[1])))
-            # Flip the frame horizontally
-            if self.flip_horizontal:
-                output_frame = cv2.flip(output_frame, 1)
-            # Flip the frame vertically
-            if self.flip_vertical:
-                output_frame = cv2.flip(output_frame, 0)
+            output_frame = self.current_frame
+            scale_matrix = np.diag([self.composite_scale, self.composite_scale, 1])
+            if self.composite_scale != 1:
+                # Draw the boards onto a smaller copy of the camera frame, moving the corners to match
+                size = (
+                    round(output_frame.shape[1] * self.composite_scale),
+                    round(output_frame.shape[0] * self.composite_scale)
+                )
+                output_frame = cv2.resize(output_frame, size, dst=pool.get(size[::-1] + output_frame.shape[2:]))
+            # The camera frame is only used for this frame, so the boards are drawn straight onto it
+            for board, board_frame in zip(self.boards, [frame] + list(board_frames or [])):
+                # Boards which have never been seen have nowhere to be drawn
+                if board.warp_matrix is not None and board.visibility_time < 1_000 and (0, 0) not in board.corners:
+                    warp_matrix = board.warp_matrix if self.composite_scale == 1 else scale_matrix @ board.warp_matrix
+                    output_frame = manipulation.overlay_image(output_frame, board_frame, warp_matrix, in_place=True)
+            # Resize straight to the output size, flipping at the same time
+            output_frame = manipulation.resize_and_flip(
+                output_frame, self.output_size, self.flip_horizontal, self.flip_vertical
+            )
             if overlay is not None:
+                output_shape = output_frame.shape
                 # Make overlay the same size as the output frame
-                overlay = cv2.resize(overlay, (output_frame.shape[1], output_frame.shape[0]))
+                if overlay.shape != output_shape:
+                    overlay = cv2.resize(overlay, self.output_size, dst=pool.get(output_shape))
+                else:
+                    overlay = pool.copy(overlay)
                 # Create a mask of the overlay. Black pixels should be ignored
-                mask = cv2.cvtColor(overlay, cv2.COLOR_BGR2GRAY)
-                mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)[1]
+                mask = cv2.cvtColor(overlay, cv2.COLOR_BGR2GRAY, dst=pool.get(output_shape[:2]))
+                cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY, dst=mask)
+                inverse_mask = cv2.bitwise_not(mask, dst=pool.get(output_shape[:2]))
                 # Make all coloured areas of the mask completely black on the main frame
-                output_frame = cv2.bitwise_and(output_frame, output_frame, mask=cv2.bitwise_not(mask))
+                cv2.subtract(output_frame, output_frame, dst=output_frame, mask=mask)
                 # Make transparent areas of the overlay completely black
-                overlay = cv2.bitwise_and(overlay, overlay, mask=mask)
-                # For each channel, add the overlay to the main frame (where the mask is not black)
-                for i in range(3):
-                    output_frame[:, :, i] = output_frame[:, :, i] + overlay[:, :, i]
+                cv2.subtract(overlay, overlay, dst=overlay, mask=inverse_mask)
+                # Add the overlay to the main frame (where the mask is not black)
+                cv2.add(output_frame, overlay, dst=output_frame)
             self.rendered_frame = output_frame
-            cv2.waitKey(1)
         elif self.mode == "monitor":
             ...
 
-        # Resize the frame to fit the desired resolution
-        self.rendered_frame = cv2.resize(self.rendered_frame, self.output_size, interpolation=cv2.INTER_AREA)
-        # Round the corners of the rendered frame
-        self.rendered_frame = manipulation.round_corners(self.rendered_frame, 25)
-        image = pygame.image.frombuffer(self.rendered_frame.tostring(), self.rendered_frame.shape[:2][::-1], "BGR")
-        # Add the image to the screen
-        self.screen.blit(image, (20, 20))
-
-        clicked = self.add_ui_elements()
-        if clicked != self.clicked_before:
-            self.clicked = clicked
-            self.handle_event(clicked)
-        self.clicked_before = clicked
-
-        # Add buttons and dropdowns to the screen
-        pygame.display.update()
+        for sink in self.sinks:
+            sink.write(frame if sink.board_only else self.rendered_frame)
 
     def handle_event(self, action):
         if action in colours:
@@ -299,111 +575,19 @@ class Driver:
         elif action in list(sizes.values()):
             self.pen_size = action
 
-    def add_ui_elements(self):
-        add_button((20, self.output_size[1] + 40), 100, 25, "Windowed", "#424242", "#D9D9D9", "#C4C4C4", self.screen)
-        i = 0
-        clicked = None
-        # Spacing between each icon
-        spacing = ((self.output_size[1]) // (len(colours) + len(sizes) + 3)) + 1
-        # Colours
-        for key, value in colours.items():
-            if add_icon_button(
-                (self.output_size[0] + spacing, 20 + spacing * i),
-                32, 32,
-                value[0], value[1],
-                ("assets/Pencil.png" if key == self.colour else "assets/Blank.png"),
-                self.screen
-            ):
-                clicked = key
-            i += 1
-        # Sizes
-        for key, value in sizes.items():
-            if add_icon_button(
-                (self.output_size[0] + spacing, 20 + spacing * i),
-                32, 32,
-                "#000000", "#000000",
-                "assets/" + key.capitalize() + ("Grey" if value == self.pen_size else "") + ".png",
-                self.screen
-            ):
-                clicked = value
-            i += 1
-        for icon in ["Undo", "Redo", "Help"]:
-            if add_icon_button(
-                (self.output_size[0] + spacing, 20 + spacing * i),
-                32, 32,
-                "#000000", "#000000",
-                "assets/" + icon + ".png",
-                self.screen
-            ):
-                clicked = icon
-            i += 1
-        return clicked
-
-    @staticmethod
-    def kill():
+    def kill(self):
         """Ends the program gracefully"""
-        cv2.destroyAllWindows()
-        screenspace.kill()
-        pygame.quit()
-
-
-def hex_to_rgb(hex_code):
-    """Converts a hex code to an RGB tuple"""
-    # Remove the # from the start of the hex code
-    hex_code = hex_code[1:]
-    # Split the hex code into 3 parts
-    hex_code = [hex_code[:2], hex_code[2:4], hex_code[4:]]
-    # Convert each part to an integer
-    hex_code = [int(n, 16) for n in hex_code]
-    return tuple(hex_code)
-
-
-def add_button(position, width, height, text, colour, background_colour, background_colour_hover, screen):
-    """Adds a button to the screen"""
-    colour, background_colour, background_colour_hover = hex_to_rgb(colour), hex_to_rgb(background_colour), hex_to_rgb(background_colour_hover)
-
-    # Create the background
-    button_background = pygame.Surface((width, height))
-    # Create the button rect
-    button_rect = pygame.Rect(position[0], position[1], width, height)
-
-    # If the mouse is over the button
-    if button_rect.collidepoint(pygame.mouse.get_pos()):
-        # Change the background colour
-        button_background.fill(background_colour_hover)
-    else:
-        # Change the background colour
-        button_background.fill(background_colour)
-
-    # Create the text
-    button_text = pygame.font.Font("assets/Roboto-regular.ttf", 16).render(text, True, colour)
-    # Add the text to the background
-    button_background.blit(button_text, (width // 2 - button_text.get_width() // 2, height // 2 - button_text.get_height() // 2))
-    screen.blit(button_background, position)
-    return button_rect.collidepoint(pygame.mouse.get_pos()) and pygame.mouse.get_pressed()[0]
-
-def add_icon_button(position, height, width, background_colour, background_colour_hover, image_path, screen):
-    """Creates a button in the desired location which displays an image"""
-    background_colour, background_colour_hover = hex_to_rgb(background_colour), hex_to_rgb(background_colour_hover)
-
-    # Create the background
-    button_background = pygame.Surface((width, height))
-    # Create the button rect
-    button_rect = pygame.Rect(position[0], position[1], width, height)
-
-    # If the mouse is over the button
-    if button_rect.collidepoint(pygame.mouse.get_pos()):
-        # Change the background colour
-        button_background.fill(background_colour_hover)
-    else:
-        # Change the background colour
-        button_background.fill(background_colour)
-
-    # Load the image
-    image = pygame.image.load(image_path)
-    # Resize the image to fit the button
-    image = pygame.transform.scale(image, (width, height))
-    # Add the image to the background
-    button_background.blit(image, (0, 0))
-    screen.blit(button_background, position)
-    return button_rect.collidepoint(pygame.mouse.get_pos()) and pygame.mouse.get_pressed()[0]
+        for sink in self.sinks:
+            sink.close()
+        if self.source is not None:
+            self.source.stop()
+        for worker in self.workers.values():
+            worker.stop()
+        if self.pen_server is not None:
+            self.pen_server.stop()
+        if self.idle_governor is not None:
+            report = self.idle_governor.report()
+            print(
+                f"Idle {100 * report['idle_fraction']:.0f}% of the time, using {report['idle_cpu']:.0f}% CPU "
+                f"while idle and {report['active_cpu']:.0f}% while active"
+            )
@@ -0,0 +1,338 @@
+"""
+An append-only log of every change to a board, for reviewing a session or recovering the board after a crash
+Events are written on a background thread in batches, and a keyframe of the whole board is written every so often,
+so loading the board (or the board at any point in time) only replays the events since the nearest keyframe
+Undo and redo are logged as just the area of the board they put back, so they cost about as much as the stroke did
+
+The log is laid out as:
+    header: magic, version, width, height
+    events, each: type, time (seconds since the epoch, or into the video for processed videos), payload length, payload
+An index alongside it (<log>.index) lists the time and offset of every keyframe
+"""
+
+import bisect
+import os
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+magic = b"WBEL"
+version = 1
+
+file_header = struct.Struct("<4sHHII")  # magic, version, padding, width, height
+event_header = struct.Struct("<BdI")  # type, time, payload length
+stroke_header = struct.Struct("<BBBBBH")  # path, kind, blue, green, red, size
+index_entry = struct.Struct("<dQ")  # time, offset
+patch_header = struct.Struct("<iiii")  # x1, y1, x2, y2
+
+# Event types
+begin = 1  # A stroke started. Payload: stroke_header
+extend = 2  # Points were drawn. Payload: stroke_header, then int16 x, y pairs
+erase = 3  # An eraser was picked up. Its points paint the background over the current path. Payload: path
+commit = 4  # The current path was added to the board. No payload
+undo = 5  # An area of the board was put back how it was. Payload: patch_header, then the area's PNG
+redo = 6  # As undo
+clear = 7  # The board was filled with a colour. Payload: blue, green, red
+keyframe = 8  # Payload: length of the board's PNG, the board's PNG, then the current path's PNG (if anything is on it)
+
+names = {begin: "begin", extend: "extend", erase: "erase", commit: "commit", undo: "undo", redo: "redo",
+         clear: "clear", keyframe: "keyframe"}
+kinds = {"draw": 0, "erase": 1}
+
+stylus_path_id = 255  # The path ID used for the stylus. Hands use their hand ID
+
+
+def encode_keyframe(drawing, layer):
+    board = cv2.imencode(".png", drawing)[1].tobytes()
+    path = cv2.imencode(".png", layer)[1].tobytes() if layer is not None and layer.any() else b""
+    return struct.pack("<I", len(board)) + board + path
+
+
+def encode_patch(bounds, patch):
+    data = cv2.imencode(".png", patch)[1].tobytes() if patch.size else b""
+    return patch_header.pack(*bounds) + data
+
+
+def decode_keyframe(payload):
+    """The board and current path stored in a keyframe"""
+    length = struct.unpack_from("<I", payload)[0]
+    drawing = cv2.imdecode(np.frombuffer(payload, np.uint8, length, 4), cv2.IMREAD_COLOR)
+    layer = None
+    if len(payload) > 4 + length:
+        layer = cv2.imdecode(np.frombuffer(payload, np.uint8, offset=4 + length), cv2.IMREAD_COLOR)
+    return drawing, layer
+
+
+def read_events(file, offset):
+    """Reads events from offset until the end of the log, yielding (type, time, payload, offset after the event)"""
+    file.seek(offset)
+    while True:
+        header = file.read(event_header.size)
+        if len(header) < event_header.size:
+            return
+        kind, event_time, length = event_header.unpack(header)
+        payload = file.read(length)
+        if len(payload) < length or kind not in names:
+            # Cut short by a crash
+            return
+        offset += event_header.size + length
+        yield kind, event_time, payload, offset
+
+
+class BoardTimeline:
+    """
+    Reads a board's log. state_at() gives the board at any time, replaying only the events since the nearest keyframe
+        timeline = BoardTimeline("board.wbl")
+        drawing, layer = timeline.state_at(time.time() - 60)  # The board a minute ago
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        header = self.file.read(file_header.size)
+        if len(header) < file_header.size:
+            raise ValueError(f"{path} is not a board log")
+        file_magic, file_version, _, self.width, self.height = file_header.unpack(header)
+        if file_magic != magic or file_version != version:
+            raise ValueError(f"{path} is not a board log this version understands")
+        self.keyframe_times, self.keyframe_offsets = self.read_index()
+        self.end = self.find_end()
+
+    def read_index(self):
+        """Reads the keyframe index, dropping entries for keyframes which never made it into the log"""
+        try:
+            with open(self.path + ".index", "rb") as index:
+                data = index.read()
+        except FileNotFoundError:
+            return self.rebuild_index()
+        entries = [index_entry.unpack_from(data, offset)
+                   for offset in range(0, len(data) - index_entry.size + 1, index_entry.size)]
+        size = os.path.getsize(self.path)
+        while entries and not self.is_keyframe(entries[-1][1], size):
+            entries.pop()
+        if not entries:
+            return self.rebuild_index()
+        return [entry[0] for entry in entries], [entry[1] for entry in entries]
+
+    def is_keyframe(self, offset, size):
+        if offset + event_header.size > size:
+            return False
+        for kind, _, _, _ in read_events(self.file, offset):
+            return kind == keyframe
+        return False
+
+    def rebuild_index(self):
+        """Finds every keyframe by reading the whole log. Only needed if the index is lost"""
+        times, offsets = [], []
+        offset = file_header.size
+        for kind, event_time, _, after in read_events(self.file, offset):
+            if kind == keyframe:
+                times.append(event_time)
+                offsets.append(offset)
+            offset = after
+        with open(self.path + ".index", "wb") as index:
+            index.write(b"".join(index_entry.pack(*entry) for entry in zip(times, offsets)))
+        return times, offsets
+
+    def find_end(self):
+        """The offset after the last complete event"""
+        end = self.keyframe_offsets[-1] if self.keyframe_offsets else file_header.size
+        for _, _, _, after in read_events(self.file, end):
+            end = after
+        return end
+
+    def state_at(self, at=None):
+        """The board and the current path (or None if empty) at a time, or at the end of the log"""
+        if not self.keyframe_offsets:
+            raise ValueError(f"{self.path} has no keyframes")
+        nearest = max(bisect.bisect_right(self.keyframe_times, at) - 1, 0) if at is not None else -1
+        drawing = layer = None
+        for kind, event_time, payload, after in read_events(self.file, self.keyframe_offsets[nearest]):
+            if after > self.end or (at is not None and event_time > at and drawing is not None):
+                break
+            if kind == keyframe:
+                drawing, layer = decode_keyframe(payload)
+                if layer is None:
+                    layer = np.zeros_like(drawing)
+            elif kind == extend:
+                _, _, blue, green, red, size = stroke_header.unpack_from(payload)
+                points = np.frombuffer(payload, "<i2", offset=stroke_header.size).reshape(-1, 2)
+                for x, y in points.tolist():
+                    cv2.circle(layer, (x, y), size, (blue, green, red), -1)
+            elif kind == commit:
+                # The same as manipulation.paste_non_black, without using the frame pool
+                np.copyto(drawing, layer, where=layer != 0)
+                layer[:] = 0
+            elif kind in (undo, redo) and len(payload) > patch_header.size:
+                # Logs from before undo was logged as an area have no payload, and a keyframe after instead
+                x1, y1, x2, y2 = patch_header.unpack_from(payload)
+                drawing[y1:y2, x1:x2] = cv2.imdecode(
+                    np.frombuffer(payload, np.uint8, offset=patch_header.size), cv2.IMREAD_COLOR
+                )
+            elif kind == clear and payload:
+                drawing[:] = tuple(payload)
+        return drawing, (layer if layer.any() else None)
+
+    def events(self, start=None, end=None):
+        """Every event between two times, as (name, time, payload)"""
+        for kind, event_time, payload, after in read_events(self.file, file_header.size):
+            if after > self.end or (end is not None and event_time > end):
+                return
+            if start is None or event_time >= start:
+                yield names[kind], event_time, payload
+
+    def close(self):
+        self.file.close()
+
+
+class EventLog:
+    """
+    Writes every change to a board to an append-only log at path
+    A keyframe is written after every keyframe_interval commits. Events are written in batches every batch_interval
+    seconds by a background thread, which also encodes keyframes and the areas put back by undo and redo, and synced
+    to disk at most every fsync_interval seconds (0 syncs every batch, None leaves it to the OS)
+    Events are timed with clock, which can be swapped for the time in a video when processing one
+    """
+    def __init__(self, path, keyframe_interval=50, batch_interval=0.1, fsync_interval=1.0, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.keyframe_interval = keyframe_interval
+        self.batch_interval = batch_interval
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.file = None
+        self.index = None
+        self.offset = 0
+        self.commits = 0  # Commits since the last keyframe
+        self.events_written = 0
+
+    def start(self, drawing):
+        """
+        Opens the log. If it already has a board in it, returns that board and its current path (or None), and
+        carries on after them. Otherwise, drawing is written as the first keyframe and None is returned
+        """
+        state = None
+        if os.path.exists(self.path) and os.path.getsize(self.path) > file_header.size:
+            timeline = BoardTimeline(self.path)
+            if (timeline.height, timeline.width) != drawing.shape[:2]:
+                timeline.close()
+                raise ValueError(f"{self.path} is a {timeline.width}x{timeline.height} board")
+            state = timeline.state_at()
+            self.offset = timeline.end
+            timeline.close()
+            # Only keep index entries for keyframes which made it into the log
+            with open(self.path + ".index", "wb") as index:
+                index.write(b"".join(
+                    index_entry.pack(*entry) for entry in zip(timeline.keyframe_times, timeline.keyframe_offsets)
+                ))
+            self.file = open(self.path, "r+b")
+            # Anything after the last complete event was cut short by a crash
+            self.file.truncate(self.offset)
+            self.file.seek(self.offset)
+        else:
+            self.file = open(self.path, "wb")
+            self.file.write(file_header.pack(magic, version, 0, drawing.shape[1], drawing.shape[0]))
+            self.offset = file_header.size
+            open(self.path + ".index", "wb").close()
+        self.index = open(self.path + ".index", "ab")
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+        if state is None:
+            self.keyframe(drawing)
+        return state
+
+    def add(self, kind, payload=b""):
+        self.queue.put((kind, self.clock(), payload))
+
+    def begin(self, path, kind, colour, size):
+        self.add(begin, stroke_header.pack(path, kinds[kind], *colour, size))
+
+    def extend(self, path, kind, colour, size, points):
+        points = np.clip(np.asarray(points, np.int32).reshape(-1, 2), -32768, 32767).astype("<i2")
+        self.add(extend, stroke_header.pack(path, kinds[kind], *colour, size) + points.tobytes())
+
+    def erase(self, path):
+        self.add(erase, struct.pack("<B", path))
+
+    def commit(self, drawing):
+        self.add(commit)
+        self.commits += 1
+        if self.commits >= self.keyframe_interval:
+            self.keyframe(drawing)
+
+    def undo(self, bounds, patch):
+        """
+        Logs an area of the board, at (x1, y1, x2, y2) bounds, being put back to patch. The patch isn't copied, so it
+        mustn't be changed afterwards (the undo history never changes its patches). It is encoded on the writer thread
+        """
+        self.queue.put((undo, self.clock(), (bounds, patch)))
+
+    def redo(self, bounds, patch):
+        """As undo"""
+        self.queue.put((redo, self.clock(), (bounds, patch)))
+
+    def clear(self, colour):
+        """Logs the board being filled with a (blue, green, red) colour"""
+        self.add(clear, bytes(colour))
+
+    def keyframe(self, drawing, layer=None):
+        """Queues a keyframe. The board is copied here, and encoded on the writer thread"""
+        self.commits = 0
+        self.queue.put((keyframe, self.clock(), (drawing.copy(), None if layer is None else layer.copy())))
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.file.close()
+            self.index.close()
+
+    def _write(self):
+        """The writer thread. Writes whatever has been queued every batch_interval seconds"""
+        last_sync = time.perf_counter()
+        while True:
+            items = [self.queue.get()]
+            if items[0] is not None:
+                time.sleep(self.batch_interval)
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            data = []
+            keyframes = []
+            for item in items:
+                if item is None:
+                    continue
+                kind, event_time, payload = item
+                if kind == keyframe:
+                    payload = encode_keyframe(*payload)
+                    keyframes.append(index_entry.pack(event_time, self.offset))
+                elif kind in (undo, redo):
+                    payload = encode_patch(*payload)
+                data.append(event_header.pack(kind, event_time, len(payload)))
+                data.append(payload)
+                self.offset += event_header.size + len(payload)
+                self.events_written += 1
+            if data:
+                self.file.write(b"".join(data))
+                self.file.flush()
+                # The index is only written once the keyframes it points to are in the log
+                if keyframes:
+                    self.index.write(b"".join(keyframes))
+                    self.index.flush()
+
+            stopping = any(item is None for item in items)
+            now = time.perf_counter()
+            if self.fsync_interval is not None and (stopping or now - last_sync >= self.fsync_interval):
+                os.fsync(self.file.fileno())
+                os.fsync(self.index.fileno())
+                last_sync = now
+            if stopping:
+                return
@@ -0,0 +1,78 @@
+"""
+Turns the gestures recognised each frame into debounced gesture-enter and gesture-exit events for each hand
+"""
+
+from modules import hands
+
+
+class GestureEvent:
+    """Something that happened to a hand's gesture - kind is either "enter" or "exit\""""
+    def __init__(self, kind, hand, gesture):
+        self.kind = kind
+        self.hand = hand
+        self.gesture = gesture
+
+    def __repr__(self):
+        return f"GestureEvent({self.kind!r}, {self.hand}, {self.gesture!r})"
+
+
+class GestureTracker:
+    """
+    A state machine for each hand's gesture
+    A gesture has to be seen for enter_frames frames in a row before it is recognised, and a recognised gesture
+    ends once something else (or no hand at all) has been seen for exit_frames frames in a row
+    """
+    def __init__(self, max_hands=2, enter_frames=11, exit_frames=1):
+        self.max_hands = max_hands
+        self.enter_frames = enter_frames
+        self.exit_frames = exit_frames
+
+        self.candidates = [None for _ in range(max_hands)]  # The gesture each hand showed last frame
+        self.candidate_frames = [0 for _ in range(max_hands)]  # How many frames in a row it has been shown
+        self.current = [None for _ in range(max_hands)]  # The recognised gesture of each hand
+        self.exit_count = [0 for _ in range(max_hands)]  # Frames in a row the recognised gesture hasn't been seen
+
+    def update_from_landmarks(self, landmarks, ids=None):
+        """
+        Classifies every hand in a (hands, 21, 3) landmark array and updates the state machines
+        ids is the stable ID of each hand (from a HandTracker), which picks its state machine. Otherwise the hands
+        are used in the order they are given
+        """
+        masks, names = hands.classify_hands(landmarks)
+        if ids is None:
+            return self.update(list(names))
+        by_id = [None for _ in range(self.max_hands)]
+        for hand_id, name in zip(ids, names):
+            if 0 <= hand_id < self.max_hands:
+                by_id[hand_id] = name
+        return self.update(by_id)
+
+    def update(self, names):
+        """
+        Updates the state machines with the raw gesture of every hand this frame (hands past the end are missing)
+        Returns a list of GestureEvents, with exits before enters
+        """
+        exits, enters = [], []
+        for hand in range(self.max_hands):
+            name = names[hand] if hand < len(names) else None
+            if name == self.candidates[hand]:
+                self.candidate_frames[hand] += 1
+            else:
+                self.candidates[hand] = name
+                self.candidate_frames[hand] = 1
+
+            # End the current gesture if it hasn't been seen for long enough
+            if self.current[hand] is not None and name != self.current[hand]:
+                self.exit_count[hand] += 1
+                if self.exit_count[hand] >= self.exit_frames:
+                    exits.append(GestureEvent("exit", hand, self.current[hand]))
+                    self.current[hand] = None
+            else:
+                self.exit_count[hand] = 0
+
+            # Start a new gesture once it has been held for long enough
+            if self.current[hand] is None and name is not None and self.candidate_frames[hand] >= self.enter_frames:
+                self.current[hand] = name
+                self.exit_count[hand] = 0
+                enters.append(GestureEvent("enter", hand, name))
+        return exits + enters
@@ -3,8 +3,9 @@ Fetches and manages the points on the user's hand in 3D space
 """
 
 import cv2
-import mediapipe as mp
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+import numpy as np
+
+from modules.buffers import pool
 
 
 class HandModel:
@@ -67,27 +68,80 @@ class PinkyFinger(HandModel):
         self.name = "pinky"
 
 
-def hand_to_name(arr: list[bool]):
-    """Converts a list of fingers which are extended to a hand model"""
-    for handType in [Fist(), Spread(), Peace(), IndexFinger(), MiddleFinger(), RingFinger(), PinkyFinger()]:
-        if arr == handType.value:
-            return handType.name
-    return "unknown"
+hand_models = [Fist(), Spread(), Peace(), IndexFinger(), MiddleFinger(), RingFinger(), PinkyFinger()]
+
+# Each finger is one bit of a mask (thumb = 1, index = 2, middle = 4, ring = 8, pinky = 16)
+finger_bits = 1 << np.arange(5)
 
+# Looks up the name of a hand model from its mask. Masks which aren't a known model are "unknown"
+gesture_names = np.array(["unknown" for _ in range(32)], dtype=object)
+for model in hand_models:
+    gesture_names[int(np.dot(np.array(model.value, dtype=bool), finger_bits))] = model.name
 
-mpHands = mp.solutions.hands
-hands = mpHands.Hands(
-    static_image_mode=False,
-    max_num_hands=4,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.3
-)
-mpDraw = mp.solutions.drawing_utils
+
+def fingers_to_mask(arr) -> int:
+    """Converts a list of which fingers are extended to a bitmask"""
+    return int(np.dot(np.asarray(arr, dtype=bool), finger_bits))
+
+
+def hand_to_name(arr: list[bool]):
+    """Converts a list of fingers which are extended to a hand model"""
+    return gesture_names[fingers_to_mask(arr)]
+
+
+# MediaPipe is slow to import and the model is slow to build, so both are done by load_model when first needed
+mpHands = None
+hands = None
+mpDraw = None
+max_hands = 4  # The most hands the model looks for. Change it with set_max_hands()
+
+
+def load_model():
+    """Builds the MediaPipe hands model if it hasn't been built already"""
+    global mpHands, hands, mpDraw
+    if hands is None:
+        import mediapipe as mp
+        mpHands = mp.solutions.hands
+        hands = mpHands.Hands(
+            static_image_mode=False,
+            max_num_hands=max_hands,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.3
+        )
+        mpDraw = mp.solutions.drawing_utils
+    return hands
+
+
+def reset_tracking():
+    """
+    Forgets the hands being tracked, so the next frame is searched from scratch rather than following on from the hands
+    in the frame before it (such as when the next frame isn't the one after the last)
+    """
+    if hands is not None:
+        hands.reset()
+
+
+def set_max_hands(count):
+    """Changes how many hands the model looks for. The model is rebuilt the next time it is used"""
+    global max_hands, hands
+    if count != max_hands:
+        max_hands = count
+        if hands is not None:
+            hands.close()
+            hands = None
+
+
+def warm_up(frame):
+    """
+    Runs one inference so MediaPipe's first-inference delay happens now, rather than on the first real frame
+    This may run on a background thread, so it doesn't use the shared buffer pool
+    """
+    load_model().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
 
 def render_hand_points(frame, results, debug):
     """Shows a dot on the each point on the users hand"""
-    if debug and results.multi_hand_landmarks:
+    if debug and results is not None and results.multi_hand_landmarks:
         for handLms in results.multi_hand_landmarks:
             for landmark_id, lm in enumerate(handLms.landmark):
                 h, w, c = frame.shape
@@ -98,6 +152,16 @@ def render_hand_points(frame, results, debug):
     return frame
 
 
+def render_hand_array(frame, landmarks, debug):
+    """Shows a dot on each point of every hand in a (hands, 21, 3) landmark array"""
+    if debug:
+        h, w, c = frame.shape
+        for hand in landmarks:
+            for x, y, z in hand:
+                cv2.circle(frame, (int(x * w), int(y * h)), 3, (255, 0, 255), cv2.FILLED)
+    return frame
+
+
 def from_list(l, a):
     """Gets the values from a list at the indexes in a"""
     return [l[i] for i in a]
@@ -105,14 +169,26 @@ def from_list(l, a):
 
 def get_hand_points(frame):
     """Gets the points on the user's hand"""
-    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = hands.process(img_rgb)
+    img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=pool.get(frame.shape))
+    results = load_model().process(img_rgb)
     landmarks = results.multi_hand_landmarks
     if landmarks:
         return landmarks, results
     return landmarks, results
 
 
+def detect_array(frame, handedness=False):
+    """
+    Finds the hands in a frame and returns them as a (hands, 21, 3) landmark array
+    With handedness, the handedness of each hand (see handedness_to_array) is returned as well
+    This is used by worker processes, so it doesn't use the shared buffer pool
+    """
+    results = load_model().process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    if handedness:
+        return landmarks_to_array(results.multi_hand_landmarks), handedness_to_array(results)
+    return landmarks_to_array(results.multi_hand_landmarks)
+
+
 def to_videospace_coords(landmarks, width, height):
     """Converts the landmarks to the screen space coordinates"""
     # Landmarks are from [-1 to 1], with x y and z. We need to convert this to the screen space coordinates
@@ -129,23 +205,47 @@ def to_videospace_coords(landmarks, width, height):
     return output
 
 
+def landmarks_to_array(hand_landmarks):
+    """Converts MediaPipe's hand landmarks to a (hands, 21, 3) array of x, y and z"""
+    if not hand_landmarks:
+        return np.zeros((0, 21, 3), np.float32)
+    return np.array(
+        [[(point.x, point.y, point.z) for point in hand.landmark] for hand in hand_landmarks], dtype=np.float32
+    )
+
+
+def handedness_to_array(results):
+    """Gets the handedness of each hand MediaPipe found, as an array of 0 for left and 1 for right"""
+    if results is None or not results.multi_handedness:
+        return np.zeros(0, np.int8)
+    return np.array(
+        [hand.classification[0].label == "Right" for hand in results.multi_handedness], dtype=np.int8
+    )
+
+
+def get_extended_fingers_array(landmarks):
+    """
+    Gets how extended each finger is for every hand at once, from a (hands, 21, 3) array
+    Returns a (hands, 5) array, where a positive value means the finger is extended. The thumb is always 0
+    """
+    # Each finger is written as points [1,2,3,4], [5,6,7,8] etc
+    fingers = landmarks[:, 1:21].reshape(-1, 5, 4, 3)
+    # Get the dot product of the vector from points 0 to 1 with the vector from 2 to 3
+    vector1 = fingers[:, :, 1] - fingers[:, :, 0]
+    vector2 = fingers[:, :, 3] - fingers[:, :, 2]
+    raised = np.einsum("hfc,hfc->hf", vector1, vector2)
+    raised[:, 0] = 0
+    return raised
+
+
+def classify_hands(landmarks):
+    """Gets the finger mask and gesture name of every hand in a (hands, 21, 3) array"""
+    masks = (get_extended_fingers_array(landmarks) > 0) @ finger_bits
+    return masks, gesture_names[masks]
+
+
 def get_extended_fingers(landmarks):
     """Gets a list of which fingers are extended"""
-    # Each finger is written as points [1,2,3,4], [5,6,7,8] etc
-    landmarks = landmarks.landmark
-    fingers = [landmarks[x:x + 4] for x in range(1, 20, 4)]
-    raised = [False for _ in range(5)]
-    for finger in fingers:
-        # Get the dot product of points 0 and 1 with 2 and 3
-        # If the dot product is negative, the finger is extended
-
-        # Get the vector from 0 to 1
-        vector1 = [finger[1].x - finger[0].x, finger[1].y - finger[0].y, finger[1].z - finger[0].z]
-        # Get the vector from 2 to 3
-        vector2 = [finger[3].x - finger[2].x, finger[3].y - finger[2].y, finger[3].z - finger[2].z]
-        # Get the dot product
-        dot_product = vector1[0] * vector2[0] + vector1[1] * vector2[1] + vector1[2] * vector2[2]
-        # Set the variable
-        raised[fingers.index(finger)] = dot_product
+    raised = get_extended_fingers_array(landmarks_to_array([landmarks]))[0].tolist()
     raised[0] = False
     return raised
@@ -0,0 +1,80 @@
+"""
+Gives each hand a stable ID across frames, as MediaPipe returns the hands it finds in no particular order
+"""
+
+import numpy as np
+
+# The wrist and the knuckle of each finger, which together give the centre of the palm
+palm_landmarks = [0, 5, 9, 13, 17]
+
+
+class HandTracker:
+    """
+    Matches the hands found each frame to the hands found before, by how close their wrists and palms are
+    Hands reported with a different handedness are matched only if nothing else is close. A hand which disappears
+    keeps its ID for grace_frames frames, in case it comes back (such as after motion blur)
+    IDs are 0 to max_ids - 1, so per-hand state can be kept in lists or arrays of that length
+    """
+    def __init__(self, max_ids=8, grace_frames=10, max_distance=0.15, handedness_penalty=0.1):
+        self.max_ids = max_ids
+        self.grace_frames = grace_frames
+        self.max_distance = max_distance  # As a fraction of the frame
+        self.handedness_penalty = handedness_penalty
+
+        # The state of every ID, one row each
+        self.positions = np.zeros((max_ids, 2, 2), np.float32)  # Wrist and palm centre
+        self.handedness = np.full(max_ids, -1, np.int8)  # 0 left, 1 right, -1 unknown
+        self.missing = np.full(max_ids, grace_frames + 1, np.int32)  # Frames since each ID was last seen
+        self.ids = np.zeros(0, np.int32)  # The ID of each hand found on the last update
+
+    @property
+    def active(self):
+        """Which IDs are currently in use (including any within their grace period)"""
+        return self.missing <= self.grace_frames
+
+    def update(self, landmarks, handedness=None):
+        """
+        Takes a (hands, 21, 3) landmark array and optionally the handedness of each hand
+        Returns an array of the ID of each hand. Hands which couldn't be given an ID (if they all are in use) get -1
+        """
+        count = len(landmarks)
+        if handedness is None or len(handedness) != count:
+            handedness = np.full(count, -1, np.int8)
+        positions = np.stack([landmarks[:, 0, :2], landmarks[:, palm_landmarks, :2].mean(axis=1)], axis=1) \
+            if count else np.zeros((0, 2, 2), np.float32)
+
+        self.missing += 1
+        ids = np.full(count, -1, np.int32)
+        active = np.flatnonzero(self.missing <= self.grace_frames + 1)
+        if count and len(active):
+            # The cost of matching every hand to every active ID, all at once
+            cost = np.linalg.norm(positions[:, None] - self.positions[None, active], axis=3).mean(axis=2)
+            known = (handedness[:, None] >= 0) & (self.handedness[None, active] >= 0)
+            cost += self.handedness_penalty * (known & (handedness[:, None] != self.handedness[None, active]))
+            # Match the closest pairs first. There are only ever a few hands, so this is as good as optimal matching
+            for flat in np.argsort(cost, axis=None):
+                hand, slot = divmod(int(flat), len(active))
+                if cost[hand, slot] > self.max_distance:
+                    break
+                if ids[hand] < 0 and active[slot] not in ids:
+                    ids[hand] = active[slot]
+
+        # New hands take the IDs which have been free the longest
+        free = [int(slot) for slot in np.argsort(-self.missing) if self.missing[slot] > self.grace_frames + 1]
+        for hand in np.flatnonzero(ids < 0):
+            if free:
+                ids[hand] = free.pop(0)
+                self.handedness[ids[hand]] = -1
+
+        seen = ids >= 0
+        self.positions[ids[seen]] = positions[seen]
+        self.handedness[ids[seen]] = np.where(handedness[seen] >= 0, handedness[seen], self.handedness[ids[seen]])
+        self.missing[ids[seen]] = 0
+        self.ids = ids
+        return ids
+
+    def reset(self):
+        """Forgets every hand"""
+        self.missing[:] = self.grace_frames + 1
+        self.handedness[:] = -1
+        self.ids = np.zeros(0, np.int32)
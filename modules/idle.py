@@ -0,0 +1,83 @@
+"""
+Notices when nothing is happening in front of the camera, so detection and rendering can be skipped to save power
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from modules.buffers import pool
+
+
+class IdleGovernor:
+    """
+    Compares each frame to the last one at a tiny size, which costs next to nothing. Each pixel of the tiny frame is
+    the average of a block of the real one, so a block changing is motion, while noise averages out
+    Comparing blocks rather than the whole frame means something small moving (like a pen) isn't lost in the average
+    Once there has been no motion (and no hands or stylus) for idle_after seconds, update() starts returning True,
+    and wait() slows the loop down to idle_fps. As soon as a frame differs from the last, it returns False again
+    """
+    def __init__(self, idle_after=5, idle_fps=4, threshold=12, min_blocks=2, size=(160, 90)):
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        self.threshold = threshold  # Change in a block's brightness (0-255) which counts as motion
+        self.min_blocks = min_blocks  # How many blocks have to change, so a single flickering one is ignored
+        self.size = size
+
+        self.previous = None  # The last tiny greyscale frame
+        self.current = None  # The buffer the next tiny frame is made in, swapped with previous after each frame
+        self.last_activity = time.perf_counter()
+        self.idle = False
+        self.last_update = time.perf_counter()
+
+        # Time spent idle and active, and the CPU time used in each, for report()
+        self.wall_time = {True: 0.0, False: 0.0}
+        self.cpu_time = {True: 0.0, False: 0.0}
+        self.last_cpu = time.process_time()
+
+    def update(self, frame, active=False):
+        """
+        Checks a frame for motion. active should be True if hands or the stylus are in use
+        Returns if the driver is idle, and so can reuse its last results
+        """
+        tiny = cv2.resize(frame, self.size, dst=pool.get(self.size[::-1] + frame.shape[2:]), interpolation=cv2.INTER_AREA)
+        grey = cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY, dst=self.current)
+        if self.previous is None:
+            moved = True
+        else:
+            difference = cv2.absdiff(grey, self.previous, dst=pool.get(grey.shape))
+            moved = np.count_nonzero(difference > self.threshold) >= self.min_blocks
+        self.previous, self.current = grey, self.previous
+
+        now = time.perf_counter()
+        self.record(now)
+        if moved or active:
+            self.last_activity = now
+        self.idle = now - self.last_activity > self.idle_after
+        return self.idle
+
+    def wait(self):
+        """While idle, sleeps until the next frame is due at idle_fps"""
+        if self.idle:
+            remaining = 1 / self.idle_fps - (time.perf_counter() - self.last_update)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def record(self, now):
+        """Adds the time since the last update to the idle or active totals"""
+        cpu = time.process_time()
+        self.wall_time[self.idle] += now - self.last_update
+        self.cpu_time[self.idle] += cpu - self.last_cpu
+        self.last_update, self.last_cpu = now, cpu
+
+    def report(self):
+        """How much time was spent idle, and the CPU use (as a percentage of one core) while idle and active"""
+        def usage(idle):
+            return 100 * self.cpu_time[idle] / self.wall_time[idle] if self.wall_time[idle] else 0.0
+        total = self.wall_time[True] + self.wall_time[False]
+        return {
+            "idle_fraction": self.wall_time[True] / total if total else 0.0,
+            "idle_cpu": usage(True),
+            "active_cpu": usage(False)
+        }
@@ -4,7 +4,8 @@ Manipulates the video feed and creates the matrices for transforming points in a
 
 import cv2
 import numpy as np
-import tkinter as tk
+
+from modules.buffers import pool
 
 
 class OverlayOptions:
@@ -14,13 +15,17 @@ class OverlayOptions:
 
 
 def generate_warp_matrix(source_image, new_corners, fit_option: OverlayOptions = OverlayOptions.STRETCH):
-    """Generates a matrix from the corners of the screen to the corners of the codes"""
+    """
+    Generates a matrix from the corners of the screen to the corners of the codes
+    source_image can be an image, or just its shape
+    """
+    shape = getattr(source_image, "shape", source_image)
     # Create a matrix which maps the points of sourceImage to the points of newCorners
     image_corners = np.array([
         [0, 0],
-        [source_image.shape[1], 0],
-        [source_image.shape[1], source_image.shape[0]],
-        [0, source_image.shape[0]]
+        [shape[1], 0],
+        [shape[1], shape[0]],
+        [0, shape[0]]
     ], dtype="float32")
     screen_corners = np.array([
         [new_corners[0][0], new_corners[0][1]],
@@ -50,22 +55,123 @@ def find_new_coordinate(point, warp_matrix):
 
 def warp_image(image, warp_matrix, dimensions, fit_option: OverlayOptions = OverlayOptions.STRETCH):
     """Takes an image and a warp matrix and returns the image warped to the new position"""
-    return cv2.warpPerspective(image, warp_matrix, (dimensions[1], dimensions[0]))
-
-
-def overlay_image(base, overlay, warp_matrix, fit_option: OverlayOptions = OverlayOptions.STRETCH):
-    """Adds an image to another image"""
-    warped_image = warp_image(overlay, warp_matrix, base.shape[:2])
-    # Generate a mask by making every pixel is not transparent pure black
-    # This does not work with translucent images
-    mask = cv2.cvtColor(warped_image, cv2.COLOR_BGR2GRAY)
-    mask = cv2.threshold(mask, 1, 255, cv2.THRESH_BINARY)[1]
-
-    # Apply the mask to the background image
-    base = cv2.bitwise_and(base, base, mask=cv2.bitwise_not(mask))
-    # Then add the overlay to the background
-    base = cv2.addWeighted(base, 1, warped_image, 1, 0)
-
+    warped = pool.get((dimensions[0], dimensions[1]) + image.shape[2:], image.dtype)
+    return cv2.warpPerspective(image, warp_matrix, (dimensions[1], dimensions[0]), dst=warped)
+
+
+class WarpCache:
+    """
+    Everything needed to warp an image onto a quad, limited to the quad's bounding box (the region of interest)
+    While the warp matrix stays the same, the remap tables and the quad mask are reused instead of being recalculated
+    """
+    def __init__(self, warp_matrix, source_shape, base_shape):
+        self.warp_matrix = warp_matrix
+        self.source_shape = source_shape[:2]
+        self.base_shape = base_shape[:2]
+        self.uses = 0
+        self.maps = None
+
+        # Find where the corners of the source end up, and the box around them
+        source_corners = np.array([[
+            [0, 0], [source_shape[1], 0], [source_shape[1], source_shape[0]], [0, source_shape[0]]
+        ]], dtype=np.float32)
+        self.quad = cv2.perspectiveTransform(source_corners, warp_matrix.astype(np.float32))[0]
+        x, y, width, height = cv2.boundingRect(self.quad)
+        # Clip the box to the base image
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, base_shape[1]), min(y + height, base_shape[0])
+        self.roi = (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+        if self.roi is None:
+            return
+
+        # Shift the warp so it draws into the region of interest rather than the whole base image
+        shift = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+        self.roi_matrix = shift @ warp_matrix
+        # Pixels inside the quad are covered by the overlay
+        self.mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        cv2.fillPoly(self.mask, [np.round(self.quad - (x0, y0)).astype(np.int32)], 255)
+
+    def matches(self, warp_matrix, source_shape, base_shape, tolerance=0.25):
+        """Checks if this cache can be used for a warp. Corners moving less than tolerance pixels count as the same"""
+        if source_shape[:2] != self.source_shape or base_shape[:2] != self.base_shape:
+            return False
+        if warp_matrix is self.warp_matrix or np.array_equal(warp_matrix, self.warp_matrix):
+            return True
+        source_corners = np.array([[
+            [0, 0], [source_shape[1], 0], [source_shape[1], source_shape[0]], [0, source_shape[0]]
+        ]], dtype=np.float32)
+        quad = cv2.perspectiveTransform(source_corners, warp_matrix.astype(np.float32))[0]
+        return bool(np.all(np.abs(quad - self.quad) < tolerance))
+
+    def warp(self, image):
+        """Warps an image into the region of interest"""
+        x0, y0, x1, y1 = self.roi
+        output = pool.get((y1 - y0, x1 - x0) + image.shape[2:], image.dtype)
+        self.uses += 1
+        if self.uses == 1 or abs(np.linalg.det(self.roi_matrix)) < 1e-12:
+            # The matrix may only be used once, so building remap tables wouldn't pay off yet
+            return cv2.warpPerspective(image, self.roi_matrix, (x1 - x0, y1 - y0), dst=output)
+        if self.maps is None:
+            # For every pixel in the region, find where it comes from in the source image
+            inverse = np.linalg.inv(self.roi_matrix)
+            grid_x, grid_y = np.meshgrid(np.arange(x1 - x0, dtype=np.float32), np.arange(y1 - y0, dtype=np.float32))
+            points = np.stack([grid_x, grid_y], axis=-1).reshape(1, -1, 2)
+            source_points = cv2.perspectiveTransform(points, inverse).reshape(y1 - y0, x1 - x0, 2)
+            self.maps = cv2.convertMaps(source_points, None, cv2.CV_16SC2)
+        return cv2.remap(image, self.maps[0], self.maps[1], cv2.INTER_LINEAR, dst=output)
+
+
+# The most recent warps, newest first. One is kept for each board in view, and a new one is only made when a board moves
+warp_caches = []
+max_warp_caches = 8
+
+
+def get_warp_cache(warp_matrix, source_shape, base_shape):
+    """Gets the cached warp for a matrix, making a new one if no cached warp matches it"""
+    for index, cache in enumerate(warp_caches):
+        if cache.matches(warp_matrix, source_shape, base_shape):
+            if index:
+                warp_caches.insert(0, warp_caches.pop(index))
+            return cache
+    warp_caches.insert(0, WarpCache(warp_matrix, source_shape, base_shape))
+    del warp_caches[max_warp_caches:]
+    return warp_caches[0]
+
+
+def overlay_image(base, overlay, warp_matrix, fit_option: OverlayOptions = OverlayOptions.STRETCH, in_place=False):
+    """
+    Adds an image to another image, stretched between the corners given by the warp matrix
+    3 channel overlays cover everything inside the corners. 4 channel (BGRA) overlays are blended using their alpha
+    With in_place, the overlay is drawn straight onto base (only inside the quad's bounding box), rather than a copy
+    """
+    output = base if in_place else pool.copy(base)
+    cache = get_warp_cache(warp_matrix, overlay.shape, base.shape)
+    if cache.roi is None:
+        # The overlay is entirely off screen
+        return output
+    x0, y0, x1, y1 = cache.roi
+    region = output[y0:y1, x0:x1]
+    warped_image = cache.warp(overlay)
+
+    if overlay.shape[2] == 4:
+        # Blend using the alpha channel. Outside the quad the warped alpha is 0, so the base shows through
+        alpha = cv2.extractChannel(warped_image, 3, dst=pool.get(warped_image.shape[:2]))
+        weights = np.multiply(alpha, np.float32(1 / 255), out=pool.get(alpha.shape, np.float32))
+        inverse_weights = np.subtract(np.float32(1), weights, out=pool.get(alpha.shape, np.float32))
+        colour = cv2.cvtColor(warped_image, cv2.COLOR_BGRA2BGR, dst=pool.get(region.shape, region.dtype))
+        cv2.blendLinear(colour, pool.copy(region), weights, inverse_weights, dst=region)
+    else:
+        # Copy the overlay onto the base everywhere inside the quad
+        cv2.copyTo(warped_image, cache.mask, region)
+
+    return output
+
+
+def paste_non_black(base, layer):
+    """Copies every non black pixel of layer onto base, in place. Each channel is treated separately"""
+    mask = pool.get(layer.shape, np.bool_)
+    np.not_equal(layer, 0, out=mask)
+    np.copyto(base, layer, where=mask)
     return base
 
 
@@ -77,32 +183,60 @@ def create_image_with_dimensions(width, height, colour=(0, 0, 0)):
 
 def get_monitor_dimensions():
     """Get the height and width of the users monitor. This should work on Windows, Mac, and Linux"""
+    # Tk is only needed here, so it isn't imported until the monitor is actually used
+    import tkinter as tk
     root = tk.Tk()
     width = root.winfo_screenwidth()
     height = root.winfo_screenheight()
     root.destroy()
     return width, height
 
+# Rounded corner masks, by (image shape, radius). These only change when the window size does
+rounded_corner_masks = {}
+
+
+def get_rounded_corner_mask(shape, radius):
+    """Gets a mask which is white everywhere apart from outside the rounded corners"""
+    key = (tuple(shape), radius)
+    if key not in rounded_corner_masks:
+        mask = np.zeros(shape, np.uint8)
+        height, width = shape[:2]
+        # Draw a rectangle with rounded corners
+        # Draw a circle in each corner
+        cv2.circle(mask, (radius, radius), radius, (255, 255, 255), -1)
+        cv2.circle(mask, (width - radius, radius), radius, (255, 255, 255), -1)
+        cv2.circle(mask, (radius, height - radius), radius, (255, 255, 255), -1)
+        cv2.circle(mask, (width - radius, height - radius), radius, (255, 255, 255), -1)
+        # Fill in the inside with rectangles
+        cv2.rectangle(mask, (radius, 0), (width - radius, height), (255, 255, 255), -1)
+        cv2.rectangle(mask, (0, radius), (width, height - radius), (255, 255, 255), -1)
+        rounded_corner_masks[key] = mask
+    return rounded_corner_masks[key]
+
+
 def round_corners(image, radius):
     """Rounds the corner of the image by the specified radius"""
-    # Create a mask with rounded corners
-    mask = create_image_with_dimensions(image.shape[1], image.shape[0], (0, 0, 0))
-    # Convert to a CV2 image
-    mask = np.array(mask, dtype=np.uint8)
-    # Convert to a 3 channel image
-    mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
-
-    # Draw a rectangle with rounded corners
-    cv2.rectangle(mask, (0, 0), (image.shape[1], image.shape[0]), (0, 0, 0), -1)
-    # Draw a circle in each corner
-    cv2.circle(mask, (radius, radius), radius, (255, 255, 255), -1)
-    cv2.circle(mask, (image.shape[1] - radius, radius), radius, (255, 255, 255), -1)
-    cv2.circle(mask, (radius, image.shape[0] - radius), radius, (255, 255, 255), -1)
-    cv2.circle(mask, (image.shape[1] - radius, image.shape[0] - radius), radius, (255, 255, 255), -1)
-    # Fill in the inside with rectangles
-    cv2.rectangle(mask, (radius, 0), (image.shape[1] - radius, image.shape[0]), (255, 255, 255), -1)
-    cv2.rectangle(mask, (0, radius), (image.shape[1], image.shape[0] - radius), (255, 255, 255), -1)
-
+    mask = get_rounded_corner_mask(image.shape, radius)
     # Apply the mask to the image
-    image = cv2.bitwise_and(image, mask)
-    return image
+    return cv2.bitwise_and(image, mask, dst=pool.get(image.shape, image.dtype))
+
+
+def resize_and_flip(image, size, flip_horizontal=False, flip_vertical=False):
+    """
+    Resizes an image to size (width, height), flipping it at the same time
+    Flips are folded into a single affine warp, so the image is only resampled once
+    """
+    output = pool.get((size[1], size[0]) + image.shape[2:], image.dtype)
+    if not flip_horizontal and not flip_vertical:
+        return cv2.resize(image, size, dst=output, interpolation=cv2.INTER_LINEAR)
+    scale_x, scale_y = size[0] / image.shape[1], size[1] / image.shape[0]
+    # Map pixel centres onto pixel centres, mirroring them if the image is flipped
+    matrix = np.array([
+        [scale_x, 0, (scale_x - 1) / 2],
+        [0, scale_y, (scale_y - 1) / 2]
+    ], dtype=np.float64)
+    if flip_horizontal:
+        matrix[0] = [-scale_x, 0, size[0] - 1 - matrix[0, 2]]
+    if flip_vertical:
+        matrix[1] = [0, -scale_y, size[1] - 1 - matrix[1, 2]]
+    return cv2.warpAffine(image, matrix, size, dst=output, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
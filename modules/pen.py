@@ -0,0 +1,107 @@
+"""
+A small local HTTP server for the phone stylus page
+It serves the page itself, and receives touch start/end events from it, so the pen state is known as soon as the
+screen is touched rather than once marker 5 has been seen by the camera
+"""
+
+import functools
+import json
+import threading
+import time
+import urllib.request
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PenState:
+    """The latest pen state reported by the phone. Safe to use from several threads"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down = False
+        self.event_time = None  # When the phone says the event happened, in its own clock (milliseconds)
+        self.received_at = None  # When the event arrived, from time.monotonic()
+        self.events = 0
+
+    def update(self, down, event_time):
+        """Records an event. Returns False if it is older than the last one (so arrived out of order) and was ignored"""
+        with self.lock:
+            if self.event_time is not None and event_time is not None and event_time < self.event_time:
+                return False
+            self.down = down
+            self.event_time = event_time
+            self.received_at = time.monotonic()
+            self.events += 1
+            return True
+
+
+class PenRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the stylus page, and accepts POST /pen with a body of {"down": bool, "time": milliseconds}"""
+    def __init__(self, *args, pen_state=None, **kwargs):
+        self.pen_state = pen_state
+        super().__init__(*args, **kwargs)
+
+    def end_headers(self):
+        # Allow the page to be opened from somewhere else (such as a file) and still send events here
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        super().end_headers()
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path != "/pen":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.pen_state.update(bool(body["down"]), body.get("time"))
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Requests arrive for every touch, so don't print them all
+        ...
+
+
+class PenEventServer:
+    """Runs the pen event server on a background thread"""
+    def __init__(self, port=8765, host="0.0.0.0", folder="tests/stylus"):
+        self.state = PenState()
+        handler = functools.partial(PenRequestHandler, pen_state=self.state, directory=folder)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def has_events(self):
+        """If the phone has sent anything yet. Until it has, the pen state comes from the camera instead"""
+        return self.state.events > 0
+
+    @property
+    def down(self):
+        return self.state.down
+
+
+def send_pen_event(url, down, event_time=None):
+    """
+    Sends a pen event the same way the stylus page does
+    This stands in for the phone, for testing the server without one
+    """
+    body = json.dumps({"down": down, "time": time.time() * 1000 if event_time is None else event_time}).encode()
+    request = urllib.request.Request(url.rstrip("/") + "/pen", data=body, headers={"Content-Type": "text/plain"})
+    with urllib.request.urlopen(request, timeout=1) as response:
+        return response.status
@@ -0,0 +1,124 @@
+"""
+Adjusts the driver's quality settings to hold a target frame rate, so each machine doesn't need tuning by hand
+"""
+
+import time
+
+# The settings the governor can change, grouped by the stage of the frame they speed up
+# Each setting goes through its values in order, from the best quality to the fastest
+knobs = {
+    "detection": {
+        "detection_scale": [1.0, 0.75, 0.5]
+    },
+    "hands": {
+        "hand_scale": [1.0, 0.75, 0.5],
+        "hand_interval": [1, 2, 3],
+        "max_hands": [4, 2, 1]
+    },
+    "render": {
+        "composite_scale": [1.0, 0.75, 0.5]
+    }
+}
+
+
+class QualityGovernor:
+    """
+    Watches how long each frame (and each stage of it) takes, and lowers or raises quality to hold target_fps
+    When the average frame rate over window frames is below target_fps * (1 - margin), a setting of the slowest stage
+    is lowered. Once it is above target_fps * (1 + margin) for twice as long, the last setting lowered is raised again
+    If raising a setting makes it too slow again straight away, the wait before the next raise is doubled
+    """
+    def __init__(self, target_fps=20, window=30, margin=0.1, log=print):
+        self.target_fps = target_fps
+        self.window = window
+        self.margin = margin
+        self.log = log
+
+        self.levels = {name: 0 for stage in knobs.values() for name in stage}  # Index of each setting's value
+        self.lowered = []  # Settings lowered so far, most recent last
+        self.frame_times = []
+        self.stage_times = {stage: [] for stage in knobs}
+        self.fast_frames = 0  # Frames in a row spent well above the target
+        self.at_lowest = False  # So running out of settings to lower is only logged once
+        self.raise_after = 2  # Windows above the target before raising quality
+        self.windows_since_raise = None
+        self.last_frame = None
+
+    def settings(self):
+        """The current value of every setting"""
+        return {name: self.value(name) for name in self.levels}
+
+    def value(self, name):
+        stage = next(stage for stage in knobs.values() if name in stage)
+        return stage[name][self.levels[name]]
+
+    def apply(self, driver):
+        """Sets every setting on the driver"""
+        for name, value in self.settings().items():
+            setattr(driver, name, value)
+
+    def update(self, driver):
+        """Called once a frame, after rendering. Changes the driver's settings if needed"""
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+            for stage in knobs:
+                self.stage_times[stage].append(driver.stage_times.get(stage, 0))
+        self.last_frame = now
+        if len(self.frame_times) < self.window:
+            return
+
+        fps = len(self.frame_times) / sum(self.frame_times)
+        stage_means = {stage: 1000 * sum(times) / len(times) for stage, times in self.stage_times.items()}
+        self.frame_times = []
+        self.stage_times = {stage: [] for stage in knobs}
+
+        if self.windows_since_raise is not None:
+            self.windows_since_raise += 1
+        if fps < self.target_fps * (1 - self.margin):
+            self.fast_frames = 0
+            if self.windows_since_raise == 1:
+                # The last raise was too much for this machine, so wait longer before trying again
+                self.raise_after = min(self.raise_after * 2, 64)
+            self.lower(fps, stage_means, driver)
+        elif fps > self.target_fps * (1 + self.margin):
+            self.fast_frames += self.window
+            # Raising quality is done more cautiously than lowering it, so it doesn't bounce between settings
+            if self.fast_frames >= self.raise_after * self.window and self.lowered:
+                self.fast_frames = 0
+                self.raise_quality(fps, stage_means, driver)
+        else:
+            self.fast_frames = 0
+
+    def pause(self):
+        """Stops the time until the next update counting as a frame, such as while the driver is idle"""
+        self.last_frame = None
+
+    def lower(self, fps, stage_means, driver):
+        """Lowers the least lowered setting of the slowest stage which can still be lowered"""
+        for stage in sorted(stage_means, key=stage_means.get, reverse=True):
+            options = [name for name in knobs[stage] if self.levels[name] < len(knobs[stage][name]) - 1]
+            if options:
+                name = min(options, key=lambda option: self.levels[option])
+                self.levels[name] += 1
+                self.lowered.append(name)
+                self.apply(driver)
+                self.log_decision("Lowered", name, fps, stage_means)
+                return
+        if not self.at_lowest:
+            self.at_lowest = True
+            self.log_decision("Already at the lowest quality", None, fps, stage_means)
+
+    def raise_quality(self, fps, stage_means, driver):
+        """Undoes the last setting lowered"""
+        self.at_lowest = False
+        self.windows_since_raise = 0
+        name = self.lowered.pop()
+        self.levels[name] -= 1
+        self.apply(driver)
+        self.log_decision("Raised", name, fps, stage_means)
+
+    def log_decision(self, action, name, fps, stage_means):
+        stages = ", ".join(f"{stage} {ms:.1f}ms" for stage, ms in stage_means.items())
+        change = f" {name} to {self.value(name)}" if name is not None else ""
+        self.log(f"Quality: {action}{change} ({fps:.1f} fps, target {self.target_fps}; {stages})")
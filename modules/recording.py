@@ -0,0 +1,116 @@
+"""
+Records sessions to a video file on a background thread, so encoding never holds up the main loop
+"""
+
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from modules.sinks import Sink
+
+codecs = {
+    "mp4": "mp4v",
+    "mjpeg": "MJPG"
+}
+
+
+class Recorder(Sink):
+    """
+    Sends frames to an encoder thread through a queue of at most max_queue frames
+    If the encoder falls behind, policy decides what happens: "drop" skips the new frame, "block" waits for space
+    Frames are written at their real time, so the video plays back at the right speed whatever rate the loop runs at
+    size is (width, height), and defaults to the size of the first frame
+    With board_only, the board (without the camera feed) is recorded instead of the rendered frame
+    """
+    def __init__(self, path, fps=30, size=None, codec="mp4", board_only=False, max_queue=30, policy="drop"):
+        self.path = path
+        self.fps = fps
+        self.size = size
+        self.fourcc = codecs.get(codec, codec)
+        self.board_only = board_only
+        self.policy = policy
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.free = queue.Queue()  # Buffers which have been encoded, so can be reused for new frames
+        self.thread = None
+        self.writer = None
+
+        self.received = 0
+        self.dropped = 0  # Frames skipped because the queue was full
+        self.written = 0  # Frames in the video, including repeats to fill time
+        self.total_lag = 0  # Seconds between frames being queued and encoded
+        self.max_lag = 0
+
+    def open(self, driver) -> None:
+        super().open(driver)
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def write(self, frame) -> None:
+        self.received += 1
+        if self.policy == "drop" and self.queue.full():
+            self.dropped += 1
+            return
+        # Frames come from the buffer pool and are reused next frame, so a copy has to be kept
+        try:
+            buffer = self.free.get_nowait()
+            if buffer.shape != frame.shape:
+                buffer = np.empty_like(frame)
+        except queue.Empty:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        self.queue.put((buffer, time.perf_counter()))
+
+    def _encode(self):
+        """The encoder thread. Runs until it is sent None"""
+        start = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, queued_at = item
+            if self.writer is None:
+                self.size = self.size or frame.shape[1::-1]
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.size)
+                start = queued_at
+            image = frame if frame.shape[1::-1] == tuple(self.size) else cv2.resize(frame, self.size)
+            # Repeat the frame until the video has caught up with when it was shown (frames arriving early are skipped)
+            while self.written <= (queued_at - start) * self.fps:
+                self.writer.write(image)
+                self.written += 1
+            self.free.put(frame)
+
+            lag = time.perf_counter() - queued_at
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self):
+        """How the recording is going - dropped frames, and how far behind the encoder is in milliseconds"""
+        encoded = self.received - self.dropped - self.queue.qsize()
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "written": self.written,
+            "queued": self.queue.qsize(),
+            "average_lag": 1000 * self.total_lag / max(encoded, 1),
+            "max_lag": 1000 * self.max_lag
+        }
+
+    def close(self) -> None:
+        if self.thread is not None:
+            # Finish encoding everything already queued
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        stats = self.stats()
+        print(
+            f"Recorded {stats['received'] - stats['dropped']} of {stats['received']} frames to {self.path} "
+            f"({stats['dropped']} dropped), encoder lag {stats['average_lag']:.1f}ms average, "
+            f"{stats['max_lag']:.1f}ms max"
+        )
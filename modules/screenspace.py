@@ -3,15 +3,10 @@ Manages the processing of where the codes are, and how the image should be posit
 """
 
 import cv2
-import imutils
 import numpy as np
-from imutils.video import VideoStream
 
-# Start the video stream
-vs = VideoStream(src=0).start()
-
-screenspace_corners = [(0, 0), (0, 0), (0, 0), (0, 0)]
-default_full_codes = [screenspace_corners for _ in range(4)]
+from modules import manipulation
+from modules.buffers import pool
 
 # College maybe?
 # aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_5X5_1000)
@@ -20,14 +15,16 @@ default_full_codes = [screenspace_corners for _ in range(4)]
 aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_5X5_1000)
 aruco_params = cv2.aruco.DetectorParameters()
 
-def get_current_frame():
-    """Gets the current frame from the webcam"""
-    # Get the video stream from the webcam
-    frame = vs.read()
+def get_current_frame(source):
+    """Gets the current frame from a frame source, such as the webcam"""
+    # Get the video stream from the source
+    frame = source.read()
+    if frame is None:
+        return None
     # frame = imutils.resize(frame, width=1000)
 
-    # Increase the brightness
-    frame = cv2.convertScaleAbs(frame, alpha=1.5, beta=0)
+    # Increase the brightness, writing into a pooled buffer rather than a new array
+    frame = cv2.convertScaleAbs(frame, dst=pool.get(frame.shape), alpha=1.5, beta=0)
 
     return frame
 
@@ -37,70 +34,179 @@ def vector_from(p1, p2):
     return [p2[0] - p1[0], p2[1] - p1[1]]
 
 
-def get_screenspace_points(frame, video_frame, debug, previous_full_codes) -> list[tuple[int, int]]:
-    """Gets the points of the codes in the screenspace"""
-    # Detect markers in the frame (Aruco 5x5 1000 0-3)
-    new_frame = frame.copy()
-    # Convert to greyscale
-    new_frame = cv2.cvtColor(new_frame, cv2.COLOR_BGR2GRAY)
-    new_frame = cv2.threshold(new_frame, 127, 255, cv2.THRESH_BINARY)[1]
-    (corners, ids, rejected) = cv2.aruco.detectMarkers(frame, aruco_dict, parameters=aruco_params)
+def find_markers(frame, scale=1.0):
+    """
+    Finds every marker in a frame in a single pass, returning the (4, 2) corners of each by its ID
+    With a scale below 1, the markers are found in a smaller copy of the frame, which is faster but less precise
+    """
+    # Detect markers in the frame (Aruco 5x5 1000)
+    # Convert to greyscale first, as the detector would do this itself otherwise
+    grey_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.get(frame.shape[:2]))
+    if scale != 1:
+        size = (round(frame.shape[1] * scale), round(frame.shape[0] * scale))
+        grey_frame = cv2.resize(grey_frame, size, dst=pool.get(size[::-1]), interpolation=cv2.INTER_AREA)
+    (corners, ids, rejected) = cv2.aruco.detectMarkers(grey_frame, aruco_dict, parameters=aruco_params)
+    if ids is None:
+        return {}
+    # Move the corners back to where they are in the full frame
+    return {int(marker_id[0]): corner.reshape(4, 2) / scale for marker_id, corner in zip(ids, corners)}
+
+
+def board_marker_ids(count):
+    """The marker IDs of the corners of count boards: 0-3, then 6-9, 10-13 and so on, as the stylus uses 4 and 5"""
+    return [(0, 1, 2, 3)] + [tuple(range(6 + 4 * board, 10 + 4 * board)) for board in range(count - 1)]
+
+
+def board_corners(markers, ids=(0, 1, 2, 3)):
+    """
+    The corners of a board shown by the markers found in a frame, by corner index
+    ids are the markers at the top left, top right, bottom right and bottom left of the board
+    """
+    found = {}
+    for index, marker_id in enumerate(ids):
+        if marker_id in markers:
+            # E.G. If the marker is in the top left, this is the top left corner of the marker
+            x, y = markers[marker_id][index].tolist()
+            if (x, y) != (0.0, 0.0):
+                found[index] = (x, y)
+    return found
+
+
+def quad_contains(corners, point):
+    """If a point is inside the quad between four corners. A quad with a corner which hasn't been seen has no inside"""
+    if (0, 0) in corners:
+        return False
+    quad = np.array(corners, np.float32).reshape(-1, 1, 2)
+    return cv2.pointPolygonTest(quad, (float(point[0]), float(point[1])), False) >= 0
+
+
+stages = {3: "Correcting", 4: "Accurate"}  # The visibility of a board by how many of its corners are seen
+
+
+class BoardMarkers:
+    """
+    A board found from the markers at its corners, with ids the markers at its top left, top right, bottom right and
+    bottom left. Corners which aren't seen stay where they were last seen
+    The warp matrix maps the board onto the camera frame, and the inverse matrix maps the camera frame onto the board
+    """
+    def __init__(self, ids=(0, 1, 2, 3)):
+        self.ids = tuple(ids)
+        self.corners = [(0, 0), (0, 0), (0, 0), (0, 0)]
+        self.visibility = "Calibration"  # Calibration, Correcting, Accurate
+        self.visibility_time = 1000
+        self.warp_matrix = None
+        self.inverse_matrix = None
+        self.warp_key = None  # The corners and size the matrices were last generated for
+
+    def update(self, markers):
+        """
+        Moves the corners to where the markers found this frame (see find_markers) show them
+        Returns the corners found, by corner index. How many were found gives the visibility (see stages)
+        """
+        found = board_corners(markers, self.ids)
+        for index, point in found.items():
+            self.corners[index] = point
+        return found
 
-    confirmed = []  # Valid markers visible in the frame
+    def set_visibility(self, visibility):
+        """Sets the visibility each frame, counting how many frames it has stayed the same"""
+        if visibility != self.visibility:
+            self.visibility = visibility
+            self.visibility_time = 0
+        else:
+            self.visibility_time += 1
+
+    def update_matrices(self, dimensions, corners=None, display_corners=None):
+        """
+        Makes the matrices again if the board has moved
+        Points are mapped onto the board with corners, and the board is drawn onto the frame between display_corners.
+        Both default to the corners as seen, and differ when the camera's lens distortion is removed
+        """
+        corners = self.corners if corners is None else corners
+        display_corners = self.corners if display_corners is None else display_corners
+        warp_key = (tuple(map(tuple, display_corners)), tuple(map(tuple, corners)), dimensions)
+        if warp_key == self.warp_key:
+            return
+        self.warp_key = warp_key
+        self.warp_matrix = manipulation.generate_warp_matrix(dimensions, display_corners)
+        try:
+            self.inverse_matrix = np.linalg.inv(manipulation.generate_warp_matrix(dimensions, corners))
+        except np.linalg.LinAlgError:
+            self.inverse_matrix = None
+
+    def contains(self, point):
+        """If a point in the camera frame is on the board"""
+        return quad_contains(self.corners, point)
+
+
+def stylus_markers(markers):
+    """The corners of the stylus marker, and whether the stylus is on (marker 5), off (marker 4) or not seen (None)"""
+    for marker_id, stylus_on in ((5, True), (4, False)):
+        if marker_id in markers:
+            return [tuple(point) for point in markers[marker_id].tolist()], stylus_on
+    return [], None
+
+
+def detect_markers(frame, scale=1.0):
+    """
+    Finds the markers in a frame, without changing anything. This can run in any process
+    Returns every marker found (see find_markers), which every board can be found from (see BoardMarkers.update),
+    the corners of the stylus marker, and whether the stylus is on (marker 5), off (marker 4) or not seen (None)
+    With a scale below 1, the markers are found in a smaller copy of the frame, which is faster but less precise
+    """
+    markers = find_markers(frame, scale)
+    stylus_corners, stylus_on = stylus_markers(markers)
+    return markers, stylus_corners, stylus_on
+
+
+def get_screenspace_points(frame, video_frame, debug, boards, scale=1.0):
+    """
+    Finds every board (BoardMarkers) in a frame in a single detection pass, moving each to where its markers were found
+    Returns the frame (with the markers found highlighted if debug is enabled), the corners found of each board (see
+    BoardMarkers.update), the corners of the stylus marker, and whether the stylus is on, off or not seen (None)
+    With a scale below 1, the markers are found in a smaller copy of the frame, which is faster but less precise
+    """
+    markers, stylus_corners, stylus_on = detect_markers(frame, scale)
+    found = []
+    for board in boards:
+        found.append(board.update(markers))
+        if debug:
+            # Highlight every corner of the markers found
+            for index in found[-1]:
+                for x, y in markers[board.ids[index]].tolist():
+                    cv2.circle(video_frame, (int(x), int(y)), 5, (0, 0, 255), -1)
+    return video_frame, found, stylus_corners, stylus_on
+
+
+def get_stylus_points(frame, previous_stylus_corners, padding=40, scale=1.0):
+    """
+    Looks for the stylus markers (4 and 5) only in the area around some points, such as where they were last seen or
+    the corners of the board. With a scale below 1, the area is searched in a smaller copy, which is faster
+    Returns the stylus corners (empty if it wasn't found) and if the stylus is pressed
+    """
+    points = np.array(previous_stylus_corners, dtype=np.float32).reshape(-1, 2)
+    x0, y0 = np.maximum(points.min(axis=0) - padding, 0).astype(int)
+    x1, y1 = np.minimum(points.max(axis=0) + padding, (frame.shape[1], frame.shape[0])).astype(int)
+    if x1 <= x0 or y1 <= y0:
+        return [], None
+    region = frame[y0:y1, x0:x1]
+    grey_region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY, dst=pool.get(region.shape[:2]))
+    if scale != 1:
+        size = (max(round(grey_region.shape[1] * scale), 1), max(round(grey_region.shape[0] * scale), 1))
+        grey_region = cv2.resize(grey_region, size, dst=pool.get(size[::-1]), interpolation=cv2.INTER_AREA)
+    (corners, ids, rejected) = cv2.aruco.detectMarkers(grey_region, aruco_dict, parameters=aruco_params)
+    corners = [corner / scale for corner in corners]
 
-    full_codes = [x.copy() for x in default_full_codes]
     stylus_on = None
     stylus_corners = []
-    stage = "Calibration"
-
-    for listID, corner in enumerate(corners[:6]):
-        for point in corner:  # for each corner in the list of markers
-            # Get the id of the marker
-            marker_id = ids[listID][0]
-            if marker_id in range(4, 5 + 1):
-                for x, y in point:
-                    stylus_corners.append((x, y))
-                stylus_on = marker_id == 5
-            elif marker_id < 4:
-                index = 0
-                for x, y in point:
-                    full_codes[marker_id][index] = (x, y)
-                    if debug:
-                        # Highlight it if debug is enabled
-                        cv2.circle(video_frame, (int(x), int(y)), 5, (0, 0, 255), -1)
-                    # If the point matches the position of the code
-                    if index == ids[listID][0] and (x, y) != (0.0, 0.0):
-                        # E.G. If the marker is in the top left, this checks for the top left corner of the marker
-                        screenspace_corners[index] = (x, y)  # Save it for future frames (used if the marker is lost)
-                        confirmed.append(index)
-                    index += 1
-    if len(confirmed) == 3:
-        stage = "Correcting"
-    elif len(confirmed) == 4:
-        stage = "Accurate"
-    # if len(confirmed) == 3 and previous_full_codes != default_full_codes and not debug:
-    #     (unknownPoint,) = {0, 1, 2, 3} - set(confirmed)
-    #     # Create a matrix that transforms the previous points to the current points
-    #     transform_matrix = cv2.getAffineTransform(
-    #         np.float32(
-    #             [previous_full_codes[confirmed[0]][confirmed[0]],
-    #              previous_full_codes[confirmed[1]][confirmed[1]],
-    #              previous_full_codes[confirmed[2]][confirmed[2]]]
-    #         ), np.float32(
-    #             [full_codes[confirmed[0]][confirmed[0]],
-    #              full_codes[confirmed[1]][confirmed[1]],
-    #              full_codes[confirmed[2]][confirmed[2]]]
-    #         )
-    #     )
-    #     # The previous full code is an array of coordinates, so we need to multiply the matrix by each coordinate
-    #     new = []
-    #     for point in previous_full_codes[unknownPoint]:
-    #         new.append(list(transform_matrix @ np.array([point[0], point[1], 1])))
-    #         # Use matmul instead
-    #         new.append([max(round(n, 1), 0) for n in list(transform_matrix @ np.array([point[0], point[1], 1]))])
-    #     screenspace_corners[unknownPoint] = new[unknownPoint]
-
-    return screenspace_corners, video_frame, full_codes, stylus_corners, stylus_on, stage
+    for listID, corner in enumerate(corners):
+        marker_id = ids[listID][0]
+        if marker_id in range(4, 5 + 1):
+            # Move the corners back from the region into the whole frame
+            for x, y in corner[0]:
+                stylus_corners.append((x + x0, y + y0))
+            stylus_on = marker_id == 5
+    return stylus_corners, stylus_on
 
 
 def add_screenspace_overlay(frame, screenspace_corners, debug=False):
@@ -155,7 +261,3 @@ def get_midpoints(screenspace_corners, frame, debug):
         cv2.line(frame, midpoints[1], midpoints[3], (255, 0, 255), 2)
     return midpoints, frame
 
-
-def kill():
-    """Stops the video stream gracefully"""
-    vs.stop()
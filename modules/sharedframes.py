@@ -0,0 +1,169 @@
+"""
+Shares rendered frames with other processes on this computer (such as a virtual camera or a second display)
+FramePublisher is a sink which writes every frame into a ring of slots in named shared memory. FrameReader is used in
+the other process, and gives the latest frame as a NumPy view of the shared memory, without copying it
+Each slot is guarded by a sequence number which is odd while the slot is being written (a seqlock), so readers can
+tell when a frame they have changed underneath them
+
+The memory is laid out as:
+    header: magic, version, number of slots, bytes per slot, latest slot written (-1 before the first frame)
+    a header for each slot: sequence, frame ID, timestamp, height, width, channels
+    the frame data of each slot
+"""
+
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from modules.sinks import Sink
+
+magic = 0x57425246  # "WBRF"
+version = 1
+
+header_dtype = np.dtype([
+    ("magic", "<u4"), ("version", "<u4"), ("slots", "<u4"), ("padding", "<u4"), ("slot_bytes", "<u8"), ("latest", "<i8")
+])
+slot_dtype = np.dtype([
+    ("sequence", "<u8"), ("frame_id", "<u8"), ("timestamp", "<f8"),
+    ("height", "<u4"), ("width", "<u4"), ("channels", "<u4"), ("padding", "<u4")
+])
+
+
+def layout(memory, slots):
+    """Views of the header, slot headers and slot data in a block of shared memory"""
+    header = np.ndarray((), header_dtype, buffer=memory.buf)
+    slot_headers = np.ndarray((slots,), slot_dtype, buffer=memory.buf, offset=header_dtype.itemsize)
+    data_offset = header_dtype.itemsize + slots * slot_dtype.itemsize
+    return header, slot_headers, data_offset
+
+
+class FramePublisher(Sink):
+    """
+    A sink which publishes every frame it is given under a name, such as "whiteboard"
+    The shared memory is made when the first frame arrives, with room for slots frames of that size
+    With board_only, the board (the canvas passed to render()) is published instead of the rendered frame
+    """
+    def __init__(self, name="whiteboard", slots=3, board_only=False):
+        self.name = name
+        self.slots = slots
+        self.board_only = board_only
+        self.memory = None
+        self.frame_id = 0
+        self.skipped = 0  # Frames too big for the slots
+
+    def write(self, frame) -> None:
+        if self.memory is None:
+            self.create(frame.nbytes)
+        if frame.nbytes > self.slot_bytes:
+            self.skipped += 1
+            return
+        self.frame_id += 1
+        slot = self.frame_id % self.slots
+        # Fields are indexed before the slot so every write goes straight into the shared memory
+        headers = self.slot_headers
+        # An odd sequence tells readers the slot is being written
+        headers["sequence"][slot] += 1
+        start = self.data_offset + slot * self.slot_bytes
+        # This is the only copy of the frame
+        target = np.ndarray(frame.shape, frame.dtype, buffer=self.memory.buf, offset=start)
+        np.copyto(target, frame)
+        headers["frame_id"][slot] = self.frame_id
+        headers["timestamp"][slot] = time.time()
+        headers["height"][slot] = frame.shape[0]
+        headers["width"][slot] = frame.shape[1]
+        headers["channels"][slot] = frame.shape[2] if frame.ndim == 3 else 1
+        headers["sequence"][slot] += 1
+        self.header["latest"] = slot
+
+    def create(self, slot_bytes):
+        """Makes the shared memory, replacing any left behind by a previous run which didn't close properly"""
+        self.slot_bytes = slot_bytes
+        size = header_dtype.itemsize + self.slots * (slot_dtype.itemsize + slot_bytes)
+        try:
+            self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            old = shared_memory.SharedMemory(name=self.name)
+            old.close()
+            old.unlink()
+            self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self.header, self.slot_headers, self.data_offset = layout(self.memory, self.slots)
+        self.slot_headers[:] = 0
+        self.header["magic"] = magic
+        self.header["version"] = version
+        self.header["slots"] = self.slots
+        self.header["slot_bytes"] = slot_bytes
+        self.header["latest"] = -1
+
+    def close(self) -> None:
+        if self.memory is not None:
+            # Views of the memory have to go before it can be closed
+            del self.header, self.slot_headers
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+class SharedFrame:
+    """A frame read from shared memory. image is a view, so only valid while reader.valid(frame) is True"""
+    def __init__(self, image, frame_id, timestamp, slot, sequence):
+        self.image = image
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.slot = slot
+        self.sequence = sequence
+
+
+class FrameReader:
+    """
+    Reads frames published by a FramePublisher in another process
+        reader = FrameReader("whiteboard")
+        frame = reader.read()
+        if frame is not None:
+            cv2.imshow("Whiteboard", frame.image)
+    Copy frame.image if it needs to be kept, as the slot is reused a few frames later. Frames are always uint8
+    """
+    def __init__(self, name="whiteboard"):
+        self.memory = shared_memory.SharedMemory(name=name)
+        # The publisher owns the memory, so stop this process removing it when it exits
+        if os.name == "posix":
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        header = np.ndarray((), header_dtype, buffer=self.memory.buf)
+        if header["magic"] != magic or header["version"] != version:
+            raise ValueError(f"{name} is not a whiteboard frame buffer this reader understands")
+        self.slots = int(header["slots"])
+        self.header, self.slot_headers, self.data_offset = layout(self.memory, self.slots)
+        self.slot_bytes = int(self.header["slot_bytes"])
+
+    def read(self, after=0, attempts=3):
+        """Gets the latest frame, or None if nothing newer than frame ID after has been published"""
+        for _ in range(attempts):
+            slot = int(self.header["latest"])
+            if slot < 0:
+                return None
+            headers = self.slot_headers
+            sequence = int(headers["sequence"][slot])
+            if sequence % 2:
+                # Being written right now
+                continue
+            frame_id = int(headers["frame_id"][slot])
+            if frame_id <= after:
+                return None
+            height, width = int(headers["height"][slot]), int(headers["width"][slot])
+            channels = int(headers["channels"][slot])
+            timestamp = float(headers["timestamp"][slot])
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            image = np.ndarray(shape, np.uint8, buffer=self.memory.buf, offset=self.data_offset + slot * self.slot_bytes)
+            # If the sequence has changed, the frame was overwritten while the header was read
+            if int(headers["sequence"][slot]) == sequence:
+                return SharedFrame(image, frame_id, timestamp, slot, sequence)
+        return None
+
+    def valid(self, frame):
+        """If a frame's image hasn't been overwritten since it was read"""
+        return int(self.slot_headers["sequence"][frame.slot]) == frame.sequence
+
+    def close(self):
+        del self.header, self.slot_headers
+        self.memory.close()
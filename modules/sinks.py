@@ -0,0 +1,113 @@
+"""
+Output sinks the driver sends rendered frames to
+None of these touch pygame or Tk, so they can all be used on a machine without a display (apart from HighGUISink)
+"""
+
+import os
+import queue
+
+import cv2
+
+
+class Sink:
+    """
+    Somewhere rendered frames are sent
+    open() is called once the output size is known, write() once per frame and close() when the driver is killed
+    Sinks with board_only set are sent the board passed to render(), rather than the rendered camera feed
+    """
+    board_only = False
+
+    def open(self, driver) -> None:
+        self.driver = driver
+
+    def write(self, frame) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class NullSink(Sink):
+    """Throws every frame away. Useful for measuring how fast the pipeline runs without any output"""
+    def __init__(self):
+        self.frames = 0
+
+    def write(self, frame) -> None:
+        self.frames += 1
+
+
+class ImageSequenceSink(Sink):
+    """Saves every frame as a numbered image in a folder"""
+    def __init__(self, folder, pattern="frame_{:06d}.png"):
+        self.folder = folder
+        self.pattern = pattern
+        self.frames = 0
+
+    def open(self, driver) -> None:
+        super().open(driver)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def write(self, frame) -> None:
+        cv2.imwrite(os.path.join(self.folder, self.pattern.format(self.frames)), frame)
+        self.frames += 1
+
+
+class VideoFileSink(Sink):
+    """Encodes every frame into a video file"""
+    def __init__(self, path, fps=30, fourcc="mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def open(self, driver) -> None:
+        super().open(driver)
+        self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, driver.output_size)
+
+    def write(self, frame) -> None:
+        # The writer silently ignores frames of the wrong size, so make sure they match
+        if frame.shape[1::-1] != tuple(self.driver.output_size):
+            frame = cv2.resize(frame, self.driver.output_size)
+        self.writer.write(frame)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class QueueSink(Sink):
+    """
+    Puts a copy of every frame onto a queue, for use in tests or by another thread
+    If the queue is full the oldest frame is dropped, so the driver is never blocked
+    """
+    def __init__(self, maxsize=8):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def write(self, frame) -> None:
+        # Frames come from the buffer pool and are reused next frame, so a copy has to be kept
+        frame = frame.copy()
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class HighGUISink(Sink):
+    """Shows every frame in an OpenCV window"""
+    def __init__(self, name="Screenspace"):
+        self.name = name
+
+    def write(self, frame) -> None:
+        cv2.imshow(self.name, frame)
+        cv2.waitKey(1)
+
+    def close(self) -> None:
+        cv2.destroyWindow(self.name)
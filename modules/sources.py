@@ -0,0 +1,82 @@
+"""
+Frame sources the driver can read from - a webcam, a video file, or a fixed set of images
+Every source has a read() method which returns a BGR frame (or None once it has run out) and a stop() method
+"""
+
+import cv2
+from imutils.video import VideoStream
+
+
+class CameraSource:
+    """Reads frames from a webcam on a background thread"""
+    def __init__(self, src=0):
+        self.stream = VideoStream(src=src).start()
+
+    def read(self):
+        """Gets the latest frame from the camera"""
+        return self.stream.read()
+
+    def stop(self):
+        """Stops the camera gracefully"""
+        self.stream.stop()
+
+
+class VideoFileSource:
+    """Reads frames from a video file, one per call, as fast as they are asked for"""
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Could not open video file {path}")
+
+    def read(self):
+        """Gets the next frame of the video, or None at the end"""
+        success, frame = self.capture.read()
+        if not success and self.loop:
+            # Go back to the start and try again
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture.read()
+        return frame if success else None
+
+    def seek(self, frame_number, margin=30):
+        """
+        Moves to a frame, so the next read() returns it. Returns False if the video ends before it
+        Seeking in compressed video (such as H.264 in an mp4) can land on a nearby keyframe rather than the frame asked
+        for, so the position is checked afterwards. If it is after the frame, it seeks again from further back, then
+        decodes forward to the frame
+        """
+        target = frame_number
+        while True:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+            if position <= frame_number or target == 0:
+                break
+            target = max(target - (position - frame_number) - margin, 0)
+        for _ in range(frame_number - max(position, 0)):
+            if not self.capture.grab():
+                return False
+        return True
+
+    def stop(self):
+        """Closes the video file"""
+        self.capture.release()
+
+
+class ImageSource:
+    """Repeats a list of images, either forever or for a set number of frames"""
+    def __init__(self, images, frames=None):
+        self.images = [cv2.imread(image) if isinstance(image, str) else image for image in images]
+        self.frames = frames
+        self.frame_number = 0
+
+    def read(self):
+        """Gets the next image, or None once the frame limit has been reached"""
+        if self.frames is not None and self.frame_number >= self.frames:
+            return None
+        image = self.images[self.frame_number % len(self.images)]
+        self.frame_number += 1
+        return image
+
+    def stop(self):
+        ...
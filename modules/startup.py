@@ -0,0 +1,79 @@
+"""
+Gets the camera and models ready on background threads, so they can be prepared while the login dialog is open
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from modules import body
+from modules import hands
+from modules import sources
+
+model_loaders = {
+    "hands": hands,
+    "body": body
+}
+
+
+class Warmup:
+    """
+    Opens the camera and builds the MediaPipe graphs for the requested modules in the background
+    Call wait() once the objects are needed, which returns the ready camera source
+    """
+    def __init__(self, modules=[], source=None, timeout=10):
+        self.modules = modules
+        self.timeout = timeout
+        self.source = source
+        self.first_frame = None
+        self.errors = []
+        self.camera_ready = threading.Event()
+
+        self.threads = [threading.Thread(target=self._open_camera, daemon=True)]
+        for module in modules:
+            if module in model_loaders:
+                self.threads.append(threading.Thread(target=self._load_model, args=(module,), daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _open_camera(self):
+        """Starts the camera and waits for it to produce a frame"""
+        try:
+            if self.source is None:
+                self.source = sources.CameraSource()
+            # The camera thread takes a moment to read its first frame
+            deadline = time.perf_counter() + self.timeout
+            while self.first_frame is None and time.perf_counter() < deadline:
+                self.first_frame = self.source.read()
+                if self.first_frame is None:
+                    time.sleep(0.01)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            self.camera_ready.set()
+
+    def _load_model(self, module):
+        """Builds a model, then runs a first inference on a real camera frame if one arrives in time"""
+        try:
+            loader = model_loaders[module]
+            loader.load_model()
+            self.camera_ready.wait(self.timeout)
+            frame = self.first_frame if self.first_frame is not None else np.zeros((480, 640, 3), np.uint8)
+            loader.warm_up(frame)
+        except Exception as e:
+            self.errors.append(e)
+
+    def wait(self):
+        """Waits for everything to be ready, then returns the camera source"""
+        for thread in self.threads:
+            thread.join()
+        for error in self.errors:
+            print(f"Warmup failed: {error}")
+        return self.source
+
+    def cancel(self):
+        """Stops the camera if it isn't going to be used"""
+        self.camera_ready.wait(self.timeout)
+        if self.source is not None:
+            self.source.stop()
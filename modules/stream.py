@@ -0,0 +1,349 @@
+"""
+Streams the board live to remote viewers over HTTP
+/stream.mjpg is an MJPEG stream of the board, /frame.jpg the latest frame, and /strokes a WebSocket which sends each
+stroke as it is drawn. / is a page showing both
+The server runs on asyncio in a background thread. Each frame is encoded once, however many viewers there are, and
+viewers who can't keep up skip straight to the latest frame rather than falling behind. While nobody is watching the
+stream, frames aren't encoded, but the latest is kept so /frame.jpg can be encoded when it is asked for
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+from modules.sinks import Sink
+
+# Added to the client's key to accept a WebSocket connection (from RFC 6455)
+websocket_guid = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+viewer_page = b"""<!DOCTYPE html>
+<html>
+    <head>
+        <meta charset="utf-8">
+        <title>Whiteboard</title>
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+    </head>
+    <body style="margin: 0; background: #242424;">
+        <div style="position: relative; width: 100vw;">
+            <img src="/stream.mjpg" id="board" style="width: 100%; display: block;" />
+            <canvas id="strokes" style="position: absolute; top: 0; left: 0; width: 100%; height: 100%;"></canvas>
+        </div>
+        <script>
+            // Strokes are drawn as soon as they arrive, then cleared once they are part of the board's video
+            const board = document.getElementById("board");
+            const canvas = document.getElementById("strokes");
+            const context = canvas.getContext("2d");
+            const socket = new WebSocket(`ws://${location.host}/strokes`);
+            socket.onmessage = (message) => {
+                const delta = JSON.parse(message.data);
+                if (canvas.width !== board.naturalWidth) {
+                    canvas.width = board.naturalWidth;
+                    canvas.height = board.naturalHeight;
+                }
+                if (delta.type === "points") {
+                    context.fillStyle = delta.colour;
+                    for (const [x, y] of delta.points) {
+                        context.beginPath();
+                        context.arc(x, y, delta.size, 0, 2 * Math.PI);
+                        context.fill();
+                    }
+                } else {
+                    context.clearRect(0, 0, canvas.width, canvas.height);
+                }
+            };
+        </script>
+    </body>
+</html>
+"""
+
+
+def websocket_frame(text):
+    """Makes an unmasked WebSocket text frame, as sent from a server"""
+    payload = text.encode()
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x81, len(payload))
+    elif len(payload) < 65536:
+        header = struct.pack("!BBH", 0x81, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x81, 127, len(payload))
+    return header + payload
+
+
+class LiveStream(Sink):
+    """
+    A sink which serves the board to viewers on port
+    By default it streams the board on its own (board_only). Set board_only to False to stream the camera feed
+    Strokes are sent to WebSocket viewers with send_stroke(). A viewer with more than max_pending strokes waiting
+    to be sent is disconnected, and can reconnect to catch up from the video
+    """
+    def __init__(self, host="0.0.0.0", port=8080, quality=80, board_only=True, max_pending=1000):
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.board_only = board_only
+        self.max_pending = max_pending
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.encoder = None
+        self.running = False
+
+        # The newest frame written, a copy of it being encoded for the stream, and one being encoded for /frame.jpg
+        self.frame_lock = threading.Lock()
+        self.frame_ready = threading.Event()
+        self.pending = None
+        self.spare = None
+        self.snapshot_buffer = None
+        self.written = 0  # Frames written, which numbers each one
+        self.snapshot = None  # The future encoding the latest frame for /frame.jpg requests, if there is one
+
+        self.jpeg = None  # The latest encoded frame, shared by every viewer
+        self.jpeg_number = 0  # The number of the frame in self.jpeg
+        self.new_frame = None  # An asyncio.Event, set (and replaced) whenever a frame is encoded
+        self.encoded = 0
+        self.viewers = 0  # MJPEG connections
+        self.sockets = set()  # The queue of each WebSocket connection
+
+    def open(self, driver) -> None:
+        super().open(driver)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+        self.encoder = threading.Thread(target=self._encode, daemon=True)
+        self.encoder.start()
+
+    def write(self, frame) -> None:
+        with self.frame_lock:
+            if self.pending is None or self.pending.shape != frame.shape:
+                self.pending = np.empty_like(frame)
+            np.copyto(self.pending, frame)
+            self.written += 1
+        # Nothing needs encoding every frame while nobody is watching the stream
+        if self.viewers:
+            self.frame_ready.set()
+
+    def send_stroke(self, delta) -> None:
+        """Sends a change to the board (such as {"type": "points", ...}) to every WebSocket viewer"""
+        if self.loop is None or not self.sockets:
+            return
+        # Encoded once here, then the same bytes are sent to every viewer
+        self.loop.call_soon_threadsafe(self._broadcast, websocket_frame(json.dumps(delta)))
+
+    def close(self) -> None:
+        self.running = False
+        self.frame_ready.set()
+        if self.encoder is not None:
+            self.encoder.join()
+            self.encoder = None
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+            self.thread.join()
+            self.loop = None
+
+    def _run(self, started):
+        """The server thread"""
+        asyncio.set_event_loop(self.loop)
+        self.new_frame = asyncio.Event()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        # If port was 0, one was picked for us
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    async def _shutdown(self):
+        """Disconnects every viewer, then stops the server thread"""
+        self.server.close()
+        # Wake every connection up, so they see the stream has stopped and finish
+        self.new_frame.set()
+        for pending in self.sockets:
+            pending.put_nowait(None)
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+        self.loop.stop()
+
+    def _encode(self):
+        """The encoder thread. Encodes the newest frame, skipping any which arrived while the last was encoding"""
+        while True:
+            self.frame_ready.wait()
+            self.frame_ready.clear()
+            if not self.running:
+                return
+            self.spare, jpeg, number = self._encode_latest(self.spare)
+            if jpeg is not None and self.loop is not None:
+                self.loop.call_soon_threadsafe(self._publish, jpeg, number)
+
+    def _encode_latest(self, buffer):
+        """
+        Copies the latest frame into buffer (replaced if it is the wrong size), so the render thread can write the next
+        frame while this one is encoded. Returns the buffer, the JPEG (None if there's no frame) and the frame's number
+        """
+        with self.frame_lock:
+            if self.pending is None:
+                return buffer, None, 0
+            if buffer is None or buffer.shape != self.pending.shape:
+                buffer = np.empty_like(self.pending)
+            np.copyto(buffer, self.pending)
+            number = self.written
+        success, jpeg = cv2.imencode(".jpg", buffer, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer, jpeg.tobytes() if success else None, number
+
+    def _encode_snapshot(self):
+        """Encodes the latest frame for /frame.jpg (on an executor thread, only one at a time)"""
+        self.snapshot_buffer, jpeg, number = self._encode_latest(self.snapshot_buffer)
+        return jpeg, number
+
+    def _publish(self, jpeg, number):
+        """Makes a new frame available to every viewer (on the server thread)"""
+        # A snapshot may have already published a newer frame
+        if number <= self.jpeg_number:
+            return
+        self.jpeg = jpeg
+        self.jpeg_number = number
+        self.encoded += 1
+        event, self.new_frame = self.new_frame, asyncio.Event()
+        event.set()
+
+    async def _latest_jpeg(self):
+        """The latest frame as a JPEG, encoding it now if it hasn't been (such as while nobody watches the stream)"""
+        if self.jpeg_number != self.written:
+            # Every request arriving while a frame is encoding waits for the same one
+            if self.snapshot is None or self.snapshot.done():
+                self.snapshot = self.loop.run_in_executor(None, self._encode_snapshot)
+            snapshot = self.snapshot
+            try:
+                # Shielded, so a viewer disconnecting doesn't cancel the encode for everyone else
+                jpeg, number = await asyncio.shield(snapshot)
+            finally:
+                if self.snapshot is snapshot and snapshot.done():
+                    self.snapshot = None
+            if jpeg is not None:
+                self._publish(jpeg, number)
+        return self.jpeg
+
+    def _broadcast(self, data):
+        """Queues a WebSocket message for every viewer (on the server thread)"""
+        for pending in list(self.sockets):
+            if pending.qsize() >= self.max_pending:
+                # Too far behind to catch up, so disconnect it
+                self.sockets.discard(pending)
+                pending.put_nowait(None)
+            else:
+                pending.put_nowait(data)
+
+    async def _handle(self, reader, writer):
+        """Handles a single connection"""
+        try:
+            request = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+
+            if path == "/stream.mjpg":
+                await self._send_mjpeg(writer)
+            elif path == "/strokes" and headers.get("upgrade", "").lower() == "websocket":
+                await self._send_strokes(reader, writer, headers)
+            elif path == "/frame.jpg" and await self._latest_jpeg() is not None:
+                await self._send_response(writer, "image/jpeg", self.jpeg)
+            elif path == "/":
+                await self._send_response(writer, "text/html", viewer_page)
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send_response(writer, content_type, body):
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _send_mjpeg(self, writer):
+        """Sends every new frame until the viewer disconnects"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        self.viewers += 1
+        try:
+            while self.running:
+                await self.new_frame.wait()
+                if not self.running:
+                    break
+                jpeg = self.jpeg
+                writer.write(
+                    f"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode()
+                    + jpeg + b"\r\n"
+                )
+                # While a slow viewer is still receiving this frame, any new ones replace each other in self.jpeg
+                await writer.drain()
+        finally:
+            self.viewers -= 1
+
+    async def _send_strokes(self, reader, writer, headers):
+        """Accepts a WebSocket connection, then sends it every stroke until it disconnects"""
+        accept = base64.b64encode(
+            hashlib.sha1((headers.get("sec-websocket-key", "") + websocket_guid).encode()).digest()
+        ).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        await writer.drain()
+        pending = asyncio.Queue()
+        self.sockets.add(pending)
+        # Nothing the viewer sends is needed, but reading it notices when it disconnects
+        listener = asyncio.ensure_future(self._read_until_closed(reader, pending))
+        try:
+            while True:
+                data = await pending.get()
+                if data is None:
+                    break
+                writer.write(data)
+                await writer.drain()
+        finally:
+            self.sockets.discard(pending)
+            listener.cancel()
+
+    @staticmethod
+    async def _read_until_closed(reader, pending):
+        """Reads (and ignores) WebSocket frames from a viewer, then stops its sender once it closes"""
+        try:
+            while True:
+                first, second = await reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", await reader.readexactly(8))[0]
+                # Frames from the viewer are always masked
+                await reader.readexactly(length + (4 if second & 0x80 else 0))
+                if first & 0x0F == 0x8:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        pending.put_nowait(None)
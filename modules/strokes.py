@@ -0,0 +1,223 @@
+"""
+Stores strokes as compact arrays of points, simplified as they are drawn
+A stroke is kept as its first point and the differences between each point and the next, as int16, which is a
+fraction of the size of a list of tuples
+"""
+
+import struct
+import sys
+
+import cv2
+import numpy as np
+
+
+def simplify(points, tolerance):
+    """
+    Simplifies a line with the Ramer-Douglas-Peucker algorithm, removing points which are within tolerance pixels of
+    the line between the points either side of them. The first and last points are always kept
+    """
+    points = np.asarray(points, np.float32).reshape(-1, 2)
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), bool)
+    keep[0] = keep[-1] = True
+    # Sections of the line still to check, as (start, end) indexes
+    sections = [(0, len(points) - 1)]
+    while sections:
+        start, end = sections.pop()
+        if end - start < 2:
+            continue
+        between = points[start + 1:end]
+        direction = points[end] - points[start]
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(between - points[start]).T)
+        else:
+            # The perpendicular distance of every point between start and end from the line, all at once
+            offset = between - points[start]
+            distances = np.abs(direction[0] * offset[:, 1] - direction[1] * offset[:, 0]) / length
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            middle = start + 1 + furthest
+            keep[middle] = True
+            sections.append((start, middle))
+            sections.append((middle, end))
+    return points[keep]
+
+
+class Stroke:
+    """A finished stroke - its start, the int16 steps between its points, its colour (BGR), size and kind"""
+    header = struct.Struct("<iiIBBBHc")  # x, y, point count, blue, green, red, size, kind
+
+    def __init__(self, start, deltas, colour, size, kind="draw"):
+        self.start = np.asarray(start, np.int32)
+        self.deltas = np.asarray(deltas, np.int16).reshape(-1, 2)
+        self.colour = tuple(int(c) for c in colour)
+        self.size = int(size)
+        self.kind = kind
+
+    @classmethod
+    def from_points(cls, points, colour, size, kind="draw"):
+        points = np.rint(np.asarray(points, np.float32).reshape(-1, 2)).astype(np.int32)
+        return cls(points[0], np.diff(points, axis=0), colour, size, kind)
+
+    def points(self):
+        """The points of the stroke, as an (n, 2) int32 array"""
+        points = np.empty((len(self.deltas) + 1, 2), np.int32)
+        points[0] = self.start
+        np.cumsum(self.deltas, axis=0, dtype=np.int32, out=points[1:])
+        points[1:] += self.start
+        return points
+
+    def draw(self, image):
+        """Draws the stroke onto an image, as a line of circles like the ones drawn while it was made"""
+        points = self.points()
+        if len(points) > 1:
+            cv2.polylines(image, [points.reshape(-1, 1, 2)], False, self.colour, 2 * self.size)
+        for point in (points[0], points[-1]):
+            cv2.circle(image, (int(point[0]), int(point[1])), self.size, self.colour, -1)
+        return image
+
+    def nbytes(self):
+        """The size of the stroke's data"""
+        return self.start.nbytes + self.deltas.nbytes
+
+    def to_bytes(self):
+        return self.header.pack(
+            int(self.start[0]), int(self.start[1]), len(self.deltas) + 1, *self.colour, self.size, self.kind[0].encode()
+        ) + self.deltas.astype("<i2").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """Reads a stroke written by to_bytes(), returning it and the offset of whatever follows it"""
+        x, y, count, blue, green, red, size, kind = cls.header.unpack_from(data, offset)
+        offset += cls.header.size
+        deltas = np.frombuffer(data, "<i2", (count - 1) * 2, offset).reshape(-1, 2)
+        kind = {b"d": "draw", b"e": "erase"}.get(kind, "draw")
+        return cls((x, y), deltas, (blue, green, red), size, kind), offset + deltas.nbytes
+
+
+class StrokeBuilder:
+    """
+    Builds a stroke from the points drawn each frame
+    Once window points have built up at the end of the stroke, they are simplified with a tolerance of
+    tolerance * size pixels, and all but the last are fixed in place
+    """
+    def __init__(self, colour, size, kind="draw", tolerance=0.25, window=16, keep_raw=False):
+        self.colour = colour
+        self.size = size
+        self.kind = kind
+        self.tolerance = max(tolerance * size, 0.5)
+        self.window = window
+        self.fixed = []  # Simplified points which won't change
+        self.tail = []  # The newest points, not simplified yet
+        self.raw = [] if keep_raw else None  # Every point added, to check the simplified stroke against
+
+    def add(self, point):
+        """Adds a point drawn this frame. Repeats of the last point are ignored"""
+        point = (float(point[0]), float(point[1]))
+        if self.tail and self.tail[-1] == point:
+            return
+        if self.raw is not None:
+            self.raw.append(point)
+        self.tail.append(point)
+        if len(self.tail) >= self.window:
+            simplified = simplify(self.tail, self.tolerance)
+            self.fixed.extend(map(tuple, simplified[:-1].tolist()))
+            self.tail = [tuple(simplified[-1].tolist())]
+
+    def __len__(self):
+        return len(self.fixed) + len(self.tail)
+
+    def finish(self):
+        """Simplifies what is left and returns the finished Stroke, or None if nothing was drawn"""
+        if not len(self):
+            return None
+        points = self.fixed + list(map(tuple, simplify(self.tail, self.tolerance).tolist()))
+        return Stroke.from_points(points, self.colour, self.size, self.kind)
+
+
+class StrokeStore:
+    """Every finished stroke on the board. With keep_raw, the points each was made from are kept too"""
+    def __init__(self, keep_raw=False):
+        self.keep_raw = keep_raw
+        self.strokes = []
+        self.raw = []
+
+    def builder(self, colour, size, kind="draw"):
+        """Starts a stroke, to be added with finish() once it has been drawn"""
+        return StrokeBuilder(colour, size, kind, keep_raw=self.keep_raw)
+
+    def finish(self, builder):
+        stroke = builder.finish()
+        if stroke is not None:
+            self.strokes.append(stroke)
+            if builder.raw is not None:
+                self.raw.append(builder.raw)
+        return stroke
+
+    def nbytes(self):
+        return sum(stroke.nbytes() for stroke in self.strokes)
+
+    def to_bytes(self):
+        return b"".join(stroke.to_bytes() for stroke in self.strokes)
+
+    def draw(self, image):
+        for stroke in self.strokes:
+            stroke.draw(image)
+        return image
+
+    def save_raw(self, path):
+        """Saves the raw points of every stroke, so the simplification can be checked against a real session"""
+        np.savez_compressed(
+            path,
+            sizes=np.array([stroke.size for stroke in self.strokes], np.int32),
+            **{f"stroke_{i}": np.array(points, np.float32) for i, points in enumerate(self.raw)}
+        )
+
+
+def raster_difference(raw_points, stroke, shape):
+    """
+    Draws a stroke both through every one of its raw points and from its simplified form, returning the fraction of
+    the stroke's pixels which differ
+    """
+    white = (255, 255, 255)
+    raw = Stroke.from_points(raw_points, white, stroke.size).draw(np.zeros((*shape, 3), np.uint8))[:, :, 0]
+    simplified = Stroke(stroke.start, stroke.deltas, white, stroke.size).draw(np.zeros((*shape, 3), np.uint8))[:, :, 0]
+    covered = np.count_nonzero(raw | simplified)
+    return np.count_nonzero(raw != simplified) / max(covered, 1)
+
+
+def list_bytes(points):
+    """How much memory a list of point tuples takes"""
+    return sys.getsizeof(points) + sum(
+        sys.getsizeof(point) + sum(sys.getsizeof(value) for value in point) for point in points
+    )
+
+
+def compare_session(path, shape=(500, 1000)):
+    """
+    Simplifies every stroke of a session saved with StrokeStore.save_raw(), the same way as while drawing
+    Returns the number of strokes, the memory used by the raw and simplified strokes, their serialized sizes,
+    and the worst and mean fraction of pixels which differ when they are drawn
+    """
+    session = np.load(path)
+    sizes = session["sizes"]
+    raw_bytes = compact_bytes = raw_serialized = compact_serialized = 0
+    differences = []
+    for i, size in enumerate(sizes):
+        raw = [tuple(point) for point in session[f"stroke_{i}"].tolist()]
+        builder = StrokeBuilder((255, 255, 255), int(size))
+        for point in raw:
+            builder.add(point)
+        stroke = builder.finish()
+        if stroke is None:
+            continue
+        raw_bytes += list_bytes(raw)
+        compact_bytes += stroke.nbytes()
+        raw_serialized += len(repr(raw).encode())
+        compact_serialized += len(stroke.to_bytes())
+        differences.append(raster_difference(raw, stroke, shape))
+    worst = max(differences, default=0)
+    mean = sum(differences) / max(len(differences), 1)
+    return len(differences), raw_bytes, compact_bytes, raw_serialized, compact_serialized, worst, mean
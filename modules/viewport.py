@@ -0,0 +1,158 @@
+"""
+Zooming and panning around the board
+A Viewport maps between view coordinates (the pixels of the board shown on the marker quad) and canvas coordinates (the
+pixels of the drawing), and draws the part of the canvas in view. Zoomed out views are read from a MipPyramid of the
+canvas, which is kept up to date only where the canvas has changed
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+
+class MipPyramid:
+    """
+    Halved copies of a canvas, each level half the size of the one before. Level 0 is the canvas itself
+    Levels are made the first time they are asked for, and after that only the regions marked with changed() are
+    made again, when the level is next asked for
+    """
+    def __init__(self, canvas, max_levels=6):
+        self.canvas = canvas
+        self.max_levels = max_levels
+        self.levels = [canvas]
+        self.dirty = []  # A list of changed (x1, y1, x2, y2) rectangles in canvas coordinates for every built level
+
+    def changed(self, rect=None):
+        """Marks a rectangle (x1, y1, x2, y2) of the canvas as changed, or all of it if rect is None"""
+        if rect is None:
+            rect = (0, 0, self.canvas.shape[1], self.canvas.shape[0])
+        for dirty in self.dirty:
+            dirty.append(rect)
+
+    def level(self, index):
+        """The canvas halved index times, brought up to date"""
+        index = min(index, self.max_levels)
+        for level in range(1, min(index, len(self.levels) - 1) + 1):
+            self.update(level)
+        while len(self.levels) <= index:
+            below = self.levels[-1]
+            if min(below.shape[:2]) < 2:
+                break
+            height, width = below.shape[0] // 2, below.shape[1] // 2
+            # Odd rows and columns are left off, so every pixel is the average of the same 2x2 block as in update()
+            self.levels.append(cv2.resize(below[:height * 2, :width * 2], (width, height), interpolation=cv2.INTER_AREA))
+            self.dirty.append([])
+        return self.levels[min(index, len(self.levels) - 1)]
+
+    def update(self, level):
+        """Makes the changed regions of a level again from the level below"""
+        rects = self.dirty[level - 1]
+        if not rects:
+            return
+        # Changes between updates usually overlap, so they are redone as a single rectangle
+        x1 = min(rect[0] for rect in rects)
+        y1 = min(rect[1] for rect in rects)
+        x2 = max(rect[2] for rect in rects)
+        y2 = max(rect[3] for rect in rects)
+        rects.clear()
+        below, target = self.levels[level - 1], self.levels[level]
+        scale = 2 ** level
+        # The rectangle in this level's pixels, widened to whole pixels
+        left, top = max(x1 // scale, 0), max(y1 // scale, 0)
+        right, bottom = min(-(-x2 // scale), target.shape[1]), min(-(-y2 // scale), target.shape[0])
+        if left >= right or top >= bottom:
+            return
+        target[top:bottom, left:right] = cv2.resize(
+            below[top * 2:bottom * 2, left * 2:right * 2], (right - left, bottom - top), interpolation=cv2.INTER_AREA
+        )
+
+
+class Viewport:
+    """
+    Which part of the canvas is shown, as the canvas point at the top left of the view (offset) and the number of view
+    pixels per canvas pixel (scale). A scale of 2 is zoomed in to twice the size
+    """
+    def __init__(self, view_size, canvas_size, scale=1.0, offset=(0, 0), min_scale=0.125, max_scale=8.0,
+                 background=(255, 255, 255)):
+        self.view_size = view_size  # (width, height)
+        self.canvas_size = canvas_size  # (width, height)
+        self.scale = scale
+        self.offset = np.array(offset, np.float64)
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.background = background
+
+    @property
+    def identity(self):
+        """If the view shows the canvas exactly as it is, so nothing needs resampling"""
+        return self.scale == 1 and not self.offset.any() and self.view_size == self.canvas_size
+
+    def to_canvas(self, points):
+        """Maps view points to canvas points, for an array of any shape ending in 2"""
+        if self.identity:
+            return points
+        return np.asarray(points, np.float64) / self.scale + self.offset
+
+    def to_view(self, points):
+        return (np.asarray(points, np.float64) - self.offset) * self.scale
+
+    def zoom(self, factor, about=None):
+        """Zooms by a factor, keeping the view point about (by default the middle of the view) in the same place"""
+        if about is None:
+            about = (self.view_size[0] / 2, self.view_size[1] / 2)
+        fixed = self.to_canvas(np.array(about, np.float64))
+        self.scale = min(max(self.scale * factor, self.min_scale), self.max_scale)
+        self.offset = fixed - np.array(about, np.float64) / self.scale
+        self.clamp()
+
+    def pan(self, dx, dy):
+        """Moves the view by a number of view pixels"""
+        self.offset += np.array((dx, dy), np.float64) / self.scale
+        self.clamp()
+
+    def reset(self):
+        self.scale = 1.0
+        self.offset[:] = 0
+        self.clamp()
+
+    def clamp(self):
+        """Keeps the view over the canvas, centring the canvas if it is smaller than the view"""
+        for axis in range(2):
+            visible = self.view_size[axis] / self.scale
+            spare = self.canvas_size[axis] - visible
+            self.offset[axis] = min(max(self.offset[axis], 0), spare) if spare > 0 else spare / 2
+
+    def level_for(self, pyramid):
+        """The pyramid level to read from, the smallest which is still at least as detailed as the view"""
+        if self.scale >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / self.scale))), pyramid.max_levels)
+
+    def render(self, pyramid, out=None):
+        """
+        Draws the part of the canvas in view into out, reading from the smallest suitable level of the pyramid
+        If the view is the whole canvas as it is, the canvas itself is returned instead
+        """
+        if self.identity:
+            return pyramid.canvas
+        level = self.level_for(pyramid)
+        return self.warp(pyramid.level(level), 2 ** level, cv2.INTER_LINEAR, self.background, out)
+
+    def render_layer(self, layer, out=None):
+        """Draws the part of a canvas sized layer (such as the current path) in view, keeping its black areas black"""
+        if self.identity:
+            return layer
+        return self.warp(layer, 1, cv2.INTER_NEAREST, (0, 0, 0), out)
+
+    def warp(self, image, downscale, interpolation, border, out=None):
+        # Each view pixel is read from the point it shows, so only pixels in view are ever touched
+        step = 1 / (self.scale * downscale)
+        matrix = np.array([
+            [step, 0, self.offset[0] / downscale],
+            [0, step, self.offset[1] / downscale]
+        ])
+        return cv2.warpAffine(
+            image, matrix, self.view_size, dst=out, flags=interpolation | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=border
+        )
@@ -0,0 +1,185 @@
+"""
+The pygame window - shows the rendered frame alongside the toolbar, and passes clicks back to the driver
+The toolbar is retained: icons and fonts are loaded once, and buttons are only redrawn when their state changes
+"""
+
+import cv2
+import pygame
+
+from modules import manipulation
+from modules.buffers import pool
+from modules.driver import colours, sizes
+from modules.sinks import Sink
+
+
+class Button:
+    """A button on the toolbar, which shows either text or an image over a coloured background"""
+    def __init__(
+        self,
+        rect,
+        action,
+        background_colour,
+        background_colour_hover,
+        text=None,
+        colour="#000000",
+        image=None,
+        selected_image=None
+    ):
+        self.rect = rect
+        self.action = action  # What is returned when the button is clicked
+        self.background_colour = hex_to_rgb(background_colour)
+        self.background_colour_hover = hex_to_rgb(background_colour_hover)
+        self.text = text
+        self.colour = hex_to_rgb(colour)
+        self.image = image
+        self.selected_image = selected_image or image  # Shown instead of image when the button's action is in use
+
+    def state(self, driver, hovered):
+        """Everything that changes how the button looks. The button only needs redrawing when this changes"""
+        return hovered, self.action is not None and self.action in (driver.colour, driver.pen_size)
+
+
+class WindowSink(Sink):
+    """Shows frames in a pygame window with the colour, size and undo/redo toolbar"""
+    def open(self, driver) -> None:
+        super().open(driver)
+        pygame.init()
+        # Set the dimensions of the UI window
+        self.screen = pygame.display.set_mode((driver.output_size[0] + 40 + 32 + 20, driver.output_size[1] + 140))
+        pygame.display.set_caption("Screenspace")
+
+        # Loaded once here rather than every frame
+        self.font = pygame.font.Font("assets/Roboto-regular.ttf", 16)
+        self.icons = {}  # (path, size) -> scaled surface
+        self.labels = {}  # (text, colour) -> rendered text
+        self.buttons = self.create_buttons()
+        self.button_states = [None for _ in self.buttons]  # The state each button was last drawn in
+        self.shown = None  # The pooled buffer of the frame on screen, kept until the next one is shown
+
+    def write(self, frame) -> None:
+        driver = self.driver
+        cv2.imshow("Video Feed", driver.camera_frame)
+        cv2.waitKey(1)
+        # Keep the mouse position and buttons up to date
+        pygame.event.pump()
+        if driver.viewport is not None:
+            self.move_viewport(driver.viewport)
+        # Round the corners of the rendered frame
+        frame = manipulation.round_corners(frame, 25)
+        # The array is passed straight to pygame through the buffer protocol, without copying it to bytes first
+        image = pygame.image.frombuffer(frame, frame.shape[1::-1], "BGR")
+        # Add the image to the screen
+        frame_rect = self.screen.blit(image, (20, 20))
+
+        clicked, changed = self.update_toolbar()
+        if clicked != driver.clicked_before:
+            driver.clicked = clicked
+            driver.handle_event(clicked)
+        driver.clicked_before = clicked
+
+        # Only the frame and any buttons which were redrawn need to be sent to the display
+        pygame.display.update([frame_rect] + changed)
+        # The surface shares the frame's memory, so the frame is kept out of the pool until it has been replaced
+        if self.shown is not None:
+            pool.give_back(self.shown)
+        self.shown = frame if pool.keep(frame) else None
+
+    def close(self) -> None:
+        cv2.destroyAllWindows()
+        pygame.quit()
+
+    @staticmethod
+    def move_viewport(viewport):
+        """Zooms with +/- (0 resets) and pans with the arrow keys, for as long as they are held"""
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_EQUALS] or keys[pygame.K_KP_PLUS]:
+            viewport.zoom(1.05)
+        if keys[pygame.K_MINUS] or keys[pygame.K_KP_MINUS]:
+            viewport.zoom(1 / 1.05)
+        if keys[pygame.K_0]:
+            viewport.reset()
+        dx = 20 * (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT])
+        dy = 20 * (keys[pygame.K_DOWN] - keys[pygame.K_UP])
+        if dx or dy:
+            viewport.pan(dx, dy)
+
+    def create_buttons(self):
+        """Lays out every button on the toolbar"""
+        output_size = self.driver.output_size
+        buttons = [Button(
+            pygame.Rect(20, output_size[1] + 40, 100, 25), None, "#D9D9D9", "#C4C4C4",
+            text="Windowed", colour="#424242"
+        )]
+        # Spacing between each icon
+        spacing = ((output_size[1]) // (len(colours) + len(sizes) + 3)) + 1
+        positions = (pygame.Rect(output_size[0] + spacing, 20 + spacing * i, 32, 32) for i in range(len(colours) + len(sizes) + 3))
+        # Colours
+        for key, value in colours.items():
+            buttons.append(Button(
+                next(positions), key, value[0], value[1],
+                image="assets/Blank.png", selected_image="assets/Pencil.png"
+            ))
+        # Sizes
+        for key, value in sizes.items():
+            buttons.append(Button(
+                next(positions), value, "#000000", "#000000",
+                image="assets/" + key.capitalize() + ".png",
+                selected_image="assets/" + key.capitalize() + "Grey.png"
+            ))
+        for icon in ["Undo", "Redo", "Help"]:
+            buttons.append(Button(next(positions), icon, "#000000", "#000000", image="assets/" + icon + ".png"))
+        return buttons
+
+    def update_toolbar(self):
+        """
+        Redraws any buttons whose state has changed since they were last drawn
+        Returns the action of the button being clicked (or None), and a list of the areas which were redrawn
+        """
+        mouse_position = pygame.mouse.get_pos()
+        pressed = pygame.mouse.get_pressed()[0]
+        clicked = None
+        changed = []
+        for index, button in enumerate(self.buttons):
+            hovered = button.rect.collidepoint(mouse_position)
+            if hovered and pressed and button.action is not None:
+                clicked = button.action
+            state = button.state(self.driver, hovered)
+            if state != self.button_states[index]:
+                self.draw_button(button, *state)
+                self.button_states[index] = state
+                changed.append(button.rect)
+        return clicked, changed
+
+    def draw_button(self, button, hovered, selected):
+        """Draws a button onto the screen"""
+        self.screen.fill(button.background_colour_hover if hovered else button.background_colour, button.rect)
+        if button.text is not None:
+            label = self.get_label(button.text, button.colour)
+            self.screen.blit(label, label.get_rect(center=button.rect.center))
+        if button.image is not None:
+            self.screen.blit(self.get_icon(button.selected_image if selected else button.image, button.rect.size), button.rect)
+
+    def get_icon(self, path, size):
+        """Loads and scales an icon the first time it is needed"""
+        if (path, size) not in self.icons:
+            # Resize the image to fit the button
+            image = pygame.transform.scale(pygame.image.load(path), size)
+            self.icons[(path, size)] = image.convert_alpha()
+        return self.icons[(path, size)]
+
+    def get_label(self, text, colour):
+        """Renders a piece of text the first time it is needed"""
+        if (text, colour) not in self.labels:
+            self.labels[(text, colour)] = self.font.render(text, True, colour)
+        return self.labels[(text, colour)]
+
+
+def hex_to_rgb(hex_code):
+    """Converts a hex code to an RGB tuple"""
+    # Remove the # from the start of the hex code
+    hex_code = hex_code[1:]
+    # Split the hex code into 3 parts
+    hex_code = [hex_code[:2], hex_code[2:4], hex_code[4:]]
+    # Convert each part to an integer
+    hex_code = [int(n, 16) for n in hex_code]
+    return tuple(hex_code)
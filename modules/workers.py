@@ -0,0 +1,176 @@
+"""
+Runs MediaPipe inference in separate processes, so it doesn't compete with compositing and the UI for the GIL
+Frames are handed over through a shared memory ring buffer, and landmarks come back as packed float32 arrays,
+so images are never pickled
+"""
+
+import collections
+import multiprocessing
+import queue
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from modules import body
+from modules import hands
+
+model_modules = {
+    "hands": hands,
+    "body": body
+}
+
+
+def run_worker(module, requests, responses):
+    """
+    The main loop of a worker process. Runs until it is sent None
+    Each request names the shared memory its frame is in, so the ring buffer can be replaced (when the frame size
+    changes) without restarting the process
+    """
+    memory = None
+    frames = None
+    try:
+        model = model_modules[module]
+        model.load_model()
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            frame_id, slot, memory_name, slots, frame_shape = request
+            if memory is None or memory.name != memory_name:
+                if memory is not None:
+                    del frames
+                    memory.close()
+                memory = shared_memory.SharedMemory(name=memory_name)
+                frames = np.ndarray((slots,) + frame_shape, np.uint8, buffer=memory.buf)
+            if module == "hands":
+                landmarks, handedness = model.detect_array(frames[slot], handedness=True)
+                handedness = handedness.astype(np.int8).tobytes()
+            else:
+                landmarks, handedness = model.detect_array(frames[slot]), None
+            landmarks = landmarks.astype(np.float32)
+            responses.put((frame_id, landmarks.shape, landmarks.tobytes(), handedness))
+    finally:
+        if memory is not None:
+            del frames
+            memory.close()
+
+
+class InferenceWorker:
+    """
+    Runs one model (hands or body) in its own process
+    submit() copies a frame into the ring buffer and returns straight away. result() gives the landmarks of the frame
+    submitted before that, so the worker finds the landmarks of one frame while the next is captured and rendered
+    The process is started straight away, so make workers before starting any threads (such as the camera's) or
+    opening the window, as forking copies the process as it is. The ring buffer is made once the frame size is known
+    If the process dies, it is restarted and the frames it had get no landmarks
+    """
+    def __init__(self, module, frame_shape=None, slots=4, timeout=1):
+        self.module = module
+        self.slots = slots
+        self.timeout = timeout
+        # Spawned processes re-run the main script (and so the login dialog), so fork where it is available
+        start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        self.frame_id = 0
+        self.pending = collections.deque()  # The IDs of frames submitted whose results haven't been collected
+        self.restarts = 0
+
+        self.frame_shape = None
+        self.memory = None
+        self.frames = None
+        self.process = None
+        self.start()
+        if frame_shape is not None:
+            self.set_frame_shape(frame_shape)
+
+    def start(self):
+        """Starts (or restarts) the worker process"""
+        self.requests = self.context.Queue()
+        self.responses = self.context.Queue()
+        self.pending.clear()
+        # Attaching to the ring buffer registers it with the resource tracker. The worker shares this process's, as
+        # one of its own would remove the ring buffer when the worker stopped
+        resource_tracker.ensure_running()
+        self.process = self.context.Process(
+            target=run_worker, args=(self.module, self.requests, self.responses), daemon=True
+        )
+        self.process.start()
+
+    def set_frame_shape(self, frame_shape):
+        """Makes the ring buffer for frames of a shape, if it isn't that shape already"""
+        frame_shape = tuple(frame_shape)
+        if frame_shape == self.frame_shape:
+            return
+        # Frames still being worked on are in the old buffer, so their results are thrown away
+        self.discard()
+        self.free_memory()
+        self.memory = shared_memory.SharedMemory(create=True, size=self.slots * int(np.prod(frame_shape)))
+        self.frames = np.ndarray((self.slots,) + frame_shape, np.uint8, buffer=self.memory.buf)
+        self.frame_shape = frame_shape
+
+    def submit(self, frame):
+        """Sends a frame to the worker"""
+        if not self.process.is_alive():
+            self.restarts += 1
+            print(f"The {self.module} worker stopped, restarting it")
+            self.start()
+        self.set_frame_shape(frame.shape)
+        self.frame_id += 1
+        slot = self.frame_id % self.slots
+        # This is the only copy of the frame - the worker reads it straight out of shared memory
+        np.copyto(self.frames[slot], frame)
+        self.requests.put((self.frame_id, slot, self.memory.name, self.slots, self.frame_shape))
+        self.pending.append(self.frame_id)
+
+    def result(self):
+        """
+        Waits for the results of the frame submitted before the last one, as (landmarks, handedness). handedness is
+        None for the body model. Returns None if only one frame is being worked on, and empty landmarks if the
+        results don't arrive
+        """
+        if len(self.pending) < 2:
+            return None
+        frame_id = self.pending.popleft()
+        while True:
+            try:
+                response_id, shape, data, handedness = self.responses.get(timeout=self.timeout)
+            except queue.Empty:
+                # If the process has crashed it will be restarted on the next submit
+                return np.zeros((0,) + self.empty_shape(), np.float32), self.empty_handedness()
+            # Skip over results for older frames which timed out or were discarded
+            if response_id == frame_id:
+                landmarks = np.frombuffer(data, np.float32).reshape(shape)
+                if handedness is not None:
+                    handedness = np.frombuffer(handedness, np.int8)
+                return landmarks, handedness
+            if response_id > frame_id:
+                return np.zeros((0,) + self.empty_shape(), np.float32), self.empty_handedness()
+
+    def discard(self):
+        """Forgets the frames being worked on, such as when their results are no longer wanted"""
+        self.pending.clear()
+
+    def empty_shape(self):
+        """The shape of a single set of landmarks for this model"""
+        return (21, 3) if self.module == "hands" else (33, 4)
+
+    def empty_handedness(self):
+        return np.zeros(0, np.int8) if self.module == "hands" else None
+
+    def free_memory(self):
+        if self.memory is not None:
+            del self.frames
+            self.frames = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def stop(self):
+        """Stops the worker process and frees the shared memory"""
+        if self.process is not None and self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(self.timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.free_memory()
@@ -0,0 +1,203 @@
+"""
+Draws the board from a recorded video, without a display, faster than real time
+Worker processes each read a chunk of frames in a row and find the markers and hands in them, and this process puts
+the results back in order and draws them onto the board, the same way main.py does while drawing live
+Hands are tracked from frame to frame within a chunk, but every chunk starts afresh, so the board drawn depends on the
+chunk size but not on the number of workers
+
+Usage: python3 process_video.py <video file> [flags]
+    -o, --output: The folder to write board.mp4, board.png and board.wbl to (default output)
+    -w, --workers: The number of worker processes, or several to compare, e.g. -w 1,2,4 (default the number of CPUs)
+    -c, --chunk: The number of frames each worker reads at a time (default 32)
+    -s, --scale: Find the markers in a copy of each frame scaled by this much, e.g. -s 0.5 (default 1)
+"""
+
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from modules import hands, manipulation, screenspace
+from modules.board import Board, actions, gesture_tracker
+from modules.buffers import pool
+from modules.colours import Colours
+from modules.eventlog import EventLog
+from modules.handtracking import HandTracker
+from modules.sources import VideoFileSource
+
+width, height = 1000, 500  # The size of the board, as in main.py
+pen_size = 5  # Drawing in red at the size main.py starts with
+outputs = ["board.mp4", "board.png", "board.wbl", "board.wbl.index"]
+
+
+def analyse_chunk(path, start, count, scale=1.0):
+    """
+    Finds the markers and hands in count frames of a video, starting at frame start. This runs in a worker process
+    Returns a list of (markers found, stylus corners, stylus on, hand landmarks, handedness, frame shape) for each
+    frame, which is shorter than count at the end of the video
+    """
+    source = VideoFileSource(path)
+    results = []
+    # Each chunk has to start exactly where the last ended, so no frames are missed or analysed twice
+    if not source.seek(start):
+        count = 0
+    # The worker's last chunk was somewhere else in the video, so its hands aren't followed on from
+    hands.reset_tracking()
+    for _ in range(count):
+        frame = screenspace.get_current_frame(source)
+        if frame is None:
+            break
+        markers, stylus_corners, stylus_on = screenspace.detect_markers(frame, scale)
+        landmarks, handedness = hands.detect_array(frame, handedness=True)
+        results.append((markers, stylus_corners, stylus_on, landmarks, handedness, frame.shape))
+        pool.release()
+    source.stop()
+    return results
+
+
+def analyse(path, workers, chunk, scale=1.0, task=analyse_chunk):
+    """
+    Yields the results of every frame of a video in order, analysed by a pool of worker processes
+    Only a couple of chunks per worker are asked for at once, so results don't pile up faster than they are drawn
+    task is called as task(path, start, count, scale) in the workers to analyse each chunk
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        start = 0
+        while True:
+            while len(pending) < workers * 2:
+                pending.append(executor.submit(task, path, start, chunk, scale))
+                start += chunk
+            results = pending.popleft().result()
+            yield from results
+            if len(results) < chunk:
+                # The end of the video. Any chunks after it are empty
+                for future in pending:
+                    future.cancel()
+                return
+
+
+class Replay:
+    """Draws the results of each frame onto a board, in order, and writes the board to the output folder"""
+    def __init__(self, output, fps, max_hands=8):
+        self.fps = fps
+        self.frame_number = 0
+        self.markers = screenspace.BoardMarkers()
+        self.hand_tracker = HandTracker(max_hands)
+        self.gestures = gesture_tracker(max_hands)
+        self.current_action = [None for _ in range(max_hands)]
+
+        self.background = np.zeros((height, width, 3), np.uint8)
+        self.background[:] = 255
+        # Events are timed by where they are in the video, rather than when they were processed
+        event_log = EventLog(os.path.join(output, "board.wbl"), fsync_interval=None, clock=self.video_time)
+        self.board = Board((width, height), max_hands=max_hands, event_log=event_log)
+        self.board.start()
+        self.writer = cv2.VideoWriter(
+            os.path.join(output, "board.mp4"), cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+        self.output = output
+
+    def video_time(self):
+        return self.frame_number / self.fps
+
+    def draw(self, result):
+        """Draws one frame's results onto the board, and writes the board to the video"""
+        markers, stylus_corners, stylus_on, landmarks, handedness, shape = result
+        # Markers which weren't found stay where they were last seen, as while drawing live
+        self.markers.update(markers)
+        self.markers.update_matrices((height, width))
+        inverse_matrix = self.markers.inverse_matrix
+
+        stylus_coords = None
+        if len(stylus_corners) and inverse_matrix is not None:
+            ends = [manipulation.find_new_coordinate(c, inverse_matrix) for c in stylus_corners[:2]]
+            stylus_coords = (round((ends[0][0] + ends[1][0]) / 2), round((ends[0][1] + ends[1][1]) / 2))
+
+        ids = self.hand_tracker.update(landmarks, handedness)
+        # Recognise the gesture of every hand at once. While the stylus is used, hands only give commands
+        for event in self.gestures.update_from_landmarks(landmarks, ids):
+            self.current_action[event.hand] = None if event.kind == "exit" else actions.get(event.gesture, None)
+
+        # Move every hand point from the video onto the board at once
+        hand_points = {}
+        if len(landmarks) and inverse_matrix is not None:
+            video_coords = landmarks[:, :, :2].astype(np.float64) * shape[1::-1]
+            board_coords = cv2.perspectiveTransform(video_coords.reshape(-1, 1, 2), inverse_matrix)
+            board_coords = board_coords.reshape(len(landmarks), 21, 2)
+            hand_points = {int(hand_id): points for hand_id, points in zip(ids, board_coords) if hand_id >= 0}
+
+        self.board.update(self.current_action, hand_points, stylus_coords, stylus_on, Colours.red, pen_size)
+        self.writer.write(self.board.compose(pool.copy(self.background)))
+        pool.release()
+        self.frame_number += 1
+
+    def close(self):
+        """Finishes the video and the event log, and saves the finished board"""
+        self.writer.release()
+        self.board.close()
+        cv2.imwrite(os.path.join(self.output, "board.png"), self.board.current_drawing)
+
+
+def process(path, output, workers, chunk=32, scale=1.0):
+    """Draws the board from a video into the output folder, returning the number of frames and the time taken"""
+    os.makedirs(output, exist_ok=True)
+    # The event log would carry on from an old one, so every output starts again
+    for name in outputs:
+        if os.path.exists(os.path.join(output, name)):
+            os.remove(os.path.join(output, name))
+    source = VideoFileSource(path)
+    fps = source.capture.get(cv2.CAP_PROP_FPS) or 30
+    source.stop()
+
+    start = time.perf_counter()
+    replay = Replay(output, fps)
+    for result in analyse(path, workers, chunk, scale):
+        replay.draw(result)
+    replay.close()
+    return replay.frame_number, time.perf_counter() - start, fps
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flags = {"-o": "--output", "-w": "--workers", "-c": "--chunk", "-s": "--scale", "-h": "--help"}
+    args = [flags[arg] if arg in flags else arg for arg in args]
+
+    def value(flag, default):
+        """The value given after a flag, removing both from args"""
+        if flag not in args:
+            return default
+        index = args.index(flag)
+        given = args[index + 1]
+        del args[index:index + 2]
+        return given
+
+    if "--help" in args:
+        print(__doc__)
+        sys.exit()
+    output_folder = value("--output", "output")
+    worker_counts = [int(count) for count in value("--workers", str(os.cpu_count() or 1)).split(",")]
+    chunk_size = int(value("--chunk", 32))
+    marker_scale = float(value("--scale", 1.0))
+    paths = [arg for arg in args if not arg.startswith("-")]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+
+    # With several worker counts, each draws the whole board again, so the outputs are from the last
+    # Every count should draw exactly the same board as the first
+    first_board = None
+    for worker_count in worker_counts:
+        frames, seconds, video_fps = process(paths[0], output_folder, worker_count, chunk_size, marker_scale)
+        board = cv2.imread(os.path.join(output_folder, "board.png"))
+        if first_board is None:
+            first_board = board
+        matches = "" if np.array_equal(board, first_board) else f", a different board to {worker_counts[0]} workers"
+        print(
+            f"{worker_count} workers: {frames} frames in {seconds:.2f}s ({frames / seconds:.1f} fps, "
+            f"{frames / video_fps / seconds:.1f}x real time{matches})"
+        )
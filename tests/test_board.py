@@ -0,0 +1,149 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from modules.board import Board  # noqa: E402
+from modules.canvasfile import CanvasFile  # noqa: E402
+from modules.colours import Colours  # noqa: E402
+from modules.eventlog import BoardTimeline, EventLog  # noqa: E402
+
+
+def erase(board, points, let_go=True):
+    """Erases along points with the first hand, then lets go"""
+    actions = ["erase"] + [None] * (board.max_hands - 1)
+    for point in points:
+        board.update(actions, {0: np.tile(np.array(point, np.float64), (21, 1))}, None, False, Colours.red, 3)
+    if let_go:
+        board.update([None] * board.max_hands, {}, None, False, Colours.red, 3)
+
+
+def stroke(board, points, colour=Colours.red):
+    """Draws a stroke with the stylus, then lifts it"""
+    for point in points:
+        board.update([None] * board.max_hands, {}, point, True, colour, 3)
+    board.update([None] * board.max_hands, {}, points[-1], False, colour, 3)
+
+
+@pytest.fixture
+def board(tmp_path):
+    canvas_file = CanvasFile(str(tmp_path / "board.canvas"), (1000, 2000, 3), flush_interval=60)
+    board = Board((200, 100), (2000, 1000), canvas_file=canvas_file)
+    board.start()
+    yield board
+    board.close()
+
+
+def test_undo_keeps_only_the_area_changed(board):
+    blank = np.array(board.current_drawing)
+    stroke(board, [(20, 20), (40, 30), (60, 20)])
+    drawn = np.array(board.current_drawing)
+    assert not np.array_equal(drawn, blank)
+    stroke(board, [(100, 60), (120, 70)], Colours.blue)
+    # Each change is a small patch, not a copy of the 2000x1000 canvas
+    assert len(board.undo_stack) == 2
+    assert all(before.nbytes < 20000 and after.nbytes < 20000 for _, before, after in board.undo_stack)
+
+    board.undo()
+    assert np.array_equal(board.current_drawing, drawn)
+    board.undo()
+    assert np.array_equal(board.current_drawing, blank)
+    board.undo()
+    assert np.array_equal(board.current_drawing, blank)
+    board.redo()
+    assert np.array_equal(board.current_drawing, drawn)
+
+
+def test_drawing_clears_the_redo_stack(board):
+    stroke(board, [(20, 20), (40, 30)])
+    board.undo()
+    stroke(board, [(100, 60), (120, 70)])
+    assert board.redo_stack == []
+    board.redo()
+    assert len(board.undo_stack) == 1
+
+
+def test_motion_is_cleared_where_it_was_drawn(board):
+    board.viewport.zoom(2)
+    board.update([None] * board.max_hands, {}, (100, 50), False, Colours.red, 3)
+    assert board.current_motion_bounds is not None
+    frame = np.full((100, 200, 3), 255, np.uint8)
+    board.compose(frame)
+    # The stylus is shown in the middle of the view, then the motion layer is empty again
+    assert (frame[50, 100] != 255).any()
+    assert board.current_motion_bounds is None
+    assert not board.current_motion.any()
+
+
+def test_layers_are_only_made_once_drawn_on(board):
+    assert board._current_path is None and board._current_motion is None
+    # Pointing the stylus without drawing only shows it on the motion layer
+    board.update([None] * board.max_hands, {}, (20, 20), False, Colours.red, 3)
+    assert board._current_path is None and board._current_motion is not None
+
+
+def test_eraser_only_changes_the_area_it_covers(board):
+    stroke(board, [(x, 20) for x in range(20, 101, 2)])
+    drawn = np.array(board.current_drawing)
+    erase(board, [(30, 20), (50, 20)], let_go=False)
+    # The eraser is 4 times the pen size, and paints over the stroke only where it went
+    painted = np.argwhere(board.current_path.any(axis=2))
+    assert painted.min(axis=0).tolist() >= [8, 18] and painted.max(axis=0).tolist() < [33, 63]
+    erase(board, [])
+    bounds, before, after = board.undo_stack[-1]
+    assert bounds == (18, 8, 63, 33)
+    assert (board.current_drawing[20, 25:55] == 255).all()
+    assert (board.current_drawing[20, 70:100] == Colours.red).all()
+    changed = np.argwhere((board.current_drawing != drawn).any(axis=2))
+    assert changed.min(axis=0).tolist() >= [8, 18] and changed.max(axis=0).tolist() < [33, 63]
+    assert not board.current_path.any()
+    board.undo()
+    assert np.array_equal(board.current_drawing, drawn)
+
+
+def test_canvas_of_another_size_is_not_replaced(board, tmp_path):
+    path = str(tmp_path / "board.canvas")
+    with open(path, "rb") as file:
+        saved = file.read()
+    with pytest.raises(ValueError):
+        CanvasFile(path, (500, 1000, 3))
+    with open(path, "rb") as file:
+        assert file.read() == saved
+
+
+def test_stylus_ends_a_hand_stroke(board):
+    actions = ["draw"] + [None] * (board.max_hands - 1)
+    for x in range(20, 61, 4):
+        fingers = np.tile(np.array((x, 20), np.float64), (21, 1))
+        board.update(actions, {0: fingers}, None, False, Colours.red, 3)
+    # The stylus comes into view while the hand is still drawing
+    stroke(board, [(x, 80) for x in range(100, 141, 4)], Colours.blue)
+    assert len(board.undo_stack) == 2
+    assert all(path["path"] == [] and path["stroke"] is None for path in board.current_paths)
+    # The hand starts a new stroke, rather than carrying on from where it was
+    fingers = np.tile(np.array((180, 60), np.float64), (21, 1))
+    board.update(actions, {0: fingers}, None, False, Colours.red, 3)
+    board.update([None] * board.max_hands, {}, None, False, Colours.red, 3)
+    assert (board.current_drawing[40, 120] == 255).all()
+    assert board.undo_stack[-1][0] == (177, 57, 184, 64)
+
+
+def test_undo_is_logged_as_the_area_put_back(tmp_path):
+    path = str(tmp_path / "board.wbl")
+    board = Board((200, 100), (2000, 1000), event_log=EventLog(path, batch_interval=0))
+    board.start()
+    stroke(board, [(20, 20), (40, 30)])
+    stroke(board, [(100, 60), (120, 70)], Colours.blue)
+    board.undo()
+    board.undo()
+    board.redo()
+    drawn = np.array(board.current_drawing)
+    board.close()
+    timeline = BoardTimeline(path)
+    # Only the first keyframe, made when the log was started
+    assert len(timeline.keyframe_offsets) == 1
+    sizes = [len(payload) for name, _, payload in timeline.events() if name in ("undo", "redo")]
+    assert len(sizes) == 3 and max(sizes) < 2000
+    drawing, layer = timeline.state_at()
+    timeline.close()
+    assert np.array_equal(drawing, drawn) and layer is None
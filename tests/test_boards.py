@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from modules import screenspace  # noqa: E402
+from modules.driver import Driver  # noqa: E402
+from modules.sinks import NullSink  # noqa: E402
+from modules.sources import ImageSource  # noqa: E402
+
+width, height = 1000, 500
+marker_size = 80
+
+
+def place_marker(frame, marker_id, x, y):
+    marker = cv2.aruco.generateImageMarker(screenspace.aruco_dict, marker_id, marker_size)
+    frame[y:y + marker_size, x:x + marker_size] = marker[:, :, None]
+
+
+def scene(stylus_x):
+    """A camera frame with two boards side by side (markers 0-3 and 6-9) and the stylus drawing at stylus_x"""
+    frame = np.full((720, 1280, 3), 255, np.uint8)
+    for ids, left, right in (((0, 1, 2, 3), 40, 540), ((6, 7, 8, 9), 680, 1160)):
+        for marker_id, (x, y) in zip(ids, ((left, 40), (right, 40), (right, 600), (left, 600))):
+            place_marker(frame, marker_id, x, y)
+    place_marker(frame, 5, stylus_x, 320)
+    return frame
+
+
+def run(stylus_x, frames=12):
+    driver = Driver(modules=[], width=width, height=height, source=ImageSource([scene(stylus_x)]),
+                    sinks=[NullSink()], boards=2)
+    background = np.full((height, width, 3), 255, np.uint8)
+    for _ in range(frames):
+        driver.calculate(width, height)
+        driver.render(background.copy(), None, [background.copy()])
+    driver.kill()
+    return driver
+
+
+@pytest.mark.parametrize("stylus_x, board", [(280, 0), (900, 1)])
+def test_stylus_draws_on_the_board_it_is_on(stylus_x, board):
+    driver = run(stylus_x)
+    assert [markers.visibility for markers in driver.boards] == ["Accurate", "Accurate"]
+    assert driver.stylus_board == board
+    # Undo, redo and zooming follow the stylus
+    assert driver.active_board == board
+    assert driver.stylus_draw
+    x, y = driver.stylus_coords
+    assert 0 <= x < width and 0 <= y < height
+
+
+def test_every_board_is_kept_up_to_date_between_detections():
+    # While the stylus is tracked, the boards are only searched for every few frames
+    driver = run(900, frames=13)
+    first, second = driver.boards
+    assert first.visibility_time == second.visibility_time > 0
+    assert first.warp_matrix is not None and second.warp_matrix is not None
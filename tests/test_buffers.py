@@ -0,0 +1,89 @@
+import os
+import tracemalloc
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from modules.buffers import FramePool, pool  # noqa: E402
+
+
+def test_get_reuses_released_buffers():
+    frames = FramePool()
+    first = frames.get((10, 20, 3))
+    frames.release()
+    assert frames.get((10, 20, 3)) is first
+    assert frames.allocations == 1
+
+
+def test_buffers_in_use_are_not_handed_out_twice():
+    frames = FramePool()
+    first = frames.get((10, 20, 3))
+    second = frames.get((10, 20, 3))
+    assert first is not second
+    # A different shape or dtype is a different buffer
+    assert frames.get((10, 20)) is not first
+    assert frames.get((10, 20, 3), np.float32).dtype == np.float32
+    assert frames.allocations == 4
+
+
+def test_kept_buffers_survive_release_until_given_back():
+    frames = FramePool()
+    kept = frames.get((4, 4))
+    assert frames.keep(kept)
+    frames.release()
+    other = frames.get((4, 4))
+    assert other is not kept
+    frames.release()
+    frames.give_back(kept)
+    assert {id(frames.get((4, 4))), id(frames.get((4, 4)))} == {id(kept), id(other)}
+    assert frames.allocations == 2
+
+
+def test_keep_ignores_buffers_from_elsewhere():
+    frames = FramePool()
+    assert not frames.keep(np.zeros((4, 4), np.uint8))
+
+
+def test_copy_copies_into_a_pooled_buffer():
+    frames = FramePool()
+    source = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    copy = frames.copy(source)
+    assert copy is not source
+    assert np.array_equal(copy, source)
+
+
+def test_pipeline_stops_allocating_after_warm_up():
+    from modules.driver import Driver
+    from modules.sinks import NullSink
+    from modules.sources import ImageSource
+
+    width, height = 1000, 500
+    image = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "TestImage.png")
+    source = ImageSource([image])
+    driver = Driver(modules=[], width=width, height=height, source=source, sinks=[NullSink()])
+    background = np.full((height, width, 3), 255, np.uint8)
+
+    def run(frames):
+        for _ in range(frames):
+            driver.calculate(width, height)
+            driver.render(pool.copy(background))
+
+    run(10)
+    warmed_up = pool.allocations
+    # NumPy and OpenCV report every array they make to tracemalloc, so this also sees any made outside the pool
+    tracemalloc.start()
+    try:
+        run(5)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(50)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    driver.kill()
+    assert pool.allocations == warmed_up
+    # Any image passed between stages is bigger than this, so not one was made during those frames
+    assert peak - before < 64 * 1024
+    assert after - before < 64 * 1024
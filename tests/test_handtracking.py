@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules.handtracking import HandTracker  # noqa: E402
+
+
+def hand(x, y):
+    """The landmarks of a hand, as a small cluster of points around (x, y)"""
+    offsets = np.linspace(-0.02, 0.02, 21)
+    return np.stack([x + offsets, y + offsets[::-1], np.zeros(21)], axis=1).astype(np.float32)
+
+
+def hands(*centres):
+    return np.stack([hand(x, y) for x, y in centres])
+
+
+def test_ids_follow_hands_when_they_swap_order():
+    tracker = HandTracker()
+    left, right = tracker.update(hands((0.3, 0.5), (0.7, 0.5)), np.array([0, 1], np.int8))
+    assert left != right
+    # MediaPipe returns the same two hands, slightly moved, in the other order
+    ids = tracker.update(hands((0.71, 0.49), (0.31, 0.51)), np.array([1, 0], np.int8))
+    assert ids.tolist() == [right, left]
+    ids = tracker.update(hands((0.32, 0.52), (0.72, 0.48)))
+    assert ids.tolist() == [left, right]
+
+
+def test_handedness_separates_hands_close_together():
+    tracker = HandTracker()
+    first, second = tracker.update(hands((0.48, 0.5), (0.52, 0.5)), np.array([0, 1], np.int8))
+    # Swapped in order and crossing over slightly, but still reported with the same handedness
+    ids = tracker.update(hands((0.49, 0.5), (0.51, 0.5)), np.array([1, 0], np.int8))
+    assert ids.tolist() == [second, first]
+
+
+def test_hand_keeps_its_id_through_a_short_gap():
+    tracker = HandTracker(grace_frames=3)
+    first, second = tracker.update(hands((0.3, 0.5), (0.7, 0.5)))
+    for _ in range(3):
+        assert tracker.update(hands((0.7, 0.5))).tolist() == [second]
+    # The first hand comes back within its grace period, after a new hand has arrived
+    assert tracker.update(hands((0.5, 0.2), (0.7, 0.5), (0.3, 0.5))).tolist()[1:] == [second, first]
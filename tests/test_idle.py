@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from modules.idle import IdleGovernor  # noqa: E402
+
+
+def scene(patch_x, seed):
+    """A grey 720p frame with a little sensor noise and a small dark patch (like a pen tip) at patch_x"""
+    noise = np.random.default_rng(seed).integers(-4, 5, (720, 1280, 3))
+    frame = (160 + noise).astype(np.uint8)
+    frame[400:416, patch_x:patch_x + 16] = 20
+    return frame
+
+
+def test_small_moving_patch_is_motion():
+    governor = IdleGovernor(idle_after=0)
+    governor.update(scene(600, 0))
+    # Moving a 16 pixel patch changes the whole frame's mean brightness by well under 1
+    for step in range(1, 5):
+        assert not governor.update(scene(600 + 20 * step, step))
+
+
+def test_noise_alone_is_idle():
+    governor = IdleGovernor(idle_after=0)
+    governor.update(scene(600, 0))
+    for step in range(1, 5):
+        assert governor.update(scene(600, step))
+
+
+def test_activity_keeps_it_awake():
+    governor = IdleGovernor(idle_after=0)
+    governor.update(scene(600, 0))
+    assert not governor.update(scene(600, 1), active=True)
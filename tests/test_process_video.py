@@ -0,0 +1,103 @@
+import multiprocessing
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+import process_video  # noqa: E402
+from modules import hands  # noqa: E402
+from modules.sources import VideoFileSource  # noqa: E402
+
+bits = 8
+frame_count = 150
+
+
+def numbered_frame(number):
+    """A frame showing its number in binary, as a row of black and white bars which survive compression"""
+    frame = np.zeros((64, bits * 16, 3), np.uint8)
+    for bit in range(bits):
+        if number >> bit & 1:
+            frame[:, bit * 16:(bit + 1) * 16] = 255
+    return frame
+
+
+def frame_number(frame):
+    return sum(1 << bit for bit in range(bits) if frame[:, bit * 16 + 4:bit * 16 + 12].mean() > 127)
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "numbered.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (bits * 16, 64))
+    if not writer.isOpened():
+        pytest.skip("No mp4 encoder")
+    for number in range(frame_count):
+        writer.write(numbered_frame(number))
+    writer.release()
+    return path
+
+
+def read_numbers(path, start, count, scale=1.0):
+    """Reads a chunk the same way as process_video.analyse_chunk, returning the number shown on each frame"""
+    source = VideoFileSource(path)
+    numbers = []
+    if source.seek(start):
+        for _ in range(count):
+            frame = source.read()
+            if frame is None:
+                break
+            numbers.append(frame_number(frame))
+    source.stop()
+    return numbers
+
+
+def test_frames_are_numbered(video):
+    assert read_numbers(video, 0, frame_count + 10) == list(range(frame_count))
+
+
+@pytest.mark.parametrize("start", [1, 13, 29, 64, 100, 149])
+def test_seek_lands_on_the_frame(video, start):
+    assert read_numbers(video, start, 5) == list(range(start, min(start + 5, frame_count)))
+
+
+def test_seek_past_the_end(video):
+    assert read_numbers(video, frame_count + 20, 5) == []
+
+
+@pytest.mark.parametrize("workers, chunk", [(2, 7), (4, 16)])
+def test_workers_match_a_single_worker(video, workers, chunk):
+    single = list(process_video.analyse(video, 1, frame_count, task=read_numbers))
+    assert single == list(range(frame_count))
+    assert list(process_video.analyse(video, workers, chunk, task=read_numbers)) == single
+
+
+class TrackingModel:
+    """
+    Stands in for MediaPipe's hands model, which follows hands on from the frame before. The hand it finds is as far
+    across as the frame before was bright, so any frame followed on from another chunk gives a different result
+    """
+    def __init__(self):
+        self.last = None
+
+    def process(self, image):
+        number = frame_number(image)
+        x = (number if self.last is None else self.last) / 256
+        self.last = number
+        point = types.SimpleNamespace(x=x, y=0.5, z=0.0)
+        return types.SimpleNamespace(
+            multi_hand_landmarks=[types.SimpleNamespace(landmark=[point] * 21)],
+            multi_handedness=[types.SimpleNamespace(classification=[types.SimpleNamespace(label="Right")])]
+        )
+
+    def reset(self):
+        self.last = None
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="The model is passed on by forking")
+def test_hands_are_the_same_with_any_number_of_workers(video, monkeypatch):
+    monkeypatch.setattr(hands, "hands", TrackingModel())
+    single = np.stack([result[3] for result in process_video.analyse(video, 1, 16)])
+    assert len(single) == frame_count
+    assert np.array_equal(np.stack([result[3] for result in process_video.analyse(video, 4, 16)]), single)
@@ -0,0 +1,73 @@
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from modules.stream import LiveStream  # noqa: E402
+
+
+@pytest.fixture
+def stream():
+    stream = LiveStream(host="127.0.0.1", port=0)
+    stream.open(None)
+    yield stream
+    stream.close()
+
+
+def solid(value):
+    return np.full((48, 64, 3), value, np.uint8)
+
+
+def fetch_frame(stream):
+    with urllib.request.urlopen(f"http://127.0.0.1:{stream.port}/frame.jpg", timeout=5) as response:
+        return cv2.imdecode(np.frombuffer(response.read(), np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_frame_is_not_stale_without_stream_viewers(stream):
+    stream.write(solid(40))
+    assert abs(fetch_frame(stream).mean() - 40) < 3
+    # Nobody is watching the MJPEG stream, but the newest frame is still the one served
+    stream.write(solid(200))
+    assert abs(fetch_frame(stream).mean() - 200) < 3
+    assert stream.viewers == 0
+
+
+def test_concurrent_frame_requests_get_the_latest_frame(stream):
+    stream.write(solid(120))
+    with ThreadPoolExecutor(8) as executor:
+        frames = list(executor.map(lambda _: fetch_frame(stream), range(16)))
+    assert all(abs(frame.mean() - 120) < 3 for frame in frames)
+    # The requests share encodes rather than each encoding the frame again
+    assert stream.encoded <= 16
+
+
+def read_mjpeg(stream, count, received):
+    with urllib.request.urlopen(f"http://127.0.0.1:{stream.port}/stream.mjpg", timeout=5) as response:
+        while len(received) < count:
+            line = response.readline()
+            if line.lower().startswith(b"content-length:"):
+                response.readline()
+                received.append(response.read(int(line.split(b":")[1])))
+
+
+def test_stream_and_frame_viewers_together(stream):
+    received = [[], []]
+    readers = [threading.Thread(target=read_mjpeg, args=(stream, 3, frames), daemon=True) for frames in received]
+    for reader in readers:
+        reader.start()
+    deadline = time.monotonic() + 5
+    while stream.viewers < len(readers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    value = 0
+    while any(reader.is_alive() for reader in readers) and time.monotonic() < deadline:
+        value = (value + 10) % 250
+        stream.write(solid(value))
+        assert abs(fetch_frame(stream).mean() - value) < 3
+    for reader in readers:
+        reader.join(timeout=1)
+    assert [len(frames) for frames in received] == [3, 3]
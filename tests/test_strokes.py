@@ -0,0 +1,44 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from modules.strokes import Stroke, StrokeBuilder, raster_difference, simplify  # noqa: E402
+
+
+def build(points, size):
+    builder = StrokeBuilder((255, 255, 255), size)
+    for point in points:
+        builder.add(point)
+    return builder.finish()
+
+
+def spiral(count=300):
+    """A wobbly hand drawn spiral, with a little jitter like the points tracked from a camera"""
+    angles = np.linspace(0, 4 * np.pi, count)
+    points = np.stack([500 + 50 * angles * np.cos(angles), 250 + 150 * np.sin(angles)], axis=1)
+    points += np.random.default_rng(0).normal(0, 0.3, points.shape)
+    return [tuple(point) for point in points.tolist()]
+
+
+@pytest.mark.parametrize("size", [2, 4, 8])
+def test_simplified_stroke_draws_the_same(size):
+    raw = spiral()
+    stroke = build(raw, size)
+    assert len(stroke.deltas) + 1 < len(raw) / 2
+    assert raster_difference(raw, stroke, (500, 1000)) < 0.1
+
+
+def test_straight_line_keeps_only_its_ends():
+    raw = [(100 + 3 * i, 200 + i) for i in range(100)]
+    assert simplify(raw, 0.5).tolist() == [[100, 200], [397, 299]]
+    stroke = build(raw, 4)
+    assert raster_difference(raw, stroke, (500, 1000)) < 0.02
+
+
+def test_bytes_round_trip():
+    stroke = build(spiral(), 4)
+    copy, offset = Stroke.from_bytes(stroke.to_bytes())
+    assert offset == len(stroke.to_bytes())
+    assert np.array_equal(copy.points(), stroke.points())
+    assert (copy.colour, copy.size, copy.kind) == (stroke.colour, stroke.size, stroke.kind)
@@ -0,0 +1,64 @@
+import multiprocessing
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from modules import workers  # noqa: E402
+from modules.driver import Driver  # noqa: E402
+from modules.sinks import NullSink  # noqa: E402
+from modules.sources import ImageSource  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="The model below is only passed on by forking"
+)
+
+
+def detect_array(frame, handedness=False):
+    """Finds one hand in every frame, with its wrist as far across as the frame is bright"""
+    landmarks = np.full((1, 21, 3), 0.5, np.float32)
+    landmarks[0, :, 0] = frame[0, 0, 0] / 255
+    return (landmarks, np.zeros(1, np.int8)) if handedness else landmarks
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    # Stands in for MediaPipe, which the worker process loads by module name
+    monkeypatch.setitem(workers.model_modules, "hands", types.SimpleNamespace(
+        load_model=lambda: None, detect_array=detect_array
+    ))
+    worker = workers.InferenceWorker("hands", timeout=5)
+    yield worker
+    worker.stop()
+
+
+def frames(count):
+    return [np.full((48, 64, 3), 10 * number, np.uint8) for number in range(count)]
+
+
+def test_results_are_for_the_frame_before(worker):
+    found = []
+    for frame in frames(4):
+        worker.submit(frame)
+        result = worker.result()
+        found.append(None if result is None else round(float(result[0][0, 0, 0]) * 255))
+    assert found == [None, 0, 10, 20]
+
+
+@pytest.mark.parametrize("hand_interval", [2, 3])
+def test_hands_are_found_when_only_looked_for_every_few_frames(worker, hand_interval):
+    driver = Driver(modules=["hands"], width=200, height=100, source=ImageSource(frames(12)), sinks=[NullSink()],
+                    use_processes=True, workers={"hands": worker})
+    driver.hand_interval = hand_interval
+    background = np.full((100, 200, 3), 255, np.uint8)
+    found = []
+    for _ in range(12):
+        driver.calculate(200, 100)
+        driver.render(background.copy(), None, [])
+        found.append(len(driver.hand_landmark_array))
+    driver.kill()
+    # Until the first frame sent is back there are no hands, but from then on the hand is found every frame
+    assert found[hand_interval + 1:] == [1] * (11 - hand_interval)
+    assert worker.restarts == 0